@@ -16,14 +16,20 @@ import matplotlib
 matplotlib.use('Agg')
 import matplotlib.pyplot as plt # noqa: E402, F401
 from pandas import read_hdf, DataFrame, HDFStore # noqa: F401, E402
+from .storage import getStorage, Dataset # noqa: E402
 
 __pdoc__ = {}
 __pdoc__['Edit'] = """
     Usage: EditLHA [-h] h5file.h5 [h5file.h5 ...]
 
-    Loads the hdf files and saves them into the variable DATA.
+    Opens the hdf (or parquet, see `ScanLHA.storage`) files as lazy `ScanLHA.storage.Dataset` in the variable DATA,
+    i.e. the data is only read when needed, e.g. `DATA.head()`, `DATA['MASS.values.25'].sample(1000)`, `DATA['file.h5'].load()`
+    or `DATA[['MINPAR.values.1', 'MASS.values.25']].filter([('MASS.values.25', '>', 120)]).load()`.
 
     An IPython session with imported matplotlib.pyplot is started.
+
+    For a single file, its storage backend is available as `store` and the stored config as `conf`
+    (save e.g. with `store.save(df, config=conf)`).
     """
 
 __all__ = ['Edit']
@@ -34,31 +40,27 @@ def Edit():
             help='HDF file(s) to edit.')
     args = parser.parse_args()
 
-    HDFFILES = [ k for f in args.files for k in glob(f) ]
+    # absolute paths since the working directory is changed below
+    HDFFILES = [ path.abspath(k) for f in args.files for k in glob(f) ]
     LHAPATH = getenv('LHAPATH') if getenv('LHAPATH') else 'results'
     store = False
 
-    DATA = {}
-    header = "Your data files are stored in 'DATA'"
-    for f in HDFFILES:
-        print('Reading %s ...' % f)
-        DATA[f] = read_hdf(f)
+    DATA = Dataset(HDFFILES, LHAPATH)
+    header = "Your data files are accessible via the lazy dataset 'DATA', load them with DATA.load()"
 
-    if len(DATA) == 1:
+    if len(HDFFILES) == 1:
         HDFFILE = HDFFILES[0]
-        DATA = DATA[HDFFILE]
-        store = HDFStore(HDFFILE)
-        try:
-            conf = store.get_storer(LHAPATH).attrs.config
-        except:
-            print("no config stored in hdf file")
+        store = getStorage(HDFFILE, LHAPATH)
+        conf = store.attr('config') # noqa: F841
+        if conf is None:
+            print("no config stored in data file")
     else:
-        header += "and accessible via DATA['path/to/filename.h5']"
+        header += " (single files via DATA['path/to/filename.h5'])"
 
-    if len(DATA) == 0:
+    if len(HDFFILES) == 0:
         print('No valid data files specified.\n')
     else:
-        HDFDIR = path.dirname(path.abspath(HDFFILES[0])) + '/'
+        HDFDIR = path.dirname(HDFFILES[0]) + '/'
         print('Changing working directory to {}.\n'.format(HDFDIR))
         chdir(HDFDIR)
 
@@ -67,6 +69,3 @@ def Edit():
     else:
         print(header)
         code.interact(local=locals())
-
-    if store:
-        store.close()
@@ -2,18 +2,33 @@
 """
 Merges multiple HDF files into one file.
 """
-from pandas import HDFStore, DataFrame, concat
+from pandas.util import hash_pandas_object
 from glob import glob
+import os
 import sys
 from os import getenv
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor as Executor
+from .scan import datacolumns
+from .schema import Schema
+from .storage import getStorage
 __pdoc__ = {}
 __pdoc__['Merge'] = """
 Merges multiple HDF files into one file.
 
-Usage: MergeLHA file1.h5 file2.h5 [...] mergedfile.h5
+Usage: MergeLHA [-h] [-p N] [-c N] [-u] file1.h5 file2.h5 [...] mergedfile.h5
 
 File names may be specified using patterns compatible with python.glob (e.g. '*.h5').
 
+Parquet files/datasets (see `ScanLHA.storage`) may be merged/created as well.
+
+The files are read in chunks of about `-c N` rows (default: 10000) by `-p N` parallel processes and the chunks are appended one by one
+to the output file (in HDF table format with the data columns of `ScanLHA.scan.datacolumns`, which are indexed at the end),
+i.e. only a few chunks are kept in memory at once (HDF files in the fixed format are read at once, see `ScanLHA.storage.HDFStorage.chunks`).
+Results with many columns are split over several tables (see `ScanLHA.storage.HDFStorage.layout`).
+Columns which are missing in some of the files are filled with NaN. The output file must not be one of the input files (or contain them).
+With `-u`, duplicate parameter points (identified by a hash over the `input_parameters` or the scanned parameters) are dropped.
+
 Note that it is not possible to merge different `ScanLHA.config.Config` instances i.e. the `Config`
 instance of the first file is used.
 
@@ -22,47 +37,127 @@ The default H5 tree is 'results' (default of `ScanLHA.scan.Scan.save`).
 For changing the path set the environment variable `export LHPATH='/yourpath'`.
 """
 
+def sameconfig(c1, c2):
+    """ Compare two configs (which may contain numpy arrays). """
+    try:
+        return bool(c1 == c2)
+    except ValueError:
+        return repr(c1) == repr(c2)
+
+def read(f, path, start, stop):
+    """ Read the rows `start` to `stop` of the results in file `f` (tree `path`). """
+    store = getStorage(f, path)
+    df = store.load(start=start, stop=stop)
+    seed = store.attr('seed')
+    parallel = store.attr('parallel')
+    if seed is not None and parallel is not None:
+        df['scan_seed'] = seed
+        df['scan_parallel'] = parallel
+    return df
+
+def keycolumns(columns, conf):
+    """ Columns that identify a parameter point: `input_parameters.*` or the LHA fields of the scanned parameters in `conf`. """
+    keys = [ c for c in columns if c.startswith('input_parameters.') ]
+    if keys or not conf:
+        return keys
+    scanned = [ p['lha'] for p in getattr(conf, 'parameters', {}).values() if any(k in p for k in ['scan', 'values', 'random', 'dependent']) ]
+    return [ c for c in scanned if c in columns ]
+
 def Merge():
-    if len(sys.argv) < 3:
+    parser = ArgumentParser(description='Merges multiple HDF files into one file.')
+    parser.add_argument('files', metavar='file.h5', type=str, nargs='+',
+            help='HDF file(s) to merge followed by the output file.')
+    parser.add_argument("-p", "--parallel", metavar='N', type=int, default=None,
+            help="read N chunks in parallel, defaults to os.cpu_count()")
+    parser.add_argument("-c", "--chunksize", metavar='N', type=int, default=10000,
+            help="read the files in chunks of about N rows, defaults to 10000")
+    parser.add_argument("-u", "--unique", action="store_true",
+            help="drop duplicate parameter points")
+    args = parser.parse_args()
+
+    if len(args.files) < 2:
         print('No valid filenames given!')
         print(__pdoc__['Merge'])
         sys.exit(1)
 
-    infiles = [glob(f) for f in sys.argv[1:-1]]
-    outfile = sys.argv[-1]
+    outfile = args.files[-1]
+    infiles = [ k for f in args.files[:-1] for k in glob(f) ]
+    num_workers = args.parallel if args.parallel else os.cpu_count()
+
+    output = os.path.abspath(outfile).rstrip(os.sep)
+    overlap = [ f for f in infiles if os.path.abspath(f) == output or os.path.abspath(f).startswith(output + os.sep) ]
+    if overlap:
+        print('The output file {} must not be one of the input files ({}).'.format(outfile, ', '.join(overlap)))
+        sys.exit(1)
 
     LHAPATH = getenv('LHAPATH') if getenv('LHAPATH') else 'results'
 
+    # the union of all columns, ordered by their first occurrence, and their kind, as well as the configs
+    columns = {}
+    configs = {}
+    for f in infiles:
+        tmp_store = getStorage(f, LHAPATH)
+        for c,dtype in tmp_store.dtypes().items():
+            if columns.get(c, 'object') == 'object':
+                columns[c] = 'float64' if dtype.kind in 'biufc' else 'object'
+        if tmp_store.attr('seed') is not None and tmp_store.attr('parallel') is not None:
+            columns['scan_seed'] = columns['scan_parallel'] = 'float64'
+        configs[f] = tmp_store.attr('config')
+
     print("Will concatenate into {}.".format(outfile))
-    store = HDFStore(outfile)
+    store = getStorage(outfile, LHAPATH)
+    store.remove()
 
-    df = DataFrame()
     store_conf = None
-    for fs in infiles:
-        for f in fs:
-            print('Reading %s ...' % f)
-            tmp_store = HDFStore(f)
-            try:
-                tmp_conf = tmp_store.get_storer(LHAPATH).attrs.config
-                if not store_conf:
-                    store_conf = tmp_conf
-            except AttributeError:
-                print('No config attribute found in {}'.format(f))
-                store_conf = {}
-            if 'scatterplot' in store_conf:
-                tmp_conf['scatterplot'] = store_conf['scatterplot']
-            if store_conf and store_conf != tmp_conf:
-                print('Warning: merge file with different config {}'.format(f))
-            tmp_df = tmp_store['results']
-            try:
-                tmp_df['scan_seed'] = tmp_store.get_storer(LHAPATH).attrs.seed
-                tmp_df['scan_parallel'] = tmp_store.get_storer(LHAPATH).attrs.parallel
-            except AttributeError:
-                pass
-            df = concat([df,tmp_df], ignore_index=True)
-            tmp_store.close()
-
-    store[LHAPATH] = df
-    if store_conf:
-        store.get_storer(LHAPATH).attrs.config = store_conf
+    for f in infiles:
+        tmp_conf = configs[f]
+        if tmp_conf is None:
+            print('No config attribute found in {}'.format(f))
+            store_conf = {}
+        elif not store_conf:
+            store_conf = tmp_conf
+            store.data_columns = datacolumns(store_conf) if 'runner' in store_conf else []
+        if store_conf and 'scatterplot' in store_conf:
+            tmp_conf['scatterplot'] = store_conf['scatterplot']
+        if store_conf and not sameconfig(store_conf, tmp_conf):
+            print('Warning: merge file with different config {}'.format(f))
+
+    chunks = [ (f, start, stop) for f in infiles for start,stop in getStorage(f, LHAPATH).chunks(args.chunksize) ]
+    schema = None
+    seen = set()
+    with Executor(num_workers) as executor:
+        # only keep num_workers chunks in memory at once
+        futures = [ executor.submit(read, f, LHAPATH, start, stop) for f,start,stop in chunks[:num_workers] ]
+        for i,(f,start,stop) in enumerate(chunks):
+            print('Reading %s (rows %d to %d) ...' % (f, start, stop))
+            tmp_df = futures[i].result()
+            futures[i] = None
+            if i + num_workers < len(chunks):
+                g,a,b = chunks[i + num_workers]
+                futures.append(executor.submit(read, g, LHAPATH, a, b))
+
+            keys = keycolumns(tmp_df.columns, store_conf)
+            if schema is None:
+                # fix the dtypes: numbers as float (NaN for missing columns), strings as strings
+                # the first file decides about (legacy) object columns with numbers and 'NaN' strings
+                schema = Schema()
+                schema.update(tmp_df)
+                schema.columns = { c : 'float64' if schema.columns.get(c, k) != 'object' else k for c,k in columns.items() }
+            tmp_df = schema.conform(tmp_df, update=False)
+
+            if args.unique:
+                if not keys:
+                    print('Warning: no input parameters found to identify duplicates in {}'.format(f))
+                else:
+                    hashes = hash_pandas_object(tmp_df[keys], index=False)
+                    duplicates = hashes.duplicated() | hashes.isin(seen)
+                    if duplicates.any():
+                        print('Dropping {} duplicate points.'.format(duplicates.sum()))
+                    seen.update(hashes[~duplicates])
+                    tmp_df = tmp_df[~duplicates.values]
+
+            if store_conf:
+                store.append(tmp_df, config=store_conf)
+            else:
+                store.append(tmp_df)
     store.close()
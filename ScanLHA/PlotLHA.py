@@ -2,33 +2,49 @@
 """
 Plot ScanLHA scan results.
 """
-from pandas import HDFStore
+import ast
+import hashlib
 import logging
+import multiprocessing
 import os
 import sys
+from copy import deepcopy
+from glob import glob
+from time import time_ns
 from .config import Config
 from math import * # noqa: E403 F401 F403
 from collections import ChainMap
 from argparse import ArgumentParser
-from numpy import nan, linspace  # noqa: F401
-import matplotlib
-from matplotlib.colors import LogNorm, Normalize
-from matplotlib.colorbar import ColorbarBase
 import importlib
-matplotlib.use('Agg')
-# matplotlib.use('ps')
-import matplotlib.pyplot as plt # noqa: E402
-from IPython import embed # noqa: F402, E402
 
-plt.rc('text', usetex=True)
-plt.rc('text.latex', preamble = r'\usepackage{amsmath,nicefrac,units}') #,lmodern}')
+def setup():
+    """
+    Imports numpy, pandas, matplotlib and the storage backends into the module namespace and sets the default matplotlib rcParams.
+
+    The imports are deferred until the command line arguments are parsed such that e.g. `PlotLHA --help` starts fast.
+    """
+    global np, nan, linspace, concat, DataFrame, HDFStore, getStorage, HDFStorage, evaluate, matplotlib, LogNorm, Normalize, LinearSegmentedColormap, to_rgba, ColorbarBase, plt
+    import numpy as np
+    from numpy import nan, linspace
+    from pandas import concat, DataFrame, HDFStore
+    from .storage import getStorage, HDFStorage
+    from .expressions import evaluate
+    import matplotlib
+    matplotlib.use('Agg')
+    # matplotlib.use('ps')
+    import matplotlib.pyplot as plt
+    from matplotlib.colors import LogNorm, Normalize, LinearSegmentedColormap, to_rgba
+    from matplotlib.colorbar import ColorbarBase
+
+    plt.rc('text', usetex=True)
+    plt.rc('text.latex', preamble = r'\usepackage{amsmath,nicefrac,units}') #,lmodern}')
 
 
 if os.path.isfile('functions.py'):
     sys.path.append(os.getcwd())
     f = importlib.import_module('functions')
 
-__all__ = ['Plot', 'PlotConf', 'axisdefault']
+__all__ = ['Plot', 'PlotConf', 'axisdefault', 'requiredfields', 'density']
 
 def arg(re,im):
     """argument of complex number with real part re and imaginary part im """
@@ -47,6 +63,58 @@ def arg(re,im):
         arg = 0
     return arg
 
+def density(x, y, z=None, bins=200, reduce='count', xscale='linear', yscale='linear'):
+    """
+    Bins the points (`x`, `y`) into a 2D grid of `bins` (int or [nx, ny]) pixels.
+
+    Each pixel holds the number of points (`reduce='count'`) or the `'min'`, `'max'` or `'mean'` of the `z` values of its points.
+    For logarithmic axes (`xscale`/`yscale` other than `'linear'`) the bins are equidistant on the log scale.
+
+    Returns the masked array of pixel values with shape (nx, ny) (empty pixels are masked) and the bin edges in x and y.
+    """
+    import numpy as np
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    z = None if z is None else np.asarray(z, dtype=float)
+    valid = np.isfinite(x) & np.isfinite(y)
+    if z is not None:
+        valid &= np.isfinite(z)
+        z = z[valid]
+    x, y = x[valid], y[valid]
+    nx, ny = (bins, bins) if np.isscalar(bins) else bins
+
+    def edges(values, n, scale):
+        if scale != 'linear':
+            values = values[values > 0]
+            return np.geomspace(values.min(), values.max(), n + 1) if len(values) else np.geomspace(1, 10, n + 1)
+        return np.linspace(values.min(), values.max(), n + 1) if len(values) else np.linspace(0, 1, n + 1)
+
+    xedges = edges(x, nx, xscale)
+    yedges = edges(y, ny, yscale)
+    inside = (x >= xedges[0]) & (x <= xedges[-1]) & (y >= yedges[0]) & (y <= yedges[-1])
+    x, y = x[inside], y[inside]
+    ix = np.clip(np.searchsorted(xedges, x, side='right') - 1, 0, nx - 1)
+    iy = np.clip(np.searchsorted(yedges, y, side='right') - 1, 0, ny - 1)
+    pixel = ix * ny + iy
+
+    count = np.bincount(pixel, minlength=nx*ny)
+    if reduce == 'count' or z is None:
+        image = count.astype(float)
+    else:
+        z = z[inside]
+        if reduce == 'mean':
+            image = np.bincount(pixel, weights=z, minlength=nx*ny) / np.maximum(count, 1)
+        elif reduce == 'min':
+            image = np.full(nx*ny, np.inf)
+            np.minimum.at(image, pixel, z)
+        elif reduce == 'max':
+            image = np.full(nx*ny, -np.inf)
+            np.maximum.at(image, pixel, z)
+        else:
+            raise ValueError("Unknown reduction '{}', use one of count, min, max, mean.".format(reduce))
+    image = np.ma.masked_where(count == 0, image).reshape(nx, ny)
+    return image, xedges, yedges
+
 axisdefault = {
         'boundaries' : [],
         'lognorm' : False,
@@ -75,6 +143,9 @@ class PlotConf(ChainMap):
             'colorbar_only': False,
             'constraints': [],
             'type': 'scatter',
+            'bins': 200,
+            'reduce': None,
+            'density_threshold': 1000000,
             'legend': {
 #                'loc' : 'right',
 #                'bbox_to_anchor' : [1.5, 0.5]
@@ -83,6 +154,7 @@ class PlotConf(ChainMap):
             'hline': False,
             'vline': False,
             'exec': False,
+            'cache': True,
             'lw': 1.0,
             's': None,
             'title': False,
@@ -112,8 +184,280 @@ class PlotConf(ChainMap):
         return self.__class__(child, *self.maps)
 
 
+def subscripts(expr):
+    """
+    Returns the set of fields `key` accessed as `DATA['key']` or `PDATA['key']` in the python code `expr`.
+
+    Returns None if `DATA` or `PDATA` is used in any other way (e.g. `DATA.query(...)`), i.e. if the fields can't be determined.
+    """
+    try:
+        tree = ast.parse(str(expr))
+    except SyntaxError:
+        return None
+    parents = { child : node for node in ast.walk(tree) for child in ast.iter_child_nodes(node) }
+    keys = set()
+    for node in ast.walk(tree):
+        if not isinstance(node, ast.Name) or node.id not in ['DATA', 'PDATA']:
+            continue
+        parent = parents.get(node)
+        if isinstance(parent, ast.Subscript) and isinstance(parent.slice, ast.Constant) and isinstance(parent.slice.value, str):
+            keys.add(parent.slice.value)
+        else:
+            return None
+    return keys
+
+def requiredfields(c):
+    """
+    Returns the set of data fields needed to render all plots of the `ScanLHA.config.Config` `c`.
+
+    These are the x/y/z fields of all plots as well as the fields used in `newfields` and `constraints`,
+    where `parameter`s are translated into their LHA fields.
+    Returns None if all fields are needed (e.g. because of `exec` or a non-trivial use of `DATA`).
+    """
+    scatterplot = deepcopy(c['scatterplot'])
+    conf = PlotConf()
+    conf = conf.new_child(scatterplot.get('conf',{}))
+    fields = set()
+    exprs = list(conf.get('newfields', {}).values())
+    for p in scatterplot['plots']:
+        pconf = conf.new_child(p)
+        for l in p.get('plots', [p]): # noqa: E741
+            lconf = pconf.new_child(l)
+            if lconf['exec']:
+                return None
+            exprs += lconf['constraints']
+            if lconf['hline'] or lconf['vline']:
+                continue
+            for ax in ['x', 'y', 'z']:
+                fields.add(lconf.get(ax + '-field', lconf[ax + '-axis'].get('field', None)))
+    for expr in exprs:
+        keys = subscripts(expr)
+        if keys is None:
+            return None
+        fields.update(keys)
+    fields.discard(None)
+    parameters = getattr(c, 'parameters', {})
+    return fields | { parameters[f]['lha'] for f in fields if f in parameters }
+
+COMPARISONS = { ast.Lt: '<', ast.LtE: '<=', ast.Gt: '>', ast.GtE: '>=', ast.Eq: '==', ast.NotEq: '!=' }
+MIRRORED = { '<': '>', '<=': '>=', '>': '<', '>=': '<=', '==': '==', '!=': '!=' }
+
+def tofilter(expr):
+    """
+    Translates the constraint `expr` of the form `PDATA['field'] < value` (or `value < PDATA['field']`, `DATA`, any comparison)
+    into the filter `('field', '<', value)` of `ScanLHA.storage`. Returns None for all other constraints.
+    """
+    try:
+        tree = ast.parse(str(expr).strip(), mode='eval').body
+    except SyntaxError:
+        return None
+    if not isinstance(tree, ast.Compare) or len(tree.ops) != 1 or type(tree.ops[0]) not in COMPARISONS:
+        return None
+
+    def field(node):
+        if isinstance(node, ast.Subscript) and isinstance(node.value, ast.Name) and node.value.id in ['DATA', 'PDATA'] \
+                and isinstance(node.slice, ast.Constant) and isinstance(node.slice.value, str):
+            return node.slice.value
+
+    def number(node):
+        try:
+            value = ast.literal_eval(node)
+        except ValueError:
+            return None
+        return value if isinstance(value, (int, float)) and not isinstance(value, bool) else None
+
+    op = COMPARISONS[type(tree.ops[0])]
+    left, right = tree.left, tree.comparators[0]
+    if field(left) and number(right) is not None:
+        return (field(left), op, number(right))
+    if field(right) and number(left) is not None:
+        return (field(right), MIRRORED[op], number(left))
+
+def pushdown(c):
+    """
+    Returns the list of filters (see `ScanLHA.PlotLHA.tofilter`) for the constraints which apply to all plots
+    of the `ScanLHA.config.Config` `c`. These are applied while loading the data.
+    """
+    scatterplot = deepcopy(c['scatterplot'])
+    conf = PlotConf()
+    conf = conf.new_child(scatterplot.get('conf',{}))
+    common = None
+    for p in scatterplot['plots']:
+        pconf = conf.new_child(p)
+        for l in p.get('plots', [p]): # noqa: E741
+            lconf = pconf.new_child(l)
+            if lconf['hline'] or lconf['vline'] or lconf['colorbar_only']:
+                continue
+            filters = { tofilter(constr) for constr in lconf['constraints'] }
+            common = filters if common is None else common & filters
+    newfields = conf.get('newfields', {})
+    return sorted(f for f in (common or []) if f is not None and f[0] not in newfields)
+
+def loadfields(store, fields=None, loaded=[], filters=None):
+    """
+    Load the `fields` (all if None) from the storage backend `store` which are stored and not contained in `loaded`.
+
+    Only rows which fulfill the `filters` on numerical columns (see `ScanLHA.PlotLHA.pushdown`) are loaded.
+    For data columns of HDF tables (and Parquet files) only the matching rows are read.
+    """
+    dtypes = store.dtypes()
+    filters = [ f for f in (filters or []) if f[0] in dtypes and dtypes[f[0]].kind in 'biufc' ]
+    columns = [ col for col in dtypes if (fields is None or col in fields) and col not in loaded ]
+    if fields is None and not len(loaded):
+        data = store.load(filters=filters)
+    elif not columns:
+        return DataFrame()
+    else:
+        logger.debug("loading fields {}".format(', '.join(columns)))
+        data = store.load(columns=columns, filters=filters)
+    # legacy files store missing numbers as 'NaN' strings
+    strings = data.select_dtypes('object').columns
+    if len(strings):
+        data[strings] = data[strings].replace('NaN', nan)
+    return data
+
+MASKS = {}
+"""
+Boolean masks of constraints and boundaries for the rows of `DATA`, see `ScanLHA.PlotLHA.mask`.
+"""
+FIELDS = {}
+"""
+The `newfields` computed in `DATA`: maps each field onto its expression and a version which is increased on every recomputation.
+"""
+RENDERED = {}
+"""
+Maps the files of the rendered plots onto the `ScanLHA.PlotLHA.fingerprint` of their config.
+"""
+FILTERS = []
+"""
+The filters (see `ScanLHA.PlotLHA.pushdown`) applied while loading `DATA`.
+"""
+
+def dependencies(text):
+    """ Returns the `newfields` (together with their expression and version) mentioned in `text`. """
+    return tuple((f, FIELDS[f]) for f in sorted(FIELDS) if f in text)
+
+def fingerprint(p, pcount, c, conf):
+    """
+    Hash of the effective config of the plot `p` (see `ScanLHA.PlotLHA.render`) and of the data it depends on
+    (data file and versions of the used `newfields`).
+    """
+    # changes of newfields are tracked by their versions
+    defaults = { k : v for k,v in conf.maps[0].items() if k != 'newfields' }
+    text = repr((p, pcount, defaults, getattr(c, 'parameters', {}), store.filename))
+    return hashlib.sha1((text + repr(dependencies(text))).encode()).hexdigest()
+
+def sidecar(filename):
+    """ Returns the name of the HDF file next to the data file `filename` which caches the computed `newfields`. """
+    return filename.rstrip(os.sep) + '.newfields.h5'
+
+def identity(filename):
+    """ Identity of the data file (or dataset directory) `filename`: path, size and modification time of its file(s). """
+    files = sorted(glob(os.path.join(filename, '*'))) if os.path.isdir(filename) else [filename]
+    return [ (os.path.abspath(f), os.stat(f).st_size, os.stat(f).st_mtime_ns) for f in files ]
+
+def prunesidecar(filename, ident, current={}):
+    """
+    Removes the entries of the `ScanLHA.PlotLHA.sidecar` file `filename` which belong to another `ident`ity of the data file
+    or which are superseded by the `current` entry (dict of field names and keys) or a later entry of the same field.
+
+    Since HDF files do not shrink when nodes are removed, the remaining entries are copied into a new file.
+    """
+    if not os.path.isfile(filename):
+        return
+    entries = []
+    with HDFStore(filename, 'r') as sidecarstore:
+        for key in sidecarstore.keys():
+            attrs = sidecarstore.get_storer(key).attrs
+            entries.append((key, getattr(attrs, 'identity', None), getattr(attrs, 'field', None), getattr(attrs, 'time', 0)))
+    latest = {}
+    for key,entry,field,time in sorted(entries, key=lambda e: e[3]):
+        if entry == ident and field is not None and current.get(field, key) == key:
+            latest[field] = key
+    keep = list(latest.values())
+    if len(keep) == len(entries):
+        return
+    logger.debug('removing {} outdated fields from {}'.format(len(entries) - len(keep), filename))
+    if os.path.isfile(filename + '.tmp'):
+        os.remove(filename + '.tmp')
+    for key in keep:
+        cached = HDFStorage(filename, key)
+        HDFStorage(filename + '.tmp', key).save(cached.load(), **{ a : cached.attr(a) for a in ['identity', 'expr', 'field', 'time'] })
+    if keep:
+        os.replace(filename + '.tmp', filename)
+    else:
+        os.remove(filename)
+
+def computefields(newfields, force=False, cache=True):
+    """
+    Computes the `newfields` (dict of field names and expressions) in `DATA`.
+
+    Unless `force` is set, only fields with a changed expression (or depending on such) are recomputed.
+    If `cache` is set, computed fields are stored in the `ScanLHA.PlotLHA.sidecar` file of the data file and reused
+    as long as the expression (and the expressions of the used newfields) and the `ScanLHA.PlotLHA.identity` of the data file don't change.
+    Only the latest entry of each field is kept (see `ScanLHA.PlotLHA.prunesidecar`).
+    """
+    global DATA
+    changed = []
+    keys = {}
+    ident = identity(store.filename) if cache else None
+    for field,expr in newfields.items():
+        keys[field] = 'f' + hashlib.sha1(repr((expr, [ k for f,k in keys.items() if f in expr ], FILTERS)).encode()).hexdigest()
+        if not force and field in DATA and FIELDS.get(field, (None,))[0] == expr and not any(f in expr for f in changed):
+            continue
+        FIELDS[field] = (expr, FIELDS.get(field, (None, 0))[1] + 1)
+        changed.append(field)
+        cached = HDFStorage(sidecar(store.filename), 'newfields/' + keys[field])
+        try:
+            if cache and not force and cached.attr('identity') == ident:
+                values = cached.load()['values']
+                if len(values) == len(DATA):
+                    logger.debug("loaded DATA[{}] = {} from {}".format(field, expr, cached.filename))
+                    DATA[field] = values.values
+                    continue
+        except (OSError, KeyError):
+            pass
+        logger.debug("executing DATA[{}] = {}]".format(field, expr))
+        DATA[field] = evaluate(expr, dict(globals(), **locals()))
+        if cache:
+            try:
+                cached.save(DataFrame({'values': DATA[field].values}), identity=ident, expr=expr, field=field, time=time_ns())
+            except Exception as e:
+                logger.warning('Could not cache {} in {}: {}'.format(field, cached.filename, e))
+    if cache and changed:
+        try:
+            prunesidecar(sidecar(store.filename), ident, { f : '/newfields/' + k for f,k in keys.items() })
+        except Exception as e:
+            logger.warning('Could not prune {}: {}'.format(sidecar(store.filename), e))
+
+def normalize(expr):
+    """ Returns a normalized form of the python expression `expr` which does not depend on whitespace, quotes and parentheses. """
+    try:
+        return ast.dump(ast.parse(str(expr).strip(), mode='eval'))
+    except SyntaxError:
+        return str(expr).strip()
+
+def mask(expr, rescale=None, bounds=None):
+    """
+    Returns the boolean mask (numpy array) of the rows of `DATA` which fulfill the constraint `expr`.
+
+    If `bounds` are given, `expr` is a field and the mask selects `bounds[0] <= rescale*DATA[expr] <= bounds[1]`.
+
+    The masks are evaluated once on the whole `DATA` and cached in `ScanLHA.PlotLHA.MASKS` per data file and versions of the used `newfields`.
+    """
+    key = (store.filename, dependencies(str(expr)), normalize(expr), rescale, tuple(bounds) if bounds else None)
+    if key not in MASKS:
+        if bounds:
+            logger.debug("applying boundaries [{},{}] on field {}".format(bounds[0], bounds[1], expr))
+            values = DATA[expr] if rescale is None else rescale*DATA[expr]
+            MASKS[key] = ((values >= bounds[0]) & (values <= bounds[1])).values
+        else:
+            logger.debug("executing PDATA = PDATA[{}]".format(expr))
+            MASKS[key] = np.asarray(evaluate(expr, dict(globals(), PDATA=DATA)), dtype=bool)
+    return MASKS[key]
+
 def Plot():
-    global PDATA, DATA, c, conf, logger, args, path, DIR, store
+    global PDATA, DATA, c, conf, logger, args, path, DIR, store, FILTERS
     """
     Basic usage: `PlotLHA --help`
 
@@ -121,10 +465,17 @@ def Plot():
 
       * Automatically uses the `'latex'` attribute of specified LHA blocks for labels.
       * Fields for x/y/z axes can be specified by either `BLOCKNAME.values.LHAID` or the specified `'parameter'` attribute.
-      * New fields to plot can be computed using existing fields
-      * Optional constraints on the different fields may be specified
+      * New fields to plot can be computed using existing fields (evaluated as whole-array operations, see `ScanLHA.expressions`).
+        They are cached in the file `<datafile>.newfields.h5` until the data file or the expression changes (disable with `cache: False`).
+      * Optional constraints on the different fields may be specified (simple comparisons such as `PDATA['MASS.values.25'] < 130`
+        which apply to all plots are already applied while loading the data)
       * Various options can be passed to `matplotlib`s `legend`, `scatter`, `colorbar` functions.
       * Optional ticks can be set manually.
+      * Large data sets can be plotted as a density image (`type: density`) with `bins` pixels (default: 200x200)
+        where each pixel shows the `'count'` of points or the `'min'`, `'max'` or `'mean'` (`reduce`, default: `'max'`) of the z-axis field.
+        The color scale spans the pixel values (unless `vmin`/`vmax` of the z-axis are set). Without z-axis field, the pixels are shaded
+        in the `color` of the plot (unless `cmap` is set).
+        Scatter plots with more than `density_threshold` points (default: 10^6, `False` disables) fall back to this mode automatically.
 
     __Example config.yml__
 
@@ -181,6 +532,8 @@ def Plot():
             help="opens interactive plot environment with IPython: plot using the 'plot()' function")
     parser.add_argument("-v", "--verbose", action="count", default=0,
             help="increase output verbosity")
+    parser.add_argument("-j", "--jobs", metavar='N', type=int, default=1,
+            help="render N plots in parallel")
 
     args = parser.parse_args()
 
@@ -193,6 +546,8 @@ def Plot():
         logging.getLogger().setLevel(logging.DEBUG)
         print("set loglevel DEBUG for matplotlib internals and all other modules")
 
+    setup()
+
     c = Config(args.config)
     DIR = os.path.dirname(os.path.abspath(args.config)) + '/'
 
@@ -207,269 +562,344 @@ def Plot():
     conf = PlotConf()
     conf = conf.new_child(c['scatterplot'].get('conf',{}))
 
-    if not os.path.isfile(conf['datafile']):
+    if not os.path.exists(conf['datafile']):
         logger.error('Data file {} does not exist.'.format(conf['datafile']))
         exit(1)
 
-    store = HDFStore(conf['datafile'])
-
     path = 'results' # TODO
-    DATA = store[path]
+    store = getStorage(conf['datafile'], path)
 
-    attrs = store.get_storer(path).attrs
-    if hasattr(attrs, 'config') and conf.get('conf_overwrite', False):
-        attrs.config['scatterplot'] = {}
-        c.append(attrs.config)
+    config = store.attr('config')
+    if config is not None and conf.get('conf_overwrite', False):
+        config['scatterplot'] = {}
+        c.append(config)
+
+    # only load what is needed for the plots
+    FILTERS = pushdown(c)
+    DATA = loadfields(store, requiredfields(c), filters=FILTERS)
 
     if(args.interactive):
+        from IPython import embed
         embed()
     else:
         plot()
 
-    store.close()
-
-def plot(fig=[]):
+def plot(fig=[], jobs=None, force=False):
     """ (re)loads config from the supplied yaml file and renders all plots using matplotlib `plt.scatter` or `plt.plot`.
         * `fig`: list (or string) with filenames of the plots to plot. All other plots won't be plotted.
+        * `jobs`: number of plots to render in parallel (default: the `-j` command line option).
+        * `force`: render all plots. By default, only `newfields` with a changed expression (or depending on such) are recomputed
+          and only plots whose config or data changed since the last call (or which are given in `fig`) are rendered.
     """
-    global DATA, store
+    global DATA, store, FILTERS
     c = Config(args.config)
     conf = PlotConf()
     conf = conf.new_child(c['scatterplot'].get('conf',{}))
-    attrs = store.get_storer(path).attrs
-    if hasattr(attrs, 'config') and conf.get('conf_overwrite', False):
-        attrs.config['scatterplot'] = {}
-        c.append(attrs.config)
+    config = store.attr('config')
+    if config is not None and conf.get('conf_overwrite', False):
+        config['scatterplot'] = {}
+        c.append(config)
+
+    if pushdown(c) != FILTERS:
+        logger.debug("constraints changed, reloading data")
+        FILTERS = pushdown(c)
+        DATA = loadfields(store, requiredfields(c), filters=FILTERS)
+        FIELDS.clear()
+        MASKS.clear()
+    else:
+        # load fields which are needed by the (changed) config but not yet loaded
+        missing = loadfields(store, requiredfields(c), DATA.columns, FILTERS)
+        if len(missing.columns):
+            DATA = concat([DATA, missing], axis=1)
 
     if not DATA.empty and 'newfields' in conf:
         logger.debug("generate custom newfields")
-        for field,expr in conf['newfields'].items():
-            logger.debug("executing DATA[{}] = {}]".format(field, expr))
-            DATA[field] = eval(expr)
+        computefields(conf['newfields'], force, conf['cache'])
         logger.debug("done.")
 
+    if type(fig) == str:
+        fig = [fig]
+    tasks = []
     pcount = 0
+    rendered = {}
     for p in c['scatterplot']['plots']:
-        if type(fig) == str:
-            fig = [fig]
         if fig and p['filename'] not in fig:
             continue
-        lcount = 0
-
-        pconf = conf.new_child(p)
-
-        plt.cla()
-        plt.clf()
-        plt.rcParams.update(pconf['rcParams'])
-        if pconf['figsize']:
-            plt.figure(figsize=pconf['figsize'])
+        plotfile = DIR + p.get('filename', 'plot{}.png'.format(pcount))
+        key = fingerprint(p, pcount, c, conf)
+        if force or fig or RENDERED.get(plotfile) != key or not os.path.exists(plotfile):
+            tasks.append((p, pcount, c, conf))
+            rendered[plotfile] = key
         else:
-            plt.figure()
-        plt.rcParams.update({'font.size': pconf['fontsize']})
-
-        if pconf['colorbar_only']: # TODO cleanup
-            ax = plt.gca()
-            norm = Normalize(vmin=pconf['z-axis']['vmin'], vmax=pconf['z-axis']['vmax'])
-            if pconf['z-axis']['lognorm']:
-                norm = LogNorm(vmin=pconf['z-axis']['vmin'], vmax=pconf['z-axis']['vmax'])
-            cbar = ColorbarBase(ax,norm=norm, cmap=pconf['cmap'], orientation='horizontal', ticklocation='top')
-            if pconf['z-axis']['ticks']:
-                cbar.set_ticks(pconf['z-axis']['ticks'])
-            if pconf['z-axis']['colorbar_orientation'] == 'horizontal':
-                ax.xaxis.set_label_position('top')
-                # ax.xaxis.set_ticks_position('top')
-                # cbar.ax.tick_params(axis='x',direction='in',labeltop='on')
-                # cbar.ax.xaxis.set_ticks_position('top')
-            # cbar.ax.xaxis.set_label_position('top')
-            if pconf['z-axis']['label']:
-                ax.set_xlabel(pconf['z-axis']['label'], labelpad = pconf['z-axis']['labelpad'])
-            cbar.update_ticks()
-            plt.savefig(pconf['filename'],bbox_inches='tight')
-            plt.figure()
-            continue
+            logger.debug("{} is up to date.".format(plotfile))
+        if not p.get('colorbar_only', conf['colorbar_only']):
+            pcount += 1
+
+    jobs = args.jobs if jobs is None else jobs
+    datafiles = { l.get('datafile', p.get('datafile', conf['datafile'])) for p,_,_,_ in tasks for l in p.get('plots', [p]) }
+    if jobs > 1 and len(datafiles) > 1:
+        logger.warning('Plots with different datafiles are rendered serially.')
+        jobs = 1
+    if jobs > 1 and 'fork' not in multiprocessing.get_all_start_methods():
+        logger.warning('Parallel rendering needs the "fork" start method, rendering serially.')
+        jobs = 1
+    if jobs > 1 and len(tasks) > 1:
+        # compute the constraint masks once before the workers are forked
+        for p,_,_,_ in tasks:
+            for l in p.get('plots', [p]): # noqa: E741
+                for constr in l.get('constraints', p.get('constraints', conf['constraints'])):
+                    mask(constr)
+        # forked workers share DATA and MASKS copy-on-write
+        with multiprocessing.get_context('fork').Pool(jobs) as pool:
+            pool.starmap(render, tasks, chunksize=1)
+    else:
+        for task in tasks:
+            render(*task)
+    RENDERED.update(rendered)
 
-        if pconf['title']:
-            plt.title(conf['title'])
+def render(p, pcount, c, conf):
+    """
+    Renders the plot `p` of the `ScanLHA.config.Config` `c` with the defaults `conf` using the data in `DATA`.
 
-        if 'plots' not in p:
-            p['plots'] = [p]
+    `pcount` is used for the default filename. Changes of the matplotlib rcParams are reset afterwards.
+    """
+    global DATA, store
+    with plt.rc_context():
+        _render(p, pcount, c, conf)
+    plt.close('all')
 
-        for l in p['plots']: # noqa: E741
-            lconf = pconf.new_child(l)
+def _render(p, pcount, c, conf):
+    global DATA, store
+    lcount = 0
 
-            label = lconf['label']
-            label = label if label else None
-            cmap = lconf['cmap']
-            zorder = lconf.get('zorder', lcount)
-            color = lconf.get('color', "C{}".format(lcount))
-            if isinstance(color, int):
-                color = [list(plt.cm.viridis(linspace(0,1,20))[color])]
-
-            x = lconf.get('x-field', lconf['x-axis'].get('field', None))
-            y = lconf.get('y-field', lconf['y-axis'].get('field', None))
-            z = lconf.get('z-field', lconf['z-axis'].get('field', None))
-
-            xlabel = lconf['x-axis']['label']
-            ylabel = lconf['y-axis']['label']
-            zlabel = lconf['z-axis']['label']
-            if hasattr(c, 'parameters'):
-                xlabel = c.parameters.get(x, {'latex': xlabel})['latex'] if not xlabel else xlabel
-                ylabel = c.parameters.get(y, {'latex': ylabel})['latex'] if not ylabel else ylabel
-                zlabel = c.parameters.get(z, {'latex': zlabel})['latex'] if not zlabel else zlabel
-
-            if xlabel:
-                plt.xlabel(xlabel, labelpad = lconf['x-axis']['labelpad'], fontsize = lconf['labelfontsize'])
-            if ylabel:
-                plt.ylabel(ylabel, labelpad = lconf['y-axis']['labelpad'], fontsize = lconf['labelfontsize'])
-
-            if lconf['hline']:
-                plt.axhline(y=y, color=color, linestyle='-', lw=lconf['lw'], label=label, zorder=zorder, alpha=lconf['alpha'])
-                continue
-            if lconf['vline']:
-                plt.axvline(x=x, color=color, linestyle='-', lw=lconf['lw'], label=label, zorder=zorder, alpha=lconf['alpha'])
-                continue
+    pconf = conf.new_child(p)
 
-            if hasattr(c, 'parameters'):
-                x = c.parameters.get(x,{'lha': x})['lha']
-                y = c.parameters.get(y,{'lha': y})['lha']
-                z = c.parameters.get(z,{'lha': z})['lha']
-
-            PDATA = DATA
-            if lconf['constraints']:
-                logger.debug("Applying given constraints.")
-            for constr in lconf['constraints']:
-                logger.debug("executing DATA[{}] = {}]".format(field, constr))
-                PDATA = PDATA[eval(constr)]
-
-            if(lconf['datafile'] and lconf['datafile'] != conf['datafile']):
-                conf['datafile'] = lconf['datafile'] # TODO
-                store.close()
-                logger.info("load new datafile {} (will be used for all following plots".format(conf['datafile']))
-                del DATA, PDATA, store
-                store = HDFStore(lconf['datafile'])  # TODO
-                DATA = store['results']  # TODO
-                PDATA = DATA
-
-                if not PDATA.empty and 'newfields' in conf:
-                    logger.debug("generate custom newfields for new datafile")
-                    for field,expr in conf['newfields'].items():
-                        logger.debug("executing PATA[{}] = {}]".format(field, expr))
-                        PDATA[field] = eval(expr)
-                    logger.debug("done.")
-
-            PDATA = PDATA.replace('NaN',nan)
-
-            for ax,field in {'x-axis':x, 'y-axis':y, 'z-axis':z}.items():
-                if lconf[ax].get('rescale', None):
-                    PDATA[field] = lconf[ax]['rescale']*PDATA[field]
-                bounds = lconf[ax]['boundaries']
-                if len(bounds) == 2:
-                    logger.debug("applying boundaries [{},{}] on axis {}, field {}".format(bounds[0],bounds[1],ax,field))
-                    PDATA = PDATA[(PDATA[field] >= bounds[0]) & (PDATA[field] <= bounds[1])]
-
-            if lconf['x-axis']['lognorm']:
-                if type(lconf['x-axis']['lognorm']) == str:
-                    plt.xscale(lconf['x-axis']['lognorm'])
-                else:
-                    plt.xscale('log')
+    plt.cla()
+    plt.clf()
+    plt.rcParams.update(pconf['rcParams'])
+    if pconf['figsize']:
+        plt.figure(figsize=pconf['figsize'])
+    else:
+        plt.figure()
+    plt.rcParams.update({'font.size': pconf['fontsize']})
 
-            if lconf['y-axis']['lognorm']:
-                if type(lconf['y-axis']['lognorm']) == str:
-                    plt.yscale(lconf['y-axis']['lognorm'])
-                else:
-                    plt.yscale('log')
+    if pconf['colorbar_only']: # TODO cleanup
+        ax = plt.gca()
+        norm = Normalize(vmin=pconf['z-axis']['vmin'], vmax=pconf['z-axis']['vmax'])
+        if pconf['z-axis']['lognorm']:
+            norm = LogNorm(vmin=pconf['z-axis']['vmin'], vmax=pconf['z-axis']['vmax'])
+        cbar = ColorbarBase(ax,norm=norm, cmap=pconf['cmap'], orientation='horizontal', ticklocation='top')
+        if pconf['z-axis']['ticks']:
+            cbar.set_ticks(pconf['z-axis']['ticks'])
+        if pconf['z-axis']['colorbar_orientation'] == 'horizontal':
+            ax.xaxis.set_label_position('top')
+            # ax.xaxis.set_ticks_position('top')
+            # cbar.ax.tick_params(axis='x',direction='in',labeltop='on')
+            # cbar.ax.xaxis.set_ticks_position('top')
+        # cbar.ax.xaxis.set_label_position('top')
+        if pconf['z-axis']['label']:
+            ax.set_xlabel(pconf['z-axis']['label'], labelpad = pconf['z-axis']['labelpad'])
+        cbar.update_ticks()
+        plt.savefig(pconf['filename'],bbox_inches='tight')
+        plt.figure()
+        return
+
+    if pconf['title']:
+        plt.title(conf['title'])
+
+    if 'plots' not in p:
+        p['plots'] = [p]
+
+    for l in p['plots']: # noqa: E741
+        lconf = pconf.new_child(l)
+
+        label = lconf['label']
+        label = label if label else None
+        cmap = lconf['cmap']
+        zorder = lconf.get('zorder', lcount)
+        color = lconf.get('color', "C{}".format(lcount))
+        if isinstance(color, int):
+            color = [list(plt.cm.viridis(linspace(0,1,20))[color])]
+
+        x = lconf.get('x-field', lconf['x-axis'].get('field', None))
+        y = lconf.get('y-field', lconf['y-axis'].get('field', None))
+        z = lconf.get('z-field', lconf['z-axis'].get('field', None))
+
+        xlabel = lconf['x-axis']['label']
+        ylabel = lconf['y-axis']['label']
+        zlabel = lconf['z-axis']['label']
+        if hasattr(c, 'parameters'):
+            xlabel = c.parameters.get(x, {'latex': xlabel})['latex'] if not xlabel else xlabel
+            ylabel = c.parameters.get(y, {'latex': ylabel})['latex'] if not ylabel else ylabel
+            zlabel = c.parameters.get(z, {'latex': zlabel})['latex'] if not zlabel else zlabel
+
+        if xlabel:
+            plt.xlabel(xlabel, labelpad = lconf['x-axis']['labelpad'], fontsize = lconf['labelfontsize'])
+        if ylabel:
+            plt.ylabel(ylabel, labelpad = lconf['y-axis']['labelpad'], fontsize = lconf['labelfontsize'])
+
+        if lconf['hline']:
+            plt.axhline(y=y, color=color, linestyle='-', lw=lconf['lw'], label=label, zorder=zorder, alpha=lconf['alpha'])
+            continue
+        if lconf['vline']:
+            plt.axvline(x=x, color=color, linestyle='-', lw=lconf['lw'], label=label, zorder=zorder, alpha=lconf['alpha'])
+            continue
 
-            if z:
-                PDATA = PDATA.sort_values(by=z)
-                color = PDATA[z]
-                vmin = PDATA[z].min() if not lconf['z-axis']['vmin'] else lconf['z-axis']['vmin']
-                vmax = PDATA[z].max() if not lconf['z-axis']['vmax'] else lconf['z-axis']['vmax']
+        if hasattr(c, 'parameters'):
+            x = c.parameters.get(x,{'lha': x})['lha']
+            y = c.parameters.get(y,{'lha': y})['lha']
+            z = c.parameters.get(z,{'lha': z})['lha']
+
+        if(lconf['datafile'] and lconf['datafile'] != conf['datafile']):
+            conf['datafile'] = lconf['datafile'] # TODO
+            logger.info("load new datafile {} (will be used for all following plots".format(conf['datafile']))
+            del DATA, store
+            store = getStorage(lconf['datafile'], path)  # TODO
+            DATA = loadfields(store, requiredfields(c), filters=FILTERS)  # TODO
+
+            if not DATA.empty and 'newfields' in conf:
+                logger.debug("generate custom newfields for new datafile")
+                computefields(conf['newfields'], cache=conf['cache'])
+                logger.debug("done.")
+
+        if lconf['constraints']:
+            logger.debug("Applying given constraints.")
+        selection = np.ones(len(DATA), dtype=bool)
+        for constr in lconf['constraints']:
+            selection &= mask(constr)
+        for ax,field in {'x-axis':x, 'y-axis':y, 'z-axis':z}.items():
+            bounds = lconf[ax]['boundaries']
+            if len(bounds) == 2:
+                selection &= mask(field, lconf[ax].get('rescale', None), bounds)
+        PDATA = DATA[selection]
+
+        for ax,field in {'x-axis':x, 'y-axis':y, 'z-axis':z}.items():
+            if lconf[ax].get('rescale', None):
+                PDATA[field] = lconf[ax]['rescale']*PDATA[field]
+
+        if lconf['x-axis']['lognorm']:
+            if type(lconf['x-axis']['lognorm']) == str:
+                plt.xscale(lconf['x-axis']['lognorm'])
             else:
-                vmin = None
-                vmax = None
-            znorm = LogNorm(vmin=vmin, vmax=vmax) if lconf['z-axis']['lognorm'] else None
-
-            if lconf['exec']:
-                exec(lconf['exec'])
+                plt.xscale('log')
 
-            if len(PDATA) == 0:
-                logger.error('In plot {}, x:{} , y:{}; no data to plot! (wrong boundaries or constraints?)'.format(p['filename'], x, y))
-                continue
-
-            if pconf.get('type', 'scatter') == 'scatter':
-                cs = plt.scatter(PDATA[x], PDATA[y], zorder=zorder, label=label, cmap=cmap, c=color, vmin=vmin, vmax=vmax, norm=znorm, s=lconf['s'], alpha=lconf['alpha'], marker=lconf.get('marker', None), **lconf.get('kwargs',{}))
+        if lconf['y-axis']['lognorm']:
+            if type(lconf['y-axis']['lognorm']) == str:
+                plt.yscale(lconf['y-axis']['lognorm'])
             else:
-                PDATA = PDATA[[x,y]].dropna().sort_values(by=x)
-                cs = plt.plot(PDATA[x], PDATA[y], lconf.get('fmt', '.'), zorder=zorder, c=color, alpha=lconf['alpha'], label=label, **lconf.get('kwargs',{}))
-
-                xlim = lconf['x-axis']['lim']
-                ylim = lconf['y-axis']['lim']
-                if xlim:
-                    plt.xlim(xlim)
-                if ylim:
-                    plt.ylim(ylim)
-
-            plt.grid(b=True, which='major', color='#777777', linestyle='-', alpha=0.3, zorder=0)
-            plt.minorticks_on()
-            plt.grid(b=True, which='minor', color='#999999', linestyle='-', alpha=0.1, zorder=0)
-
-            plt.margins(x=0.01,y=0.01)  # TODO
-            if lconf['x-axis']['ticks']:
-                if type(lconf['x-axis']['ticks'][0]) is not list:
-                    lconf['x-axis']['ticks'] = [lconf['x-axis']['ticks'], ['${}$'.format(xt) for xt in lconf['x-axis']['ticks']]]
-                plt.xticks(lconf['x-axis']['ticks'][0],lconf['x-axis']['ticks'][1])
-            if lconf['y-axis']['ticks']:
-                if type(lconf['y-axis']['ticks'][0]) is not list:
-                    lconf['y-axis']['ticks'] = [lconf['y-axis']['ticks'], ['${}$'.format(yt) for yt in lconf['y-axis']['ticks']]]
-                plt.yticks(lconf['y-axis']['ticks'][0],lconf['y-axis']['ticks'][1])
-
-            if lconf['z-axis']['colorbar']:
-                cbar = plt.colorbar(cs, orientation=lconf['z-axis']['colorbar_orientation'], **lconf['z-axis'].get('kwargs',{}))
-                if zlabel:
-                    cbar.set_label('$\\phantom{M^{\\overline{DR}}}$ ' + zlabel, labelpad=pconf['z-axis']['labelpad'], fontsize = lconf['labelfontsize'])
-                if lconf['z-axis']['ticks']:
-                    if type(lconf['z-axis']['ticks'][0]) is not list:
-                        lconf['z-axis']['ticks'] = [lconf['z-axis']['ticks'], ['${}$'.format(zt) for zt in lconf['z-axis']['ticks']]]
-                    cbar.set_ticks(lconf['z-axis']['ticks'][0])
-                    if lconf['z-axis']['colorbar_orientation'] == 'horizontal':
-                        cbar.ax.set_xticklabels(lconf['z-axis']['ticks'][1])
-                    else:
-                        cbar.ax.set_yticklabels(lconf['z-axis']['ticks'][1])
-                for label in cbar.ax.yaxis.get_ticklabels():
-                    if lconf['z-axis']['colorbar_orientation'] == 'horizontal':
-                        label.set_ha('center')
-                    else:
-                        label.set_va('center')
-                cbar.ax.xaxis.set_tick_params(pad=lconf['z-axis']['tickpad'])
-
-            lcount += 1
-
-        if pconf['textbox'] and 'text' in pconf['textbox']:
-            bbox = pconf['textbox'].get('bbox', dict(boxstyle='round', facecolor='white', alpha=0.2))
-            va = pconf['textbox'].get('va', 'top')
-            ha = pconf['textbox'].get('ha', 'left')
-            textsize = pconf['textbox'].get('fontsize', pconf['rcParams'].get('font.size',15))
-            xtext = pconf['textbox'].get('x', 0.95)
-            ytext = pconf['textbox'].get('y', 0.85)
-            plt.gcf().text(xtext, ytext, pconf['textbox']['text'], fontsize=textsize ,va=va, ha=ha, bbox=bbox)
-
-        if pconf['tick_params']:
-            plt.tick_params(**pconf['tick_params'])
-
-        if any([lbl.get('label', False) for lbl in p['plots']]):
-            plt.legend(**pconf['legend'])
+                plt.yscale('log')
 
-        ax = plt.gca()
-        for label in ax.yaxis.get_ticklabels():
-            label.set_verticalalignment('center')
-        for label in ax.xaxis.get_ticklabels():
-            label.set_horizontalalignment('center')
+        if z:
+            PDATA = PDATA.sort_values(by=z)
+            color = PDATA[z]
+            vmin = PDATA[z].min() if not lconf['z-axis']['vmin'] else lconf['z-axis']['vmin']
+            vmax = PDATA[z].max() if not lconf['z-axis']['vmax'] else lconf['z-axis']['vmax']
+        else:
+            vmin = None
+            vmax = None
+        znorm = LogNorm(vmin=vmin, vmax=vmax) if lconf['z-axis']['lognorm'] else None
 
-        for ann in p.get('annotiations',[]):
-            plt.annotate(ann['label'], ann['pos'], **ann.get('kwargs',{}))
+        if lconf['exec']:
+            exec(lconf['exec'])
 
-        plotfile = DIR + p.get('filename', 'plot{}.png'.format(pcount))
-        # logging.info("Saving {}.".format(plotfile))
-        print("Saving {}.".format(plotfile))
-        plt.savefig(plotfile, bbox_inches="tight", dpi=pconf['dpi'])
-        pcount += 1
+        if len(PDATA) == 0:
+            logger.error('In plot {}, x:{} , y:{}; no data to plot! (wrong boundaries or constraints?)'.format(p['filename'], x, y))
+            continue
+
+        ptype = pconf.get('type', 'scatter')
+        if ptype == 'scatter' and lconf['density_threshold'] and len(PDATA) > lconf['density_threshold']:
+            logger.info('{} points in plot {}, plotting the density instead.'.format(len(PDATA), p.get('filename', pcount)))
+            ptype = 'density'
+
+        if ptype == 'density':
+            reduce = lconf['reduce'] if lconf['reduce'] else ('max' if z else 'count')
+            image, xedges, yedges = density(PDATA[x], PDATA[y], PDATA[z] if z else None, bins=lconf['bins'], reduce=reduce,
+                    xscale=plt.gca().get_xscale(), yscale=plt.gca().get_yscale())
+            # the colors show the pixel values, i.e. counts or the reduced z values
+            vmin = image.min() if not lconf['z-axis']['vmin'] else lconf['z-axis']['vmin']
+            vmax = image.max() if not lconf['z-axis']['vmax'] else lconf['z-axis']['vmax']
+            znorm = LogNorm(vmin=vmin, vmax=vmax) if lconf['z-axis']['lognorm'] else Normalize(vmin=vmin, vmax=vmax)
+            if not z and not cmap:
+                # shades of the layer color
+                rgba = to_rgba(color[0] if isinstance(color, list) else color)
+                cmap = LinearSegmentedColormap.from_list('density', [rgba[:3] + (0.2,), rgba])
+            cs = plt.pcolormesh(xedges, yedges, image.T, zorder=zorder, cmap=cmap, norm=znorm, alpha=lconf['alpha'], rasterized=True, **lconf.get('kwargs',{}))
+            if label:
+                # pcolormesh has no legend handle, an empty scatter serves as proxy
+                plt.scatter([], [], color=[cs.cmap(1.0)], marker='s', label=label)
+        elif ptype == 'scatter':
+            cs = plt.scatter(PDATA[x], PDATA[y], zorder=zorder, label=label, cmap=cmap, c=color, vmin=vmin, vmax=vmax, norm=znorm, s=lconf['s'], alpha=lconf['alpha'], marker=lconf.get('marker', None), **lconf.get('kwargs',{}))
+        else:
+            PDATA = PDATA[[x,y]].dropna().sort_values(by=x)
+            cs = plt.plot(PDATA[x], PDATA[y], lconf.get('fmt', '.'), zorder=zorder, c=color, alpha=lconf['alpha'], label=label, **lconf.get('kwargs',{}))
+
+            xlim = lconf['x-axis']['lim']
+            ylim = lconf['y-axis']['lim']
+            if xlim:
+                plt.xlim(xlim)
+            if ylim:
+                plt.ylim(ylim)
+
+        plt.grid(b=True, which='major', color='#777777', linestyle='-', alpha=0.3, zorder=0)
+        plt.minorticks_on()
+        plt.grid(b=True, which='minor', color='#999999', linestyle='-', alpha=0.1, zorder=0)
+
+        plt.margins(x=0.01,y=0.01)  # TODO
+        if lconf['x-axis']['ticks']:
+            if type(lconf['x-axis']['ticks'][0]) is not list:
+                lconf['x-axis']['ticks'] = [lconf['x-axis']['ticks'], ['${}$'.format(xt) for xt in lconf['x-axis']['ticks']]]
+            plt.xticks(lconf['x-axis']['ticks'][0],lconf['x-axis']['ticks'][1])
+        if lconf['y-axis']['ticks']:
+            if type(lconf['y-axis']['ticks'][0]) is not list:
+                lconf['y-axis']['ticks'] = [lconf['y-axis']['ticks'], ['${}$'.format(yt) for yt in lconf['y-axis']['ticks']]]
+            plt.yticks(lconf['y-axis']['ticks'][0],lconf['y-axis']['ticks'][1])
+
+        if lconf['z-axis']['colorbar']:
+            cbar = plt.colorbar(cs, orientation=lconf['z-axis']['colorbar_orientation'], **lconf['z-axis'].get('kwargs',{}))
+            if zlabel:
+                cbar.set_label('$\\phantom{M^{\\overline{DR}}}$ ' + zlabel, labelpad=pconf['z-axis']['labelpad'], fontsize = lconf['labelfontsize'])
+            if lconf['z-axis']['ticks']:
+                if type(lconf['z-axis']['ticks'][0]) is not list:
+                    lconf['z-axis']['ticks'] = [lconf['z-axis']['ticks'], ['${}$'.format(zt) for zt in lconf['z-axis']['ticks']]]
+                cbar.set_ticks(lconf['z-axis']['ticks'][0])
+                if lconf['z-axis']['colorbar_orientation'] == 'horizontal':
+                    cbar.ax.set_xticklabels(lconf['z-axis']['ticks'][1])
+                else:
+                    cbar.ax.set_yticklabels(lconf['z-axis']['ticks'][1])
+            for label in cbar.ax.yaxis.get_ticklabels():
+                if lconf['z-axis']['colorbar_orientation'] == 'horizontal':
+                    label.set_ha('center')
+                else:
+                    label.set_va('center')
+            cbar.ax.xaxis.set_tick_params(pad=lconf['z-axis']['tickpad'])
+
+        lcount += 1
+
+    if pconf['textbox'] and 'text' in pconf['textbox']:
+        bbox = pconf['textbox'].get('bbox', dict(boxstyle='round', facecolor='white', alpha=0.2))
+        va = pconf['textbox'].get('va', 'top')
+        ha = pconf['textbox'].get('ha', 'left')
+        textsize = pconf['textbox'].get('fontsize', pconf['rcParams'].get('font.size',15))
+        xtext = pconf['textbox'].get('x', 0.95)
+        ytext = pconf['textbox'].get('y', 0.85)
+        plt.gcf().text(xtext, ytext, pconf['textbox']['text'], fontsize=textsize ,va=va, ha=ha, bbox=bbox)
+
+    if pconf['tick_params']:
+        plt.tick_params(**pconf['tick_params'])
+
+    if any([lbl.get('label', False) for lbl in p['plots']]):
+        plt.legend(**pconf['legend'])
+
+    ax = plt.gca()
+    for label in ax.yaxis.get_ticklabels():
+        label.set_verticalalignment('center')
+    for label in ax.xaxis.get_ticklabels():
+        label.set_horizontalalignment('center')
+
+    for ann in p.get('annotiations',[]):
+        plt.annotate(ann['label'], ann['pos'], **ann.get('kwargs',{}))
+
+    plotfile = DIR + p.get('filename', 'plot{}.png'.format(pcount))
+    # logging.info("Saving {}.".format(plotfile))
+    print("Saving {}.".format(plotfile))
+    plt.savefig(plotfile, bbox_inches="tight", dpi=pconf['dpi'])
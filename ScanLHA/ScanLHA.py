@@ -2,11 +2,17 @@
 """
 Perform scans from the command line using YAML config files.
 """
+import hashlib
 import os
+import pickle
 import sys
 import logging
-from ScanLHA import Config, Scan, RandomScan, FileScan
-from ScanLHA import __file__ as libpath
+from shutil import rmtree
+from time import time
+from ScanLHA import Config
+from ScanLHA.config import CACHE, CACHE_MAXAGE, CACHE_MAXFILES
+from ScanLHA import __file__ as libpath, __version__
+from ScanLHA import config as configmodule
 from argparse import ArgumentParser
 from math import * # noqa: F401 F403
 
@@ -20,6 +26,85 @@ def cpath(yml):
         return default
     return yml
 
+def digest(filename):
+    """ Returns the SHA-256 hash of the contents of `filename`. """
+    with open(filename, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+def prunecache(directory, maxage=CACHE_MAXAGE, maxfiles=CACHE_MAXFILES):
+    """
+    Remove cached configs in `directory` which were last used more than `maxage` days ago
+    and all but the `maxfiles` most recently used ones.
+    """
+    files = []
+    for name in os.listdir(directory):
+        if name.endswith('.pickle'):
+            try:
+                files.append((os.path.getmtime(os.path.join(directory, name)), name))
+            except OSError:
+                pass
+    files.sort(reverse=True)
+    for i,(mtime,name) in enumerate(files):
+        if i >= maxfiles or time() - mtime > maxage*86400:
+            try:
+                os.remove(os.path.join(directory, name))
+            except OSError:
+                pass
+
+def loadconfig(src):
+    """
+    Returns the `ScanLHA.config.Config` of the scan config file `src` merged with its default config
+    (`runner['defaults']`, default: `'SPheno.yml'`, `false` for none).
+
+    The merged and validated config is cached in `ScanLHA.config.CACHE` and reused as long as the contents of both files
+    (and the working directory, which relative paths refer to) are unchanged. Configs cached by another version of ScanLHA
+    (`ScanLHA.__version__` or the `ScanLHA.config` module) are not reused.
+    Unused configs are removed from the cache when a new one is added (see `ScanLHA.config.CACHE_MAXAGE`).
+    """
+    cachefile = None
+    if CACHE:
+        key = hashlib.sha256((digest(src) + os.getcwd() + __version__ + digest(configmodule.__file__)).encode()).hexdigest()
+        cachefile = os.path.join(CACHE, key + '.pickle')
+    if cachefile and os.path.isfile(cachefile):
+        try:
+            with open(cachefile, 'rb') as f:
+                sources, c = pickle.load(f)
+            if all(os.path.isfile(p) and digest(p) == h for p,h in sources):
+                logging.debug('using cached config {}'.format(cachefile))
+                # the modification time marks the last use
+                os.utime(cachefile)
+                c.src = src
+                return c
+        except Exception as e:
+            logging.debug('could not read cached config {} ({})'.format(cachefile, e))
+
+    logging.debug('loading config {}'.format(src))
+    scanconf = Config(src)
+    sources = [(os.path.abspath(src), digest(src))]
+    defaultfile = scanconf['runner'].get('defaults', 'SPheno.yml')
+    if defaultfile:
+        logging.debug('loading default config {}'.format(defaultfile))
+        c = Config(cpath(defaultfile))
+        if not c.valid:
+            logging.error('No valid default config.')
+            sys.exit(1)
+        c.append(scanconf)
+        if os.path.isfile(cpath(defaultfile)):
+            sources.append((os.path.abspath(cpath(defaultfile)), digest(cpath(defaultfile))))
+    else:
+        c = scanconf
+
+    if cachefile and c.valid:
+        try:
+            os.makedirs(CACHE, exist_ok=True)
+            with open(cachefile + '.tmp', 'wb') as f:
+                pickle.dump((sources, c), f, pickle.HIGHEST_PROTOCOL)
+            os.replace(cachefile + '.tmp', cachefile)
+            prunecache(CACHE)
+        except Exception as e:
+            logging.debug('could not cache config in {} ({})'.format(cachefile, e))
+    return c
+
 def ScanLHA():
     """
     Basic usage: `ScanLHA --help`.
@@ -60,12 +145,13 @@ def ScanLHA():
     Alternatively one may specify `values: [1, 2, 10]` for TanBeta instead of `argument`
     or even `scan: [1, 50, 50]` to scan over TanBeta and save the result into one single file.
 
+    The config merged with its defaults is cached as long as the YAML files don't change (see `ScanLHA.ScanLHA.loadconfig`).
     """
     parser = ArgumentParser(description='Perform an (S)LHA scan.')
     parser.add_argument("config", type=str, metavar="config.yml",
             help="path to YAML file config.yml containing config for the scan. Must be the very first argument.")
     parser.add_argument("output", nargs='?', default="config.h5",
-            help="optional file path to store the results, defaults to config.h5")
+            help="optional file path to store the results, defaults to config.h5. Use the extension .parquet (or a directory) for Parquet files (datasets).")
     parser.add_argument("-v", "--verbose", action="store_true",
             help="increase output verbosity")
     parser.add_argument("-p", "--parallel", metavar='N', type=int, default=None,
@@ -80,18 +166,7 @@ def ScanLHA():
         logging.error('No valid config file "{}".'.format(sys.argv[1]))
         parser.parse_args(["-h"])
 
-    logging.debug('loading config {}'.format(sys.argv[1]))
-    scanconf = Config(sys.argv[1])
-    defaultfile = scanconf['runner'].get('defaults', 'SPheno.yml')
-    if defaultfile:
-        logging.debug('loading default config {}'.format(defaultfile))
-        c = Config(cpath(defaultfile))
-        if not c.valid:
-            logging.error('No valid default config.')
-            sys.exit(1)
-        c.append(scanconf)
-    else:
-        c = scanconf
+    c = loadconfig(sys.argv[1])
 
     if not c.valid:
         logging.error('No valid scan config.')
@@ -129,16 +204,23 @@ def ScanLHA():
     if HDFSTORE == args.config:
         print('Scan config file must end with ".yml"')
         exit(1)
-    HDFSTORE = os.path.abspath(HDFSTORE)
+    # keep a trailing separator, it selects a Parquet dataset
+    HDFSTORE = os.path.join(os.path.abspath(HDFSTORE), '') if HDFSTORE.endswith(os.sep) else os.path.abspath(HDFSTORE)
 
     if os.path.exists(HDFSTORE):
         if args.overwrite or input("File {} already exists. Overwrite/append [o/a] ?".format(HDFSTORE)) == "o":
             logging.info("removing {}".format(HDFSTORE))
-            os.remove(HDFSTORE)
+            if os.path.isdir(HDFSTORE):
+                rmtree(HDFSTORE)
+            else:
+                os.remove(HDFSTORE)
 
+    # imports pandas, numpy etc.
+    from ScanLHA.scan import Scan, RandomScan, AdaptiveScan, FileScan
     scantypes = {
             'straight': Scan,
             'random': RandomScan,
+            'adaptive': AdaptiveScan,
             'file': FileScan
             }
 
@@ -70,8 +70,11 @@ Where the ``id`` is the SLHA-id of the parameter ``parameter`` in the block ``bl
 The presence of the new command line argument ``TanBeta`` may be  verified with ``ScanLHA config.yml --help``.  
 A scan that runs the SPheno->HiggsBounds chain in 2 parallel threads is started with ``ScanLHA config.yml -p 2 --TanBeta 4 scantanbeta4.h5`` (by default os.cpucount() is used for ``-p``).  
 For this purpose, 2 copies of the binaries are stored in 2 randomly named directories in ``runner['tmpfs']`` (default: ``/dev/shm/``) where the input and output files are generated.  
+Output files ending with ``.parquet`` (or directories) are stored as Parquet files (datasets) instead of HDF files (requires ``pyarrow``).  
+With ``runner['archive']: 'dir'`` the raw output of each point is kept in compressed per-worker archives in ``dir`` (see [archive](https://martingabelmann.github.io/ScanLHA/archive.m.html)), e.g. to parse further blocks later on.  
 Alternatively one may specify ``values: [1, 2, 10]`` for the line ``TanBeta`` instead of ``argument``
 or even ``scan: [1, 50, 50]`` to scan over ``TanBeta`` (from 1 to 50 in 50 steps for each random value of ``MSUSY``) and save the result into one single file (likewise, the ``argument`` option can be set to ``scan`` or ``random`` and according numbers may be provided from the command line). 
+With ``scantype: adaptive`` the grid given by the ``scan`` ranges is only a coarse starting grid whose cells are subdivided where the constraint outcome or a given observable changes (see [AdaptiveScan](https://martingabelmann.github.io/ScanLHA/scan.m.html)).  
 Grid scans can have a ``distribution`` attribute equaling ``linear,log,geom,arange,uniform`` or ``normal`` while for random scans all common functions from ``numpy.random`` are avavailable an take the list ``random``as arguments.
 
 The executables in ``runner['binaries']`` are run subsequential for each parameter point using given arguments. For each point a randomly named ``{input_file}`` is generated and may be passed as argument
@@ -163,9 +166,26 @@ __Related Tools__
  * ask me if you wish to be listed here
 
 """
-from .scan import Scan, RandomScan, FileScan
-from .config import Config
-from  .runner import RUNNERS
-from  .slha import genSLHA, parseSLHA
+from importlib import import_module
 __version__ = '0.6'
 __all__ = []
+
+# the submodules (and pandas/numpy) are only imported on first access, e.g. `from ScanLHA import Config` only imports `ScanLHA.config`
+LAZY = {
+        'Scan': 'scan',
+        'RandomScan': 'scan',
+        'AdaptiveScan': 'scan',
+        'FileScan': 'scan',
+        'Config': 'config',
+        'RUNNERS': 'scan', # registers the runner_plugins as well
+        'genSLHA': 'slha',
+        'parseSLHA': 'slha',
+        'SLHATemplate': 'slha'
+        }
+
+def __getattr__(name):
+    if name not in LAZY:
+        raise AttributeError("module {} has no attribute {}".format(__name__, name))
+    value = getattr(import_module('.' + LAZY[name], __name__), name)
+    globals()[name] = value
+    return value
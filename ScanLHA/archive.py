@@ -0,0 +1,107 @@
+"""
+Compressed archives of the raw (S)LHA output of each parameter point.
+
+With `runner['archive']` set to a directory, each runner appends the output of every point to its own archive file
+(one compressed frame per point, see `ScanLHA.runner.SLHARunner.execute`). The location of the frame is stored in the
+columns `archive_file`, `archive_offset` and `archive_size` of the results, i.e. the results table is the index of the archive:
+
+    runner:
+      archive: 'archive/' # directory of the archive files
+      archive_format: xz # default, or zstd (requires zstandard)
+
+The archived outputs can be parsed again, e.g. with other `getblocks`:
+
+    In [1]: from ScanLHA.archive import reparse
+    In [2]: DATA = DATA.join(reparse(DATA, blocks=['HMIX']))
+
+or can be used as input of a `ScanLHA.scan.FileScan`.
+"""
+import logging
+import lzma
+import os
+import socket
+from sys import exit
+from pandas import DataFrame, json_normalize
+from .slha import loadSLHA
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+__all__ = ['Archive', 'COLUMNS', 'FORMATS', 'readArchived', 'reparse']
+
+FORMATS = {
+        'xz': '.xz',
+        'zstd': '.zst'
+        }
+""" Available compression formats and their file extensions. """
+
+COLUMNS = ['archive_file', 'archive_offset', 'archive_size']
+""" Result columns which locate the archived output of a point. """
+
+def compress(contents, fmt):
+    if fmt == 'zstd':
+        return zstandard.ZstdCompressor().compress(contents)
+    return lzma.compress(contents, format=lzma.FORMAT_XZ)
+
+def decompress(data, fmt):
+    if fmt == 'zstd':
+        return zstandard.ZstdDecompressor().decompress(data)
+    return lzma.decompress(data, format=lzma.FORMAT_XZ)
+
+class Archive():
+    """
+    Append-only archive file in the directory `directory`, one per host and process (i.e. per worker)
+    such that no locking is needed.
+
+    `fmt` is one of `ScanLHA.archive.FORMATS`.
+    """
+    def __init__(self, directory, fmt='xz'):
+        if fmt not in FORMATS:
+            logging.error('Unknown archive format {}, use one of {}.'.format(fmt, ', '.join(FORMATS)))
+            exit(1)
+        if fmt == 'zstd' and zstandard is None:
+            logging.error('The zstd archive format needs zstandard (pip3 install zstandard).')
+            exit(1)
+        self.fmt = fmt
+        self.directory = os.path.abspath(directory)
+        os.makedirs(self.directory, exist_ok=True)
+        self.filename = os.path.join(self.directory, 'slha-{}-{}{}'.format(socket.gethostname(), os.getpid(), FORMATS[fmt]))
+
+    def append(self, contents):
+        """
+        Append the string `contents` as one compressed frame.
+
+        Returns the dict `{'archive_file': ..., 'archive_offset': ..., 'archive_size': ...}` that locates the frame.
+        """
+        data = compress(contents.encode('utf8'), self.fmt)
+        with open(self.filename, 'ab') as f:
+            offset = f.seek(0, os.SEEK_END)
+            f.write(data)
+        return { 'archive_file': self.filename, 'archive_offset': offset, 'archive_size': len(data) }
+
+def readArchived(filename, offset, size):
+    """ Returns the archived output in the archive file `filename` (frame of `size` bytes at `offset`). """
+    fmt = 'zstd' if filename.endswith(FORMATS['zstd']) else 'xz'
+    if fmt == 'zstd' and zstandard is None:
+        logging.error('Reading zstd archives needs zstandard (pip3 install zstandard).')
+        exit(1)
+    with open(filename, 'rb') as f:
+        f.seek(int(offset))
+        return decompress(f.read(int(size)), fmt).decode('utf8')
+
+def reparse(df, blocks=[]):
+    """
+    Parse the archived outputs of the results `df` again, optionally only the list of `blocks`.
+
+    Returns a DataFrame with the same index as `df` (rows without archived output are empty).
+    """
+    rows = []
+    for filename, offset, size in df[COLUMNS].itertuples(index=False):
+        if type(filename) != str or not filename or offset != offset:
+            rows.append({})
+            continue
+        rows.append(loadSLHA(readArchived(filename, offset, size), blocks, source='{}:{}'.format(filename, int(offset))))
+    result = json_normalize(rows) if rows else DataFrame()
+    result.index = df.index
+    return result
@@ -1,9 +1,9 @@
 """
 Maps (S)LHA syntax onto YAML as well as stores configs for scanning and plotting.
 """
-from numpy import linspace, logspace, geomspace, arange
-from numpy.random import uniform, normal
+from importlib import import_module
 import logging
+import os
 import re
 from sys import exit
 import yaml
@@ -19,11 +19,36 @@ yaml.add_implicit_resolver(
     |[-+]?\\.(?:inf|Inf|INF)
     |\\.(?:nan|NaN|NAN))$''', re.X),
     list(u'-+0123456789.'))
+# the resolver above is only registered for the non-safe loaders (yaml.Loader etc.), i.e. the safe loaders keep the default float semantics
+Loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+""" YAML loader for config files: the libyaml based `yaml.CSafeLoader` if available, `yaml.SafeLoader` otherwise. """
+
+CACHE = os.getenv('SCANLHA_CACHE', os.path.join(os.getenv('XDG_CACHE_HOME', os.path.expanduser('~/.cache')), 'ScanLHA'))
+"""
+Directory of cached configs and builds (environment variable `SCANLHA_CACHE`, default: `~/.cache/ScanLHA`).
+An empty string disables caching of configs.
+"""
+
+CACHE_MAXAGE = float(os.getenv('SCANLHA_CACHE_MAXAGE', 30))
+"""
+Cached configs which have not been used for `CACHE_MAXAGE` days (environment variable `SCANLHA_CACHE_MAXAGE`, default: 30)
+are removed from `ScanLHA.config.CACHE`, at most `CACHE_MAXFILES` (default: 256) of the most recently used ones are kept.
+"""
+CACHE_MAXFILES = 256
+
+class Functions(dict):
+    """ Maps names onto functions given as `'module.function'` which are imported on first access (e.g. numpy). """
+    def __getitem__(self, key):
+        module, function = dict.__getitem__(self, key).rsplit('.', 1)
+        return getattr(import_module(module), function)
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
 
 def intersect(list1,list2):
     """ Returns intersection of two lists """
     return list(set(list1) & set(list2))
-__all__ = ['Config']
+__all__ = ['Config', 'CACHE', 'CACHE_MAXAGE', 'CACHE_MAXFILES']
 class Config(dict):
     r"""
     A dict-like object that carries information about LHA file(s), programs that import/export LHA files, and plots.
@@ -118,21 +143,24 @@ class Config(dict):
                   z-axis: {field: Mdiff, label: '\delta_m'}
 
     """
+    # class attribute, i.e. not pickled together with the instance
+    distribution = Functions({
+            'linear': 'numpy.linspace',
+            'log': 'numpy.logspace',
+            'geom': 'numpy.geomspace',
+            'arange': 'numpy.arange',
+            'uniform': 'numpy.random.uniform',
+            'normal': 'numpy.random.normal'
+            })
 
     def __init__(self,src):
         self.src = src
         self['runner'] = {}
         self['blocks'] = []
-        self.distribution = {
-                'linear': linspace,
-                'log': logspace,
-                'geom': geomspace,
-                'arange': arange,
-                'uniform': uniform,
-                'normal': normal
-                }
         self.valid = True
         self.parameters = {} # directly access a block item via 'parameter'
+        self.blockindex = {} # block name -> block
+        self.lineindex = {} # (block name, id) -> line
         self.load()
 
     def __getitem__(self, key):
@@ -161,7 +189,7 @@ class Config(dict):
         src = self.src if not src else src
         try:
             with open(src, 'r') as c:
-                new = yaml.safe_load(c)
+                new = yaml.load(c, Loader=Loader)
                 for i in intersect(new.keys(), self.keys()):
                     logging.debug('Overwriting config "{}".'.format(i))
                 self.update(new)
@@ -191,13 +219,16 @@ class Config(dict):
                 self[b].update(c[b])
             elif b in c and b not in self:
                 self[b] = c[b]
+        valid = True
         for b in c['blocks']:
             if not self.getBlock(b['block']):
-                self.setBlock(b['block'], b['lines'])
+                valid &= self.setBlock(b['block'], b['lines'])
             else:
                 for line in b['lines']:
-                    self.setLine(b['block'], line)
-        return self.validate()
+                    valid &= self.setLine(b['block'], line)
+        valid &= self.validateRunner()
+        self.valid = self.valid and valid
+        return valid
 
     def getBlock(self, block):
         """ Blocks are stored in a list of dicts. This method is to access blocks by their name.
@@ -225,10 +256,9 @@ class Config(dict):
                  'latex': 'MODSEL.6',
                  'lha': 'MODSEL.values.6'}]}
         """
-        blockpos = [i for i,b in enumerate(self['blocks']) if b['block'] == block]
-        if not blockpos:
-            return
-        return self['blocks'][blockpos[0]]
+        if getattr(self, 'blockindex', None) is None:
+            self.index()
+        return self.blockindex.get(block)
 
     def getLine(self, block, id):
         """ Returns the line with the SLHA id `id` from the block `block`
@@ -245,15 +275,10 @@ class Config(dict):
             'latex': 'MODSEL.1',
             'lha': 'MODSEL.values.1'}
         """
-        b = self.getBlock(block)
-        if not b:
+        if not self.getBlock(block):
             logging.error('Block {} not present in config.'.format(block))
             return
-        lines = b['lines']
-        linepos = [i for i,l in enumerate(lines) if 'id' in l and l['id'] == id]
-        if not linepos:
-            return
-        return lines[linepos[0]]
+        return self.lineindex.get((block, id))
 
     def setBlock(self, block, lines=[]):
         """ Defines a SLHA block `block` with optional lines `lines`
@@ -266,10 +291,16 @@ class Config(dict):
         """
         b = self.getBlock(block)
         if b:
+            for line in b['lines']:
+                self.unindex(block, line)
             b['lines'] = lines
         else:
-            self['blocks'].append({'block':block, 'lines': lines})
-        return self.validate()
+            b = {'block':block, 'lines': lines}
+            self['blocks'].append(b)
+            self.blockindex[block] = b
+        valid = self.validateBlock(b)
+        self.valid = self.valid and valid
+        return valid
 
     def setLine(self, block, line):
         """ Add the `line` to the LHA `block`
@@ -284,77 +315,120 @@ class Config(dict):
             In [4]: c.setLine('SPhenoInput', {'id': 38, 'value': 1})
         """
         b = self.getBlock(block)
-        linepos = [i for i,l in enumerate(b['lines']) if 'id' in l and l['id'] == line['id']]
         if not b:
             return
-        if not linepos:
+        old = self.lineindex.get((block, line['id']))
+        if old is None:
             logging.debug('Appending new line with ID %d.' % line['id'])
             b['lines'].append(line)
+            old = line
         else:
             logging.debug('Updating line with ID %d.' % line['id'])
-            if 'values' in line and 'value' in b['lines'][linepos[0]]:
-                del b['lines'][linepos[0]]['value']
-            b['lines'][linepos[0]].update(line)
-            if line.get('parameter', None) in self.parameters:
-                self.parameters[line['parameter']] = line
-        return self.validate()
+            if 'values' in line and 'value' in old:
+                del old['value']
+            self.unindex(block, old)
+            old.update(line)
+        valid = self.validateLine(block, old)
+        self.valid = self.valid and valid
+        return valid
+
+    def index(self):
+        """ Rebuilds the indexes of blocks and lines, e.g. after modifying `'blocks'` directly. The first occurrence of a block/line is indexed. """
+        self.blockindex = {}
+        self.lineindex = {}
+        for block in self['blocks']:
+            self.blockindex.setdefault(block['block'], block)
+            for line in block['lines']:
+                if 'id' in line:
+                    self.lineindex.setdefault((block['block'], line['id']), line)
+
+    def unindex(self, block, line):
+        """ Removes the `line` of the `block` from the indexes and `parameters`. """
+        if self.lineindex.get((block, line.get('id'))) is line:
+            del self.lineindex[(block, line['id'])]
+        if self.parameters.get(line.get('parameter')) is line:
+            del self.parameters[line['parameter']]
 
     def validate(self):
         """ Validates the `ScanLHA.config.Config` instance and prepares further information attributes such as latex output.
 
-        This method is applied after `ScanLHA.config.Config.load`, `ScanLHA.config.Config.setBlock`, `ScanLHA.config.Config.setLine` and `ScanLHA.config.Config.append`.
+        This method is applied after `ScanLHA.config.Config.load`. `ScanLHA.config.Config.setBlock`, `ScanLHA.config.Config.setLine`
+        and `ScanLHA.config.Config.append` only validate the changed lines (see `ScanLHA.config.Config.validateLine`).
         """
         self.valid = True
         if 'blocks' not in self:
             logging.error("No 'blocks' section in config ")
             self.valid = False
-        # check for double entries
-        lines_seen = []
         self.parameters = {}
-        for block in self['blocks']:
-            if block['block'].count('.') > 0:
-                logging.error('Block {} contains forbiddeni character "."!'.format(block['block']))
+        self.blockindex = {}
+        self.lineindex = {}
+        for block in self.get('blocks', []):
+            if block['block'] in self.blockindex:
+                logging.error('Block {} set twice! Taking the first occurence.'.format(block['block']))
                 self.valid = False
-            for line in block['lines']:
-                if 'id' not in line:
-                    logging.error('No ID set for line entry!')
-                    self.valid = False
-                if [block['block'],line['id']] in lines_seen:
-                    logging.error('Parameter {} in block {} set twice! Taking the first occurence.'.format(line['id'], block['block']))
-                    self.valid = False
-                if 'parameter' not in line:
-                    line['parameter'] = '{}.{}'.format(block['block'],line['id'])
-                elif line['parameter'] in self.parameters.keys():
-                    para = line['parameter'] + '1'
-                    logging.error('Parameter {} set twice! Renaming to {}.'.format(line['parameter'], para))
-                    line['parameter'] = para
-                    self.valid = False
-                self.parameters[line['parameter']] = line
-                if 'value' in line and line.get('dependent', False) and type(line['value']) != str:
-                    print(line.get('dependent', False))
-                    logging.error("'value' with attribute 'dependent' must be string not {} ({}, {}).".format(type(line['value']), block['block'], line['id']))
-                    self.valid = False
-                if 'value' in line and not line.get('dependent', False):
-                    try:
-                        float(line['value'])
-                    except ValueError:
-                        logging.error("'value' must be a number not {} ({}, {}).".format(str(type(line['value'])), block['block'], line['id']))
-                        self.valid = False
-                if 'values' in line and type(line['values']) != list and len(line['values']) < 1:
-                    logging.error("'values' must be a nonemtpy list ({}, {}).".format(block['block'], line['id']))
-                    self.valid = False
-                if 'scan' in line and type(line['scan']) != list and len(line['scan']) < 2:
-                    logging.error("'scan' must be a nonemtpy list ({}, {}).".format(block['block'], line['id']))
-                    self.valid = False
-                if 'latex' not in line:
-                    line['latex'] = line['parameter']
-                if 'lha' not in line:
-                    line['lha'] = '{}.values.{}'.format(block['block'],line['id'])
-                lines_seen.append([block['block'], line['id']])
-
-        # check for other stuff
+            else:
+                self.blockindex[block['block']] = block
+            self.valid &= self.validateBlock(block)
+        self.valid &= self.validateRunner()
+        return self.valid
+
+    def validateBlock(self, block):
+        """ Validates all lines of the `block` (dict) and adds them to the indexes. """
+        valid = True
+        if block['block'].count('.') > 0:
+            logging.error('Block {} contains forbiddeni character "."!'.format(block['block']))
+            valid = False
+        for line in block['lines']:
+            valid &= self.validateLine(block['block'], line)
+        return valid
+
+    def validateLine(self, block, line):
+        """ Validates the `line` (dict) of the block named `block`, sets default attributes and adds it to the indexes. """
+        valid = True
+        if 'id' not in line:
+            logging.error('No ID set for line entry!')
+            return False
+        if self.lineindex.setdefault((block, line['id']), line) is not line:
+            logging.error('Parameter {} in block {} set twice! Taking the first occurence.'.format(line['id'], block))
+            valid = False
+        if 'parameter' not in line:
+            line['parameter'] = '{}.{}'.format(block,line['id'])
+        elif self.parameters.get(line['parameter'], line) is not line:
+            para = line['parameter'] + '1'
+            logging.error('Parameter {} set twice! Renaming to {}.'.format(line['parameter'], para))
+            line['parameter'] = para
+            valid = False
+        self.parameters[line['parameter']] = line
+        if 'value' in line and line.get('dependent', False) and type(line['value']) != str:
+            logging.error("'value' with attribute 'dependent' must be string not {} ({}, {}).".format(type(line['value']), block, line['id']))
+            valid = False
+        if 'value' in line and not line.get('dependent', False):
+            try:
+                float(line['value'])
+            except ValueError:
+                logging.error("'value' must be a number not {} ({}, {}).".format(str(type(line['value'])), block, line['id']))
+                valid = False
+        if 'values' in line and type(line['values']) != list and len(line['values']) < 1:
+            logging.error("'values' must be a nonemtpy list ({}, {}).".format(block, line['id']))
+            valid = False
+        if 'scan' in line and type(line['scan']) != list and len(line['scan']) < 2:
+            logging.error("'scan' must be a nonemtpy list ({}, {}).".format(block, line['id']))
+            valid = False
+        if 'latex' not in line:
+            line['latex'] = line['parameter']
+        if 'lha' not in line:
+            line['lha'] = '{}.values.{}'.format(block,line['id'])
+        return valid
+
+    def validateRunner(self):
+        """ Validates the `'runner'` section. """
         self['runner']['writeevery'] = self['runner'].get('writeevery', 0)
         if not isinstance(self['runner']['writeevery'], int):
             logging.error("runner['writeevery'] must be integer")
-            self.valid = False
-        return self.valid
+            return False
+        # the runners change their working directory
+        if self['runner'].get('archive', False):
+            self['runner']['archive'] = os.path.abspath(self['runner']['archive'])
+        if 'path' in self['runner'].get('library', {}):
+            self['runner']['library']['path'] = os.path.abspath(self['runner']['library']['path'])
+        return True
@@ -0,0 +1,96 @@
+"""
+Vectorized evaluation of python expressions such as `newfields` and `constraints` of `ScanLHA.PlotLHA`.
+
+The names of the `math` module (`tan`, `sqrt`, `atan2`, ...) as well as `abs` and `arg` are bound to their NumPy ufuncs
+(see `ScanLHA.expressions.VECTORIZED`). Expressions like
+
+    DATA['HMIX.values.2'].apply(abs).apply(tan)
+    sqrt(DATA['MASS.values.25']**2 + DATA['MASS.values.35']**2)
+
+are thus evaluated as whole-array operations (`pandas.Series.apply` directly calls ufuncs on the whole column)
+without changing the config.
+
+Note that, unlike the `math` functions, the ufuncs do not raise on domain errors: e.g. `sqrt(-1)` is NaN and `log(0)` is `-inf`.
+This is intended (one invalid point must not abort the whole column). Such values are reported as logged warnings
+and, since comparisons with NaN are False, the corresponding points fail constraints such as `sqrt(x) < 3`.
+`floor`, `ceil` and `trunc` return integers like their `math` counterparts (floats if the column contains NaN or inf).
+"""
+import logging
+import math
+import warnings
+import numpy as np
+
+__all__ = ['VECTORIZED', 'evaluate', 'arg', 'log']
+
+def arg(re, im):
+    """ Argument of the complex number(s) with real part `re` and imaginary part `im` (same as `ScanLHA.PlotLHA.arg`). """
+    # adding 0.0 turns -0.0 into 0.0, i.e. arg(-1, -0.0) = pi and arg(-0.0, 0) = 0
+    return np.arctan2(im + 0.0, re + 0.0)
+
+def log(x, base=None):
+    """ Vectorized `math.log`: natural logarithm of `x` or logarithm to the given `base`. """
+    if base is None:
+        return np.log(x)
+    return np.log(x) / np.log(base)
+
+def integral(ufunc):
+    """ Returns the rounding `ufunc` (e.g. `numpy.floor`) with integer results like `math.floor` (floats if not all results are finite). """
+    def rounded(x):
+        result = ufunc(x)
+        return result.astype(np.int64) if np.all(np.isfinite(result)) else result
+    rounded.__name__ = ufunc.__name__
+    return rounded
+
+ALIASES = {
+        'asin': 'arcsin',
+        'acos': 'arccos',
+        'atan': 'arctan',
+        'atan2': 'arctan2',
+        'asinh': 'arcsinh',
+        'acosh': 'arccosh',
+        'atanh': 'arctanh',
+        'pow': 'power'
+        }
+"""
+Names of the `math` module whose NumPy ufunc has a different name.
+"""
+
+VECTORIZED = {
+        name : getattr(np, ALIASES.get(name, name))
+        for name in dir(math)
+        # math.remainder and numpy.remainder differ, frexp and modf return tuples of arrays
+        if not name.startswith('_') and name != 'remainder' and isinstance(getattr(np, ALIASES.get(name, name), None), np.ufunc)
+        and getattr(np, ALIASES.get(name, name)).nout == 1
+        }
+VECTORIZED.update({'abs': np.absolute, 'arg': arg, 'log': log})
+VECTORIZED.update({ name : integral(getattr(np, name)) for name in ['floor', 'ceil', 'trunc'] })
+"""
+Whole-array replacements for the scalar functions of the `math` module, `abs` and `ScanLHA.PlotLHA.arg`.
+"""
+
+scalar = set()
+""" Expressions which could not be vectorized. """
+
+def evaluate(expr, namespace):
+    """
+    Evaluates the python expression `expr` with the names in `namespace` where the scalar math functions are replaced
+    by `ScanLHA.expressions.VECTORIZED`.
+
+    If this fails, `expr` is evaluated in the unmodified `namespace` (i.e. element by element) and a warning is logged.
+    Floating point errors (e.g. `sqrt(-1)`, `log(0)`, see `ScanLHA.expressions`) are logged as warnings.
+    """
+    if expr not in scalar:
+        try:
+            with warnings.catch_warnings(record=True) as caught, np.errstate(divide='warn', over='warn', invalid='warn', under='ignore'):
+                warnings.simplefilter('always', RuntimeWarning)
+                result = eval(expr, dict(namespace, **VECTORIZED))
+            for message in dict.fromkeys(str(w.message) for w in caught if issubclass(w.category, RuntimeWarning)):
+                logging.warning('Evaluating "{}": {} (results are NaN or inf).'.format(expr, message))
+            for w in caught:
+                if not issubclass(w.category, RuntimeWarning):
+                    warnings.warn_explicit(w.message, w.category, w.filename, w.lineno)
+            return result
+        except Exception as e:
+            logging.warning('Could not vectorize "{}" ({}), evaluating element by element.'.format(expr, e))
+            scalar.add(expr)
+    return eval(expr, namespace)
@@ -0,0 +1,85 @@
+"""
+Server process of the `ScanLHA.runner.LibraryRunner`.
+
+Loads a shared library once using `ctypes` and calls its entry point for each parameter point sent through stdin.
+Since a crashing library (e.g. a segfault) only takes down this process, the runner can mark the point as failed and restart it.
+
+The entry point must have one of the signatures
+
+    int function(const double *in, int nin, double *out, int nout);  /* numeric results */
+    int function(const double *in, int nin, char *out, int size);    /* SLHA results (NUL-terminated string) */
+
+and return `0` on success.
+
+Protocol (little endian): the runner sends the number of parameters (uint32) followed by the parameters (double),
+the server answers with the return value (int32), the size of the result in bytes (uint32) and the result.
+"""
+import ctypes
+import os
+import struct
+import sys
+
+__all__ = ['serve', 'HEADER', 'COUNT']
+
+COUNT = struct.Struct('<I')
+""" Number of input parameters. """
+
+HEADER = struct.Struct('<iI')
+""" Return value of the entry point and size of the result. """
+
+def readexactly(f, size):
+    data = b''
+    while len(data) < size:
+        chunk = f.read(size - len(data))
+        if not chunk:
+            return
+        data += chunk
+    return data
+
+def serve(path, function, nout, size, fin, fout):
+    """
+    Load the library `path` and serve calls of `function` read from `fin` until EOF.
+
+    If `nout` is larger than 0, the `function` returns `nout` numbers, otherwise a string of at most `size` bytes.
+    After loading the library a header with return value and size 0 is sent.
+    """
+    func = getattr(ctypes.CDLL(path), function)
+    func.restype = ctypes.c_int
+    if nout > 0:
+        out = (ctypes.c_double * nout)()
+        func.argtypes = [ctypes.POINTER(ctypes.c_double), ctypes.c_int, ctypes.POINTER(ctypes.c_double), ctypes.c_int]
+    else:
+        out = ctypes.create_string_buffer(size)
+        func.argtypes = [ctypes.POINTER(ctypes.c_double), ctypes.c_int, ctypes.c_char_p, ctypes.c_int]
+    fout.write(HEADER.pack(0, 0))
+    fout.flush()
+    while True:
+        count = readexactly(fin, COUNT.size)
+        if count is None:
+            return
+        nin, = COUNT.unpack(count)
+        payload = readexactly(fin, 8*nin)
+        if payload is None:
+            # the runner went away in the middle of a request
+            return
+        values = (ctypes.c_double * nin).from_buffer_copy(payload)
+        if nout > 0:
+            status = func(values, nin, out, nout)
+            result = bytes(out)
+        else:
+            out[0] = b'\0'
+            status = func(values, nin, out, size)
+            result = out.value
+        fout.write(HEADER.pack(status, len(result)) + result)
+        fout.flush()
+
+if __name__ == '__main__':
+    # the protocol uses the original stdout, anything the library prints goes to stderr
+    fout = os.fdopen(os.dup(1), 'wb')
+    os.dup2(2, 1)
+    path, function, nout, size = sys.argv[1:5]
+    try:
+        serve(path, function, int(nout), int(size), sys.stdin.buffer, fout)
+    except (OSError, AttributeError) as e:
+        sys.stderr.write('Could not load {} from {}: {}\n'.format(function, path, e))
+        sys.exit(1)
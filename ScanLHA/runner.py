@@ -1,19 +1,28 @@
 """
 Control programs that need (S)LHA input.
 """
-from collections import defaultdict
 import logging
-from subprocess import Popen, STDOUT, PIPE, DEVNULL, TimeoutExpired
-from .slha import parseSLHA
+from subprocess import Popen, STDOUT, PIPE, TimeoutExpired
+from .slha import parseSLHA, loadSLHA, SLHATemplate
+from .archive import Archive
+from .config import CACHE
+from .library import COUNT, HEADER
 from random import randrange,randint
 import os
+import struct
+import sys
+from select import select
 from sys import exit
+from time import monotonic
 from math import * # noqa: F403 F401
-from shutil import copy2,copytree, rmtree
+from shutil import copy2,copytree, copystat, rmtree
 from tempfile import mkdtemp, gettempdir
-from pandas import json_normalize
+from hashlib import sha256
+from fcntl import flock, LOCK_EX, LOCK_SH, LOCK_NB
+from numpy import array
+from pandas import json_normalize, concat, DataFrame
 
-__all__ = ['RUNNERS', 'BaseRunner', 'SLHARunner', 'MicrOmegas']
+__all__ = ['RUNNERS', 'BaseRunner', 'SLHARunner', 'MicrOmegas', 'LibraryRunner']
 
 RUNNERS = {}
 """
@@ -43,9 +52,39 @@ To use that runner, set
 
 in your config.
 
+Runners which can compute many points at once (e.g. with NumPy) may define `execute_batch` instead of (or in addition to) `execute`:
+
+    class MyVectorizedRunner(BaseRunner):
+        batch = 1000 # default of runner['batch']
+
+        def execute_batch(self, params):
+            # `params` is a dict of arrays, one entry per point
+            x = params['MSUSY']
+            return {'MASS.values.25': numpy.sqrt(x), ...}
+
+The scans then pass `runner['batch']` points at once (see `ScanLHA.runner.BaseRunner.runBatch`).
+
 The default runner for each scan is the `ScanLHA.runner.SLHARunner`.
 """
 
+def treehash(paths, extra=()):
+    """
+    Returns a (short) hash of the absolute `paths` and the names, sizes and modification times of all files in them
+    as well as the tuple of strings `extra`.
+    """
+    key = sha256(repr(tuple(os.path.abspath(p) for p in paths) + tuple(extra)).encode())
+    for path in paths:
+        walk = os.walk(path) if os.path.isdir(path) else [(os.path.dirname(path), [], [os.path.basename(path)])]
+        for root, dirs, files in walk:
+            dirs.sort()
+            for f in sorted(files):
+                try:
+                    stat = os.lstat(os.path.join(root, f))
+                except FileNotFoundError:
+                    continue
+                key.update(repr((os.path.relpath(os.path.join(root, f), path), stat.st_size, stat.st_mtime_ns)).encode())
+    return key.hexdigest()[:16]
+
 class Runner_Register(type):
     """
     Add each new runner to the `RUNNERS` variable.
@@ -62,6 +101,9 @@ class BaseRunner(metaclass=Runner_Register):
 
     Needs a Config instance for initialization.
     """
+    batch = 1
+    """ Default of `runner['batch']`, the number of points passed to `ScanLHA.runner.BaseRunner.runBatch` at once. """
+
     def __init__(self,conf):
         """
         Basic initialization.
@@ -74,12 +116,22 @@ class BaseRunner(metaclass=Runner_Register):
         self.tmp = False
         self.initialized = False
         self.id = randint(10000,99999)
+        self.users = None
+        self.batchsize = max(1, int(conf.get('batch', self.batch)))
+        """ Number of points passed to `ScanLHA.runner.BaseRunner.runBatch` at once by the scans (`runner['batch']`, default: `batch`) """
 
     def makedirs(self, tocopy=[]):
         """
           * Create temporary directories (default: `/dev/shm/run<runnerid>`).
 
-          * Copy all binaries listed in `self.config['binaries']` to the temporary directory
+          * Copy all binaries listed in `self.config['binaries']` and the files/directories listed in `self.config['copy']`
+            (e.g. data tables) to the temporary directory.
+
+        With `runner['staging']` set to `'symlink'` or `'hardlink'` (default: `'copy'`), the files are copied only once into the
+        shared directory `<tmpfs>/staged` (see `ScanLHA.runner.BaseRunner.stage`) and the temporary directory of each runner
+        only contains (writable) directories and links to the shared files (see `ScanLHA.runner.BaseRunner.link`).
+        With `runner['cleanup']`, the last runner using the staged files removes them (see `ScanLHA.runner.BaseRunner.unstage`),
+        set `runner['keep_staged']` to keep them in `<tmpfs>/staged` for subsequent scans.
         """
         if 'tmpfs' not in self.config:
             if os.path.exists('/dev/shm/'):
@@ -88,11 +140,16 @@ class BaseRunner(metaclass=Runner_Register):
                 self.config['tmpfs'] = mkdtemp()
         if self.config['tmpfs'] == '$TMP':
             self.config['tmpfs'] = gettempdir()
+        staging = self.config.get('staging', 'copy')
+        if staging not in ['copy', 'symlink', 'hardlink']:
+            logging.error("runner['staging'] must be one of 'copy', 'symlink' or 'hardlink'.")
+            exit(1)
         self.rundir = os.path.join(self.config['tmpfs'], 'run%d' % self.id)
         if not os.path.exists(self.rundir):
             logging.debug('Creating temporary directory {}.'.format(self.rundir))
             os.makedirs(self.rundir)
-        tocopy = tocopy if type(tocopy) == list else [tocopy]
+        tocopy = list(tocopy) if type(tocopy) == list else [tocopy]
+        tocopy += self.config.get('copy', [])
         if 'binary' in self.config:
             self.binaries = [os.path.join(self.rundir, os.path.basename(self.config['binary'])), '{input_file}', '{output_file}']
             tocopy.append(self.config['binary'])
@@ -106,19 +163,116 @@ class BaseRunner(metaclass=Runner_Register):
                     exit(1)
                 tocopy.append(binary[0])
                 self.binaries.append([os.path.join(self.rundir, os.path.basename(binary[0]))] + binary[1:])
+        tocopy = list(dict.fromkeys(tocopy))
         for f in tocopy:
             if not os.path.exists(f):
                 logging.error('File/dir {} not found!'.format(f))
                 exit(1)
-            logging.debug('Copying {} into temporary directory {}.'.format(f, self.rundir))
-            if os.path.isdir(f):
-                copytree(f, os.path.join(self.rundir, os.path.basename(f)))
-            else:
-                copy2(f, self.rundir)
+        if staging == 'copy':
+            for f in tocopy:
+                logging.debug('Copying {} into temporary directory {}.'.format(f, self.rundir))
+                if os.path.isdir(f):
+                    copytree(f, os.path.join(self.rundir, os.path.basename(f)))
+                else:
+                    copy2(f, self.rundir)
+        elif tocopy:
+            shared = self.stage(tocopy)
+            linked, copied = 0, 0
+            for f in tocopy:
+                name = os.path.basename(os.path.normpath(f))
+                l, c = self.link(os.path.join(shared, name), os.path.join(self.rundir, name), staging)
+                linked += l
+                copied += c
+            logging.info('Staged {} into {}: {:.1f} MB linked (saved), {:.1f} MB copied.'.format(
+                ', '.join(tocopy), self.rundir, linked/1e6, copied/1e6))
+            self.staged = { 'linked': linked, 'copied': copied }
+            """ Number of bytes `linked` (i.e. saved) and `copied` into the temporary directory (staging mode only) """
         logging.debug('Changing directory')
         os.chdir(self.rundir)
         self.tmp = True
 
+    def stage(self, tocopy):
+        """
+        Copy the files/directories `tocopy` once into the shared directory `<tmpfs>/staged/<key>` where the key is a hash
+        of their paths, sizes and modification times (see `ScanLHA.runner.treehash`).
+
+        Concurrent runners wait (file lock) until the files are staged.
+
+        Returns the shared directory.
+        """
+        shared = os.path.join(self.config['tmpfs'], 'staged', treehash(tocopy))
+        os.makedirs(os.path.dirname(shared), exist_ok=True)
+        with open(shared + '.lock', 'w') as lock:
+            flock(lock, LOCK_EX)
+            if not os.path.isdir(shared):
+                logging.debug('Staging {} into {}.'.format(', '.join(tocopy), shared))
+                tmp = '{}.{}'.format(shared, os.getpid())
+                if os.path.exists(tmp):
+                    rmtree(tmp)
+                os.makedirs(tmp)
+                for f in tocopy:
+                    if os.path.isdir(f):
+                        copytree(f, os.path.join(tmp, os.path.basename(os.path.normpath(f))), symlinks=True)
+                    else:
+                        copy2(f, tmp)
+                os.rename(tmp, shared)
+            # register this runner as user of the staged files (see `ScanLHA.runner.BaseRunner.unstage`)
+            self.users = open(shared + '.users', 'a')
+            flock(self.users, LOCK_SH)
+        return shared
+
+    def unstage(self):
+        """
+        Remove the files staged by `ScanLHA.runner.BaseRunner.stage` if this runner is the last one using them
+        (unless `runner['keep_staged']` is set).
+        """
+        users, self.users = self.users, None
+        if users is None:
+            return
+        shared = users.name[:-len('.users')]
+        try:
+            if self.config.get('keep_staged', False):
+                return
+            with open(shared + '.lock', 'w') as lock:
+                flock(lock, LOCK_EX)
+                try:
+                    flock(users, LOCK_EX | LOCK_NB)
+                except BlockingIOError:
+                    return
+                logging.debug('Removing staged files {}.'.format(shared))
+                rmtree(shared, ignore_errors=True)
+                os.remove(users.name)
+        finally:
+            users.close()
+
+    def link(self, src, dst, mode):
+        """
+        Recreate the directory tree of `src` in `dst` where all files are linked (`mode`: `'symlink'` or `'hardlink'`) to the files in `src`.
+        Files are copied if they can not be linked (e.g. hardlinks across file systems).
+
+        Returns the number of bytes `(linked, copied)`.
+        """
+        if os.path.isdir(src) and not os.path.islink(src):
+            os.makedirs(dst, exist_ok=True)
+            copystat(src, dst)
+            linked, copied = 0, 0
+            for entry in os.listdir(src):
+                l, c = self.link(os.path.join(src, entry), os.path.join(dst, entry), mode)
+                linked += l
+                copied += c
+            return linked, copied
+        size = os.lstat(src).st_size
+        try:
+            if mode == 'hardlink':
+                os.link(src, dst, follow_symlinks=False)
+            else:
+                os.symlink(src, dst)
+            return size, 0
+        except OSError as e:
+            logging.debug('Could not link {} ({}), copying.'.format(src, e))
+            copy2(src, dst, follow_symlinks=False)
+            return 0, size
+
     def cleanup(self):
         """ remove temporary directory """
         if not self.config.get('cleanup', False) or not self.tmp:
@@ -131,6 +285,7 @@ class BaseRunner(metaclass=Runner_Register):
             logging.error('Directory {} does not exist.'.format(self.rundir))
         except:
             logging.error('Could not remove directory {}.'.format(self.rundir))
+        self.unstage()
 
     def __del__(self):
         self.cleanup()
@@ -154,30 +309,43 @@ class BaseRunner(metaclass=Runner_Register):
             if err:
                 logging.error('file {} missing?'.format(f))
 
-    def runBinary(self, args, cwd = None): # noqa
+    def runBinary(self, args, cwd = None, stdin = None, timeout = None): # noqa
         """
         Execute `args` using `Popen`.
 
-        Returns `(stdout, stderr)`.
+        Returns `(stdout, stderr)`, the exit code is stored in `self.returncode`.
 
-        `stderr` is set to `'Timeout'` if `self.timeout` is exceeded.
+        If the string `stdin` is given, it is streamed into the process and `stderr` is kept apart from the (unstripped) `stdout`.
+        Otherwise `stderr` is redirected into `stdout`.
+
+        `stderr` is set to `'Timeout'` if `timeout` (default: `self.timeout`) is exceeded.
         """
 
-        proc = Popen(args, cwd=cwd, stderr=STDOUT, stdout=PIPE)
+        if stdin is None:
+            proc = Popen(args, cwd=cwd, stderr=STDOUT, stdout=PIPE)
+        else:
+            proc = Popen(args, cwd=cwd, stdin=PIPE, stderr=PIPE, stdout=PIPE)
+            stdin = stdin.encode('utf8')
         try:
-            stdout, stderr = proc.communicate(timeout=self.timeout)
+            stdout, stderr = proc.communicate(input=stdin, timeout=timeout if timeout else self.timeout)
         except TimeoutExpired:
+            proc.kill()
+            proc.communicate()
+            self.returncode = None
             stdout = ''
             stderr = 'Timeout'
             return stdout, stderr
-        stdout = stdout.decode('utf8').strip() if stdout else ''
+        self.returncode = proc.returncode
+        stdout = stdout.decode('utf8') if stdout else ''
+        stdout = stdout.strip() if stdin is None else stdout
         stderr = stderr.decode('utf8').strip() if stderr else ''
 
         return stdout, stderr
 
     def execute(self, params):
         """ This method specifies what the runner should do with the single data pint `params`. """
-        pass
+        if hasattr(self, 'execute_batch'):
+            return self.runBatch([params]).iloc[0].to_dict()
 
     def run(self, params):
         """
@@ -189,29 +357,85 @@ class BaseRunner(metaclass=Runner_Register):
         """
         return json_normalize(self.execute(params))
 
+    def runBatch(self, points):
+        """
+        Runs the list of parameter dicts `points` and returns their results as one DataFrame with one row per point
+        (see `ScanLHA.runner.BaseRunner.run`).
+
+        Used by the scans, which pass `self.batchsize` points at once. Runners that can process many points at once overwrite this
+        or define the method `execute_batch(params)`: it gets the dict `params` of arrays (one value per point) for each parameter and
+        returns a DataFrame or a (nested) dict of arrays with one value per point (or scalars common to all points).
+        If the number of results does not match, all points of the batch fail (i.e. only have a `log` entry).
+        """
+        if not points:
+            return DataFrame()
+        if not hasattr(self, 'execute_batch'):
+            return concat([ self.run(p) for p in points ], ignore_index=True)
+        params = { k : array([ p[k] for p in points ]) for k in points[0] }
+        result = self.execute_batch(params)
+        try:
+            if not isinstance(result, DataFrame):
+                result = DataFrame(self.flatten(result), index=range(len(points)))
+            if len(result) != len(points):
+                raise ValueError('{} results'.format(len(result)))
+        except ValueError as e:
+            error = 'execute_batch returned the wrong number of results for {} points ({}).'.format(len(points), e)
+            logging.error(error)
+            return DataFrame({'log': [error]*len(points)})
+        return result.reset_index(drop=True)
+
+    @staticmethod
+    def flatten(result, prefix=''):
+        """ Flattens the nested dict `result` into the column names used by `json_normalize` (e.g. `'MASS.values.25'`). """
+        columns = {}
+        for k,v in (result or {}).items():
+            if isinstance(v, dict):
+                columns.update(BaseRunner.flatten(v, '{}{}.'.format(prefix, k)))
+            else:
+                columns['{}{}'.format(prefix, k)] = v
+        return columns
+
 class SLHARunner(BaseRunner):
     """
     Runner that runs binaries with (S)LHA input/output.
     """
     def __init__(self,conf):
         """
-        `self.tpl=conf['template']` should be a string containing patterns
-        compatible with `conf['template'].format_map(params)` for a
-        given set of parameters `params`.
+        `conf['template']` should be a string containing `{%parameter%}` patterns
+        (see `ScanLHA.slha.genSLHA`) for a given set of parameters `params`.
+        It is compiled once into `self.tpl`, a `ScanLHA.slha.SLHATemplate`.
         """
         super().__init__(conf)
         self.timeout = conf.get('timeout', 10)
         """ Timeout for Popen """
-        self.tpl = conf['template']
+        self.tpl = self.compile(conf)
         self.blocks = conf.get('getblocks', [])
+        self.archive = Archive(conf['archive'], conf.get('archive_format', 'xz')) if conf.get('archive', False) else None
+        """ `ScanLHA.archive.Archive` of the raw outputs if `runner['archive']` is set """
         self.makedirs()
         self.initialized = True
 
-    def prepare(self, params):
+    @staticmethod
+    def compile(conf):
+        """
+        Compile `conf['template']` into a `ScanLHA.slha.SLHATemplate`.
+
+        If the scan announced its parameters in `conf['template_parameters']`, missing parameters are reported here
+        rather than for each single point.
+        """
+        try:
+            return SLHATemplate(conf['template'], conf.get('template_parameters', None))
+        except KeyError as e:
+            logging.error('Could not compile SLHA template: {}'.format(e))
+            exit(1)
+
+    def prepare(self, params, slha=None):
         """
         Generate input and output file names.
 
-        Write the input file for the parameter dict `params` using the template `self.tpl`.
+        Write the input file for the parameter dict `params` using the template `self.tpl` (or the already rendered input `slha`).
+        If `runner['copy_input']` is set to True (default: False), it is written to the output file as well
+        (e.g. if the input is already a spectrum that is processed by binaries which modify `{output_file}`, see `ScanLHA.scan.FileScan`).
 
         Returns the filenames `('inputfile', 'outputfile', 'logfile')`.
         """
@@ -220,13 +444,17 @@ class SLHARunner(BaseRunner):
         fout = os.path.join(self.rundir, fname + '.out')
         flog = os.path.join(self.rundir, fname + '.log')
 
-        with open(fin, 'w') as inputf:
+        if slha is None:
             try:
-                params = defaultdict(str, { '%{}%'.format(p) : v for p,v in params.items() })
-                inputf.write(self.tpl.format_map(params))
+                slha = self.tpl.render(params)
             except KeyError:
                 logging.error("Could not substitute {}.".format(params))
                 return None, None, None
+        with open(fin, 'w') as inputf:
+            inputf.write(slha)
+        if self.config.get('copy_input', False):
+            with open(fout, 'w') as outputf:
+                outputf.write(slha)
         return fin, fout, flog
 
     def read(self, fout):
@@ -243,6 +471,63 @@ class SLHARunner(BaseRunner):
             return {}
         return slha
 
+    def readPipe(self, contents):
+        """ Same as `ScanLHA.runner.SLHARunner.read` but for SLHA `contents` read from a pipe. """
+        if not contents:
+            return {}
+
+        slha = loadSLHA(contents, self.blocks, source='output of pipe')
+        if self.config.get('constraints', False) and not self.constraints(slha):
+            return {}
+        return slha
+
+    def executePipe(self, params):
+        """
+        Pipe mode of `ScanLHA.runner.SLHARunner.execute` (`runner['pipe'] = True`), for binaries that read SLHA from stdin and write SLHA to stdout.
+
+        The rendered template is streamed into the first binary. The stdout of each binary is parsed and streamed into the next one.
+        Binaries that expect file names can be given `{input_file}` and `{output_file}` which are replaced by `/dev/stdin` and `/dev/stdout`.
+        No files are written, i.e. the options `remove_slha` and `logfiles` have no effect.
+        """
+        try:
+            slha_in = self.tpl.render(params)
+        except KeyError:
+            logging.error("Could not substitute {}.".format(params))
+            return {'log': 'Error preparing input for parameters: {}'.format(params)}
+        slha_base = {
+                'log_stdout': '',
+                'log_stderr': '',
+                'input_parameters': params,
+                'input_file': '/dev/stdin',
+                'output_file': '/dev/stdout',
+                'log_file': ''
+                }
+
+        slha = {}
+        for i,binary in enumerate(self.binaries):
+            if i and not slha and self.config.get('all_constraints', False):
+                continue
+            if type(binary) == list:
+                binary = [ b.format(**slha_base) for b in binary ]
+            else:
+                binary = [binary]
+            logging.debug("executing {} (pipe)".format(' '.join(binary)))
+            stdout, stderr = self.runBinary(binary, stdin=slha_in)
+            slha_base['log_stderr'] += stderr
+            slha = self.readPipe(stdout)
+            if stdout:
+                # pass the output on to the next binary
+                slha_in = stdout
+
+        if self.archive is not None and (slha or self.config.get('keep_log', False)):
+            slha.update(self.archive.append(slha_in))
+
+        if self.config.get('keep_log', False):
+            slha.update(slha_base)
+            log = 'parameters: {input_parameters}\nstderr: {log_stderr}\n\n'.format(**slha_base)
+            logging.debug(log)
+        return slha
+
     def execute(self, params):
         """
         * Prepare all files for the run with the parameters `params` (dict).
@@ -257,33 +542,179 @@ class SLHARunner(BaseRunner):
             ]
 
         The patterns `{input_file}`, `{output_file}` and `{log_file}` are available and are replaced by the result of `ScanLHA.runner.SLHARunner.prepare`.
+
+        If `runner['pipe']` is set to True (default: False), no files are used, see `ScanLHA.runner.SLHARunner.executePipe`.
+
+        If `runner['archive']` is set, the raw output of each point (that is stored) is appended to a compressed archive before it is removed
+        (see `ScanLHA.archive`).
+
+        Binaries which process many points at once are described in `ScanLHA.runner.SLHARunner.executeMany`.
         """
-        fin, fout, flog = self.prepare(params)
-        if not all([fin, fout, flog]):
-            return {'log': 'Error preparing files for parameters: {parameters}'.format(params)}
-        slha_base = {
+        if self.config.get('pipe', False):
+            return self.executePipe(params)
+        return self.executeMany([params])[0]
+
+    def runBatch(self, points):
+        """ Runs the list of parameter dicts `points` in batches of `runner['batch']` points (see `ScanLHA.runner.SLHARunner.executeMany`). """
+        if self.config.get('pipe', False):
+            return super().runBatch(points)
+        results = []
+        for i in range(0, len(points), self.batchsize):
+            results += [ json_normalize(r) for r in self.executeMany(points[i:i+self.batchsize]) ]
+        return concat(results, ignore_index=True) if results else DataFrame()
+
+    @staticmethod
+    def batchmode(binary):
+        """ Returns `'files'`, `'concatenated'` or None, the way in which the `binary` processes many points at once. """
+        if type(binary) != list:
+            return
+        if any(b in ['{input_files}', '{output_files}'] for b in binary):
+            return 'files'
+        if any('{batch_input}' in b or '{batch_output}' in b for b in binary):
+            return 'concatenated'
+
+    def runPoint(self, binary, slha_base):
+        """ Run the `binary` for the single point `slha_base` (see `ScanLHA.runner.SLHARunner.execute`). """
+        if self.batchmode(binary):
+            return self.runMany(binary, [slha_base])
+        if type(binary) == list:
+            # insert file names into the executable command
+            binary = [ b.format(**slha_base) for b in binary ]
+        else:
+            binary = [binary]
+        logging.debug("executing {}".format(' '.join(binary)))
+        stdout, stderr = self.runBinary(binary)
+        slha_base['log_stderr'] += stderr
+        slha_base['log_stdout'] += stdout
+        return True
+
+    def runMany(self, binary, bases):
+        """
+        Run the `binary` once for all points `bases` (see `ScanLHA.runner.SLHARunner.executeMany`).
+
+        Returns False if the invocation failed.
+        """
+        separator = self.config.get('batch_separator', '\n#ENDOFSLHA\n')
+        if self.batchmode(binary) == 'files':
+            args = []
+            for b in binary:
+                if b == '{input_files}':
+                    args += [ base['input_file'] for base in bases ]
+                elif b == '{output_files}':
+                    args += [ base['output_file'] for base in bases ]
+                else:
+                    args.append(b)
+        else:
+            fname = os.path.join(self.rundir, str(randrange(10**10)))
+            files = { 'batch_input': fname + '.batch.in', 'batch_output': fname + '.batch.out' }
+            documents = []
+            for base in bases:
+                # the output of the preceding binary or the input
+                current = base['output_file'] if os.path.isfile(base['output_file']) else base['input_file']
+                with open(current, 'r') as f:
+                    documents.append(f.read())
+            with open(files['batch_input'], 'w') as f:
+                f.write(separator.join(documents))
+            args = [ b.format(**files) for b in binary ]
+        try:
+            logging.debug("executing {} ({} points)".format(' '.join(args), len(bases)))
+            stdout, stderr = self.runBinary(args, timeout=self.timeout*len(bases))
+            for base in bases:
+                base['log_stderr'] += stderr
+                base['log_stdout'] += stdout
+            if self.returncode != 0:
+                logging.debug('{} failed for {} points'.format(args[0], len(bases)))
+                return False
+            if self.batchmode(binary) == 'files':
+                return True
+            # tools may write the output into the input file
+            output = files['batch_output'] if any('{batch_output}' in b for b in binary) else files['batch_input']
+            try:
+                with open(output, 'r') as f:
+                    documents = [ d for d in f.read().split(separator) if d.strip() ]
+            except FileNotFoundError:
+                documents = []
+        finally:
+            if self.batchmode(binary) == 'concatenated':
+                self.removeFile(files['batch_input'], err=False)
+                self.removeFile(files['batch_output'], err=False)
+        if len(documents) != len(bases):
+            logging.debug('{} returned {} outputs for {} points'.format(args[0], len(documents), len(bases)))
+            return False
+        for base,document in zip(bases, documents):
+            with open(base['output_file'], 'w') as f:
+                f.write(document)
+        return True
+
+    def executeMany(self, points):
+        """
+        Same as `ScanLHA.runner.SLHARunner.execute` for the list of parameter dicts `points` which returns a list of results.
+
+        Binaries in `runner['binaries']` can process all points (of the current batch, `runner['batch']`, default: 1) in one invocation:
+
+          * if one of their arguments is `{input_files}` or `{output_files}`, it is replaced by the list of input/output files of all points,
+          * the patterns `{batch_input}` and `{batch_output}` are replaced by files which contain the SLHA documents of all points
+            (the output of the preceding binary or the input) joined by `runner['batch_separator']` (default: `'\\n#ENDOFSLHA\\n'`).
+            The output (if `{batch_output}` is not given, the modified `{batch_input}`) is split and written to the `{output_file}` of each point.
+
+        Example:
+
+            runner:
+              batch: 100
+              binaries:
+                - ['./SPheno', '{input_file}', '{output_file}'] # once per point
+                - ['./tool', '{batch_input}', '{batch_output}'] # once per batch
+
+        If the invocation fails (exit code, timeout which is `runner['timeout']` times the number of points, number of outputs),
+        all points of the batch are run one by one.
+        """
+        results = [ None for p in points ]
+        bases = []
+        try:
+            inputs = self.tpl.render_batch(points)
+        except KeyError:
+            # render the points one by one to report the faulty ones
+            inputs = [ None for p in points ]
+        for i,params in enumerate(points):
+            fin, fout, flog = self.prepare(params, inputs[i])
+            if not all([fin, fout, flog]):
+                results[i] = {'log': 'Error preparing files for parameters: {}'.format(params)}
+                continue
+            bases.append((i, {
                 'log_stdout': '',
                 'log_stderr': '',
                 'input_parameters': params,
                 'input_file': fin,
                 'output_file': fout,
                 'log_file': flog
-                }
+                }))
+        slha = { i : True for i,_ in bases }
 
-        slha = True
         for binary in self.binaries:
-            if not slha and self.config.get('all_constraints', False):
-                continue
-            if type(binary) == list:
-                # insert file names into the executable command
-                binary = [ b.format(**slha_base) for b in binary ]
+            active = [ (i,base) for i,base in bases if slha[i] or not self.config.get('all_constraints', False) ]
+            if not active:
+                break
+            if self.batchmode(binary) and len(active) > 1:
+                if not self.runMany(binary, [ base for _,base in active ]):
+                    logging.info('Batch of {} points failed, running them one by one.'.format(len(active)))
+                    for i,base in active:
+                        self.runPoint(binary, base)
             else:
-                binary = [binary]
-            logging.debug("executing {}".format(' '.join(binary)))
-            stdout, stderr = self.runBinary(binary)
-            slha_base['log_stderr'] += stderr
-            slha_base['log_stdout'] += stdout
-            slha = self.read(fout)
+                for i,base in active:
+                    self.runPoint(binary, base)
+            for i,base in active:
+                slha[i] = self.read(base['output_file'])
+
+        for i,base in bases:
+            results[i] = self.finish(slha[i], base)
+        return results
+
+    def finish(self, slha, slha_base):
+        """ Archive and remove the files of the point `slha_base` and add the logs to its result `slha`. """
+        fin, fout, flog = slha_base['input_file'], slha_base['output_file'], slha_base['log_file']
+        if self.archive is not None and (slha or self.config.get('keep_log', False)) and os.path.isfile(fout):
+            with open(fout, 'r') as outputf:
+                slha.update(self.archive.append(outputf.read()))
 
         if self.config.get('remove_slha', True):
             self.removeFile(fin)
@@ -299,11 +730,151 @@ class SLHARunner(BaseRunner):
             logging.debug(log)
         return slha
 
+class LibraryRunner(BaseRunner):
+    """
+    Runner that calls an entry point of a shared library for each parameter point instead of running binaries.
+
+    The library is loaded once per runner (using `ctypes`) in a server process (see `ScanLHA.library`) which is restarted if it
+    crashes or exceeds `runner['timeout']`, i.e. a segfault only fails the current point.
+
+        runner:
+          type: LibraryRunner
+          library:
+            path: './libspectrum.so'
+            function: 'spectrum' # entry point, see `ScanLHA.library`
+            parameters: ['MSUSY', 'TanBeta'] # order of the input array (default: the scanned and dependent parameters)
+            outputs: ['MASS.values.25', 'MASS.values.35'] # names of the numeric results
+            # or, for an entry point that writes SLHA output into a buffer of `size` bytes:
+            # slha: true
+            # size: 1048576
+
+    Numeric results are stored with the names in `outputs` (the `constraints` see them as e.g. `result['MASS.values.25']`),
+    SLHA results are parsed with `ScanLHA.slha.loadSLHA` (and `getblocks`).
+    Points for which the entry point returns a value other than 0 (or crashes) are marked as failed.
+    """
+    def __init__(self, conf):
+        super().__init__(conf)
+        self.timeout = conf.get('timeout', 10)
+        """ Timeout for a single call """
+        self.blocks = conf.get('getblocks', [])
+        library = conf.get('library', {})
+        if 'path' not in library or 'function' not in library:
+            logging.error('need to specify the "library" config with "path" and "function"')
+            exit(1)
+        if not library.get('slha', False) and not library.get('outputs', []):
+            logging.error('need to specify the numeric "outputs" of the library (or set "slha: true")')
+            exit(1)
+        self.library = library
+        self.parameters = library.get('parameters', conf.get('template_parameters', []))
+        self.outputs = [] if library.get('slha', False) else library['outputs']
+        self.proc = None
+        self.initialized = self.start()
+
+    def start(self):
+        """ Start the server process which loads the library. Returns True on success. """
+        self.stop()
+        env = dict(os.environ)
+        # ScanLHA may not be installed (e.g. PYTHONPATH or runner_plugins)
+        env['PYTHONPATH'] = os.pathsep.join([os.path.dirname(os.path.dirname(os.path.abspath(__file__)))] + [ p for p in [env.get('PYTHONPATH')] if p ])
+        self.proc = Popen([sys.executable, '-m', 'ScanLHA.library', self.library['path'], self.library['function'],
+            str(len(self.outputs)), str(self.library.get('size', 1 << 20))], stdin=PIPE, stdout=PIPE, env=env)
+        if self.receive(HEADER.size, monotonic() + max(self.timeout, 60)) is None:
+            logging.error('Could not load library {}.'.format(self.library['path']))
+            self.stop()
+            return False
+        return True
+
+    def stop(self):
+        """ Stop the server process. """
+        if self.proc is None:
+            return
+        if self.proc.poll() is None:
+            self.proc.kill()
+        self.proc.wait()
+        self.proc.stdin.close()
+        self.proc.stdout.close()
+        self.proc = None
+
+    def cleanup(self):
+        self.stop()
+        super().cleanup()
+
+    def receive(self, size, deadline):
+        """ Read `size` bytes from the server process until the `deadline` (`time.monotonic`). Returns None on EOF or timeout. """
+        fd = self.proc.stdout.fileno()
+        data = b''
+        while len(data) < size:
+            if not select([fd], [], [], max(deadline - monotonic(), 0))[0]:
+                return
+            chunk = os.read(fd, size - len(data))
+            if not chunk:
+                return
+            data += chunk
+        return data
+
+    def call(self, values):
+        """
+        Call the entry point with the list of numbers `values`.
+
+        Returns the return value of the entry point and the result (bytes) or raises a `RuntimeError` if the server process failed.
+        """
+        if self.proc is None and not self.start():
+            raise RuntimeError('library not loaded')
+        deadline = monotonic() + self.timeout
+        try:
+            self.proc.stdin.write(COUNT.pack(len(values)) + struct.pack('<%dd' % len(values), *values))
+            self.proc.stdin.flush()
+        except BrokenPipeError:
+            pass
+        header = self.receive(HEADER.size, deadline)
+        if header is not None:
+            status, size = HEADER.unpack(header)
+            result = self.receive(size, deadline)
+            if result is not None:
+                return status, result
+        if monotonic() >= deadline:
+            self.stop()
+            raise RuntimeError('Timeout')
+        # EOF, i.e. the server process died
+        code = self.proc.wait()
+        self.stop()
+        raise RuntimeError('library crashed' + (' (signal {})'.format(-code) if code < 0 else ' (exit code {})'.format(code)))
+
+    def execute(self, params):
+        """ Call the library with the parameters `params` (dict), see `ScanLHA.runner.LibraryRunner`. """
+        log = ''
+        result = {}
+        try:
+            status, output = self.call([ float(params[p]) for p in self.parameters ])
+            if status != 0:
+                log = 'library returned {}'.format(status)
+            elif self.outputs:
+                result = dict(zip(self.outputs, struct.unpack('<%dd' % len(self.outputs), output)))
+            else:
+                result = loadSLHA(output.decode('utf8'), self.blocks, source='output of library')
+        except KeyError as e:
+            log = 'No value for parameter {}'.format(e)
+        except RuntimeError as e:
+            log = str(e)
+        if log:
+            logging.debug('{} for parameters {}'.format(log, params))
+        if result and self.config.get('constraints', False) and not self.constraints(result):
+            result = {}
+        if self.config.get('keep_log', False):
+            result.update({ 'log': log, 'input_parameters': params })
+        return result
+
 class MicrOmegas(SLHARunner):
     """
     Runner for MicrOmegas based on the `ScanLHA.runner.SLHARunner`.
 
-    Works exactly the same as `ScanLHA.runner.SLHARunner` but builds the MicrOmegas src files in the temporary runner directory during initialization.
+    Works exactly the same as `ScanLHA.runner.SLHARunner` but sets up a MicrOmegas installation in the temporary runner directory during initialization.
+
+    MicrOmegas is built only once into a shared cache (see `ScanLHA.runner.MicrOmegas.build`), each runner gets a relocated
+    lightweight copy with its own `work` directory for the processes which MicrOmegas generates at runtime
+    (see `ScanLHA.runner.MicrOmegas.relocate`).
+    With `micromegas['private_work']: false`, the runners only link (or copy, depending on `runner['staging']`) the cached executable
+    into their temporary directory and share the `work` directory of the cached build, i.e. the calls are serialized by a file lock.
     """
 
     def __init__(self,conf):
@@ -318,6 +889,9 @@ class MicrOmegas(SLHARunner):
                     modelname: 'SplitNMSSM' # model-dir to join (run make clean before)
                     main: 'CalcOmegaDD.cpp' # cpp file to build
                     exec: ['CalcOmegaDD', '{input_file}'] # entry for runner['binaries']
+                    cache: '~/.cache/ScanLHA/micromegas' # optional, directory of the shared builds (default: `ScanLHA.config.CACHE`/micromegas)
+                    jobs: 8 # optional, number of parallel make jobs (default: os.cpu_count())
+                    private_work: true # optional, relink `main` for each runner with its own `work` directory (default)
 
         The resulting binary is appended to the list `runner['binaries']`.
 
@@ -330,8 +904,12 @@ class MicrOmegas(SLHARunner):
         Additional `'binaries'` may be specified as well.
         """
         self.timeout = conf.get('timeout', 18000)
-        self.tpl = conf['template']
+        self.worklock = None
+        """ The executable and the lock file of the shared `work` directory (`micromegas['private_work']: false`) """
+        self.tpl = self.compile(conf)
         self.blocks = conf.get('getblocks', [])
+        self.archive = Archive(conf['archive'], conf.get('archive_format', 'xz')) if conf.get('archive', False) else None
+        """ `ScanLHA.archive.Archive` of the raw outputs if `runner['archive']` is set """
         if 'micromegas' not in self.config:
             logging.error('need to specify "micromegas" config')
             exit(1)
@@ -348,35 +926,115 @@ class MicrOmegas(SLHARunner):
         if 'exec' not in omega:
             logging.error('need to specify "exec"utable created by the build followed by its arguments (Popen list syntax)')
             exit(1)
-        self.makedirs(tocopy = omega['src'])
-        self.omegadir = os.path.join(self.rundir,os.path.basename(omega['src']))
-        self.modeldir = os.path.join(self.omegadir, omega['modelname'])
-        logging.debug('running "make clean" on MicrOmegas installtion.')
-        Popen('yes|make clean', shell=True, stdout=DEVNULL, stderr=DEVNULL, cwd=self.omegadir)
-        logging.debug('running "make" on MicrOmegas installtion.')
-        i = 0
-        stdout, stderr = "", "MicrOmegas was already built(?)"
-        while not os.path.isfile(self.omegadir + '/include/microPath.h') and i < 15:
-            stdout, stderr = self.runBinary(['make'], cwd=self.omegadir)
-            i += 1
-        if i >= 5:
-            logging.error('Build failed')
-            logging.error(stdout)
-            logging.error(stderr)
-        logging.debug('running "make clean" on MicrOmegas model.')
-        os.chdir(self.modeldir)
-        Popen(['make', 'clean'], stdout=DEVNULL, stderr=DEVNULL, shell=True, cwd=self.modeldir)
-        logging.debug('running "make main={}" on MicrOmegas model.'.format(omega['main']))
-        i = 0
-        stdout, stderr = "", "The model was already built(?)"
-        while not os.path.isfile(omega['exec'][0]) and i < 15:
-            stdout, stderr = self.runBinary(['make', 'main='+omega['main']], cwd=self.modeldir)
-            i += 1
-        if i < 15 and i != 0:
-            logging.debug('file {} was build'.format(omega['exec'][0]))
-            self.initialized = True
+        self.makedirs()
+        cached = self.build(omega)
+        if not cached:
+            return
+        if omega.get('private_work', True):
+            self.omegadir = os.path.join(self.rundir, os.path.basename(os.path.normpath(omega['src'])))
+            self.modeldir = os.path.join(self.omegadir, omega['modelname'])
+            self.initialized = self.relocate(cached, omega)
+            binary = os.path.join(self.modeldir, omega['exec'][0])
         else:
-            logging.error(stdout)
-            logging.error(stderr)
-        os.chdir(self.rundir)
-        self.binaries.append([os.path.join(self.modeldir, omega['exec'][0])] + omega['exec'][1:])
+            binary = os.path.join(self.rundir, os.path.basename(omega['exec'][0]))
+            executable = os.path.join(cached, omega['modelname'], omega['exec'][0])
+            if self.config.get('staging', 'copy') == 'copy':
+                copy2(executable, binary)
+            else:
+                self.link(executable, binary, self.config['staging'])
+            self.worklock = (binary, os.path.join(cached, omega['modelname'], 'work.lock'))
+            self.initialized = True
+        self.binaries.append([binary] + omega['exec'][1:])
+
+    def runBinary(self, args, cwd = None, stdin = None, timeout = None): # noqa
+        """ Same as `ScanLHA.runner.BaseRunner.runBinary`, the MicrOmegas executable locks a shared `work` directory. """
+        if self.worklock is None or args[0] != self.worklock[0]:
+            return super().runBinary(args, cwd=cwd, stdin=stdin, timeout=timeout)
+        with open(self.worklock[1], 'a') as lock:
+            flock(lock, LOCK_EX)
+            return super().runBinary(args, cwd=cwd, stdin=stdin, timeout=timeout)
+
+    @staticmethod
+    def key(omega):
+        """
+        Cache key of the MicrOmegas build: hash of the `src` directory (see `ScanLHA.runner.treehash`), the `modelname` and the `main` file.
+        """
+        return treehash([omega['src']], (omega['modelname'], omega['main']))
+
+    def make(self, args, cwd, check):
+        """
+        Run `make` with the list of `args` in `cwd` using `omega['jobs']` parallel jobs until the file `check` exists.
+
+        Since parallel builds of MicrOmegas/CalcHEP are not always reliable, the build is retried twice before a serial `make` is tried.
+        """
+        jobs = str(self.config['micromegas'].get('jobs', os.cpu_count()))
+        stdout, stderr = '', ''
+        for attempt in [['-j', jobs], ['-j', jobs], []]:
+            if os.path.isfile(check):
+                return True
+            logging.debug('running "make {}" in {}.'.format(' '.join(attempt + args), cwd))
+            stdout, stderr = self.runBinary(['make'] + attempt + args, cwd=cwd)
+        if os.path.isfile(check):
+            return True
+        logging.error('Build of {} failed'.format(check))
+        logging.error(stdout)
+        logging.error(stderr)
+        return False
+
+    def build(self, omega):
+        """
+        Build MicrOmegas and the model with `main` once in the shared cache directory (keyed by `ScanLHA.runner.MicrOmegas.key`).
+
+        Concurrent runners wait (file lock) until the build is finished and skip it if the cache key matches.
+        A failed build is marked as such (the file `failed` in the build directory) and not retried until the marker is removed.
+
+        Returns the path of the cached build or None if the build failed.
+        """
+        cache = os.path.abspath(os.path.expanduser(omega.get('cache', os.path.join(CACHE or gettempdir(), 'micromegas'))))
+        os.makedirs(cache, exist_ok=True)
+        key = self.key(omega)
+        builddir = os.path.join(cache, key)
+        omegadir = os.path.join(builddir, os.path.basename(os.path.normpath(omega['src'])))
+        modeldir = os.path.join(omegadir, omega['modelname'])
+        with open(os.path.join(cache, key + '.lock'), 'w') as lock:
+            flock(lock, LOCK_EX)
+            if os.path.isfile(os.path.join(builddir, 'built')):
+                logging.debug('Using cached MicrOmegas build {}.'.format(builddir))
+                return omegadir
+            failed = os.path.join(builddir, 'failed')
+            if os.path.isfile(failed):
+                logging.error('The MicrOmegas build {} failed before, remove {} to retry.'.format(builddir, failed))
+                return
+            logging.info('Building MicrOmegas into {}.'.format(builddir))
+            if os.path.exists(builddir):
+                rmtree(builddir)
+            copytree(omega['src'], omegadir, symlinks=True)
+            logging.debug('running "make clean" on MicrOmegas installation.')
+            self.runBinary(['sh', '-c', 'yes|make clean'], cwd=omegadir)
+            success = self.make([], omegadir, os.path.join(omegadir, 'include', 'microPath.h'))
+            if success:
+                logging.debug('running "make clean" on MicrOmegas model.')
+                self.runBinary(['make', 'clean'], cwd=modeldir)
+                success = self.make(['main=' + omega['main']], modeldir, os.path.join(modeldir, omega['exec'][0]))
+            if not success:
+                open(failed, 'w').close()
+                return
+            with open(os.path.join(builddir, 'built'), 'w') as built:
+                built.write('{}\n{}\n'.format(os.path.abspath(omega['src']), omega['main']))
+        return omegadir
+
+    def relocate(self, cached, omega):
+        """
+        Set up the MicrOmegas installation of this runner in `self.omegadir` from the `cached` build:
+        all files are symlinked into the shared build except for the model directory, which is copied (i.e. the runner has its
+        own `work` directory for processes generated at runtime) and `main` is relinked there.
+        """
+        os.makedirs(self.omegadir, exist_ok=True)
+        for entry in os.listdir(cached):
+            if entry == omega['modelname']:
+                copytree(os.path.join(cached, entry), self.modeldir, symlinks=True)
+            else:
+                os.symlink(os.path.join(cached, entry), os.path.join(self.omegadir, entry))
+        # the executable contains the (hard coded) path of the model directory
+        self.removeFile(os.path.join(self.modeldir, omega['exec'][0]))
+        return self.make(['main=' + omega['main']], self.modeldir, os.path.join(self.modeldir, omega['exec'][0]))
@@ -1,19 +1,22 @@
-# import lzma
 """
 Control random- and grid-scans.
 """
 import logging
 from collections import ChainMap
 import os
+from contextlib import nullcontext
 from numpy import linspace, prod
 from concurrent.futures import ProcessPoolExecutor as Executor
 from concurrent.futures import as_completed
 from tqdm import tqdm
 from math import * # noqa: F403 F401
 from itertools import product
-from pandas import HDFStore, concat, DataFrame
-from .slha import genSLHA
+from pandas import concat, DataFrame
+from .slha import genSLHA, layoutSLHA, dumpSLHA
 from .runner import RUNNERS
+from .schema import Schema
+from .storage import getStorage
+from .archive import COLUMNS as ARCHIVECOLUMNS, readArchived
 # import numpy.random import uniform, normal, exponential, poisson, seed
 import numpy.random as random
 from glob import glob
@@ -35,7 +38,41 @@ def substitute(param_dict):
     else:
         return substitute(subst)
 
-__all__ = ['Scan', 'RandomScan']
+def typed(results, config):
+    """
+    Concatenate the list of result DataFrames `results` into one typed DataFrame.
+
+    The column schema (see `ScanLHA.schema.Schema`) is derived from `config['runner']['getblocks']` and the results themselves.
+    """
+    schema = Schema(config['runner'].get('getblocks', config.get('getblocks', [])), config['runner'].get('dtype', 'float64'))
+    results = [ schema.conform(r) for r in results ]
+    if not results:
+        return DataFrame()
+    return schema.conform(concat(results, ignore_index=True))
+
+def datacolumns(config):
+    """
+    Returns the columns which are stored as HDF data columns (see `ScanLHA.storage.HDFStorage`):
+    the LHA fields of all scanned parameters and the observables listed in `config['runner']['data_columns']`.
+    """
+    scanned = [ p['lha'] for p in getattr(config, 'parameters', {}).values() if any(k in p for k in ['scan', 'values', 'random', 'dependent']) ]
+    return list(dict.fromkeys(scanned + config['runner'].get('data_columns', [])))
+
+def runpoints(runner, points, bar=None):
+    """
+    Run the list of parameter dicts `points` with the `runner` in batches of `runner.batchsize` points (see `ScanLHA.runner.BaseRunner.runBatch`).
+
+    Returns the list of results of each batch (DataFrames with one row per point). The tqdm progress `bar` is updated after each batch.
+    """
+    results = []
+    for i in range(0, len(points), runner.batchsize):
+        batch = points[i:i+runner.batchsize]
+        results.append(runner.runBatch(batch))
+        if bar is not None:
+            bar.update(len(batch))
+    return results
+
+__all__ = ['Scan', 'RandomScan', 'AdaptiveScan', 'FileScan']
 
 class Scan():
     """ Scan object
@@ -104,8 +141,6 @@ class Scan():
             logging.error("No proper 'values' option set for paramete %d." % line['id'])
             return
         self.config.setLine(block, line)
-        # update the slha template with new config
-        self.config['runner']['template'] = genSLHA(self.config['blocks'])
 
     def build(self,num_workers=4):
         """ Expand parameter lists and scan ranges while substituting eventual dependencies. """
@@ -118,6 +153,9 @@ class Scan():
                 values.append([{str(parameter): num} for num in line['values']])
             if 'dependent' in line and 'value' in line:
                 values.append([{line['parameter']: line['value']}])
+        # generate the slha template once for all registered scan lines
+        self.config['runner']['template'] = genSLHA(self.config['blocks'])
+        self.config['runner']['template_parameters'] = [ p for v in values for p in v[0] ]
         self.numparas = prod([len(v) for v in values])
         logging.info('Build all %d parameter points.' % self.numparas)
         self.scanset = [ substitute(dict(ChainMap(*s))) for s in product(*values) ]
@@ -125,12 +163,16 @@ class Scan():
             return self.numparas
         return
 
+    def __getstate__(self):
+        # the workers only need the config, each chunk of points is passed to `ScanLHA.scan.Scan.scan` separately
+        return dict(self.__dict__, scanset=[], results=None)
+
     def scan(self, dataset):
         """ Register an runner using the config and apply it on `dataset` """
         # this is still buggy: https://github.com/tqdm/tqdm/issues/510
         # res = [ runner.run(d) for d in tqdm(dataset) ]
         runner = self.runner(self.config['runner'])
-        return concat([ runner.run(d) for d in dataset ], ignore_index=True)
+        return concat(runpoints(runner, dataset), ignore_index=True)
 
     def submit(self,num_workers=None):
         """
@@ -146,10 +188,11 @@ class Scan():
 
         if num_workers == 1:
             runner = self.runner(self.config['runner'])
-            self.results = concat([ runner.run(d) for d in tqdm(self.scanset) ], ignore_index=True)
+            with tqdm(total=len(self.scanset)) as bar:
+                self.results = typed([concat(runpoints(runner, self.scanset, bar), ignore_index=True)], self.config)
             return
 
-        chunksize = min(int(self.numparas/num_workers),1000)
+        chunksize = max(1, min(int(self.numparas/num_workers),1000))
         chunks = range(0, self.numparas, chunksize)
         logging.info('Running on host {}.'.format(os.getenv('HOSTNAME')))
         logging.info('Splitting dataset into %d chunks.' % len(chunks))
@@ -157,19 +200,24 @@ class Scan():
         with Executor(num_workers) as executor:
             futures = [ executor.submit(self.scan, self.scanset[i:i+chunksize]) for i in chunks ]
             progresser = tqdm(as_completed(futures), total=len(chunks), unit = 'chunk')
-            self.results = [ r.result() for r in progresser ]
-        self.results = concat(self.results, ignore_index=True)
+            [ r for r in progresser ]
+            # keep the order of the scanset
+            self.results = [ r.result() for r in futures ]
+        self.results = typed(self.results, self.config)
 
     def save(self, filename='store.hdf', path='results'):
-        """ Saves `self.results` into the HDF file `filename` in the tree `path`. """
+        """
+        Saves `self.results` into the file `filename` in the tree `path`.
+
+        The storage backend is chosen by the extension of `filename` (see `ScanLHA.storage`), `runner['compression']` and the
+        `ScanLHA.scan.datacolumns` are passed on.
+        """
         print('Saving to {} ({})'.format(filename,path))
         if path == 'config':
             logging.error('Cant use "config" as path, using "config2" instead.i')
             path = "config2"
-        store = HDFStore(filename)
-        store[path] = self.results
-        store.get_storer(path).attrs.config = self.config
-        store.close()
+        store = getStorage(filename, path, compression=self.config['runner'].get('compression', None), data_columns=datacolumns(self.config))
+        store.save(self.results, config=self.config)
 
 class RandomScan():
     """ Scan object
@@ -190,6 +238,7 @@ class RandomScan():
         self.parallel = os.cpu_count()
         #  self.seed = seed
         self.dependent = { p : v['value'] for p,v in c.parameters.items() if v.get('dependent',False) and 'value' in v }
+        self.config['runner']['template_parameters'] = list(self.dependent) + [ p for p,v in c.parameters.items() if 'random' in v ]
 
     def generate(self):
         """
@@ -220,11 +269,11 @@ class RandomScan():
 
         with tqdm(total=numparas, unit='point', position=pos) as bar:
             while numresults < numparas:
-                result = runner.run(self.generate())
-                if not result.isnull().values.all():
-                    results.append(result)
-                    numresults += 1
-                    bar.update(1)
+                result = runner.runBatch([ self.generate() for i in range(min(runner.batchsize, numparas - numresults)) ])
+                result = result[~result.isnull().all(axis=1)]
+                results.append(result)
+                numresults += len(result)
+                bar.update(len(result))
                 if runner.config['writeevery'] > 0 and numresults % runner.config['writeevery'] == 0:
                     pass
         return concat(results, ignore_index=True)
@@ -242,7 +291,7 @@ class RandomScan():
         logging.info('Running on host {}.'.format(os.getenv('HOSTNAME')))
         logging.info('Will work on %d threads in parallel.' % num_workers)
         if num_workers == 1:
-            self.results = self.scan(self.numparas)
+            self.results = typed([self.scan(self.numparas)], self.config)
             return
         paras_per_thread = int(self.numparas/num_workers)
         remainder = self.numparas % num_workers
@@ -251,32 +300,299 @@ class RandomScan():
         with Executor(num_workers) as executor:
             futures = [ executor.submit(self.scan, j, i) for i,j in enumerate(numparas) ]
             self.results = [ r.result() for r in as_completed(futures) ]
-        self.results = concat(self.results, ignore_index=True)
+        self.results = typed(self.results, self.config)
 
     def save(self, filename='store.hdf', path='results'):
-        """ Saves `self.results` into the HDF file `filename` in the tree `path`. """
+        """
+        Saves `self.results` into the file `filename` in the tree `path`.
+
+        The storage backend is chosen by the extension of `filename` (see `ScanLHA.storage`), `runner['compression']` and the
+        `ScanLHA.scan.datacolumns` are passed on.
+        """
         if self.results.empty:
             return
         print('Saving to {} ({})'.format(filename,path))
         if path == 'config':
             logging.error('Cant use "config" as path, using "config2" instead.')
             path = "config2"
-        store = HDFStore(filename)
-        store[path] = self.results
-        store.get_storer(path).attrs.config = self.config
-        #  store.get_storer(path).attrs.seed = self.seed
-        store.get_storer(path).attrs.parallel = self.parallel
-        store.close()
+        store = getStorage(filename, path, compression=self.config['runner'].get('compression', None), data_columns=datacolumns(self.config))
+        #  seed=self.seed
+        store.save(self.results, config=self.config, parallel=self.parallel)
+
+class AdaptiveScan(Scan):
+    """ Scan object
+
+    Controls a grid scan which starts from a coarse grid and recursively subdivides the cells of interest.
+
+    The coarse grid is given by the `scan` ranges of the parameters (lines with `values` and `dependent` lines are
+    handled as for `ScanLHA.scan.Scan`, i.e. each combination of their values is refined separately).
+    A cell is subdivided (bisected in each scanned parameter, geometrically for the `log` and `geom` distribution)
+    if the constraint outcome differs between its corners (i.e. some corners are dropped by `runner['constraints']`)
+    or if the `observable` changes by more than `tolerance` between its corners.
+
+    The `'runner'` config-entry may contain the dict `'adaptive'`:
+
+        runner:
+          scantype: adaptive
+          adaptive:
+            observable: 'MASS.values.25' # optional
+            tolerance: 1.0 # default: 0
+            maxpoints: 10000 # point budget (default: 10000)
+            depth: 6 # maximal number of subdivisions (default: 6)
+
+    All points of a refinement level are run at once, distributed on the workers. If the points of a level exceed the
+    budget, the cells with the largest variation are refined first.
+    The level of each point is stored in the column `adaptive_level`.
+    """
+    BASECOLUMNS = ['log', 'log_stdout', 'log_stderr', 'input_file', 'output_file', 'log_file', 'adaptive_level'] + ARCHIVECOLUMNS
+    """ Columns which are present even if the runner did not produce a (valid) result. """
+
+    def __init__(self, c):
+        super().__init__(c)
+        adaptive = self.config['runner'].get('adaptive', {})
+        self.observable = adaptive.get('observable', None)
+        self.tolerance = float(adaptive.get('tolerance', 0))
+        self.maxpoints = int(eval(str(adaptive.get('maxpoints', 10000))))
+        self.depth = int(adaptive.get('depth', 6))
+        self.cells = []
+        self.points = {}
+
+    def __getstate__(self):
+        # the workers only need the config, not the results so far
+        return dict(super().__getstate__(), cells=[], points={})
+
+    def build(self,num_workers=4):
+        """
+        Build the coarse grid cells and the combinations of the remaining parameters.
+
+        Returns the number of coarse grid points.
+        """
+        if not self.config.validate():
+            return
+        self.axes = {}
+        coarse = []
+        values = []
+        for parameter,line in self.config.parameters.items():
+            if 'scan' in line and 'values' in line:
+                self.axes[str(parameter)] = line.get('distribution', 'linear') in ['log', 'geom']
+                coarse.append(sorted(set(float(v) for v in line['values'])))
+            elif 'values' in line:
+                values.append([{str(parameter): num} for num in line['values']])
+            if 'dependent' in line and 'value' in line:
+                values.append([{line['parameter']: line['value']}])
+        if not self.axes:
+            logging.error('No scan ranges defined for the adaptive scan.')
+            return
+        if any(len(v) < 2 for v in coarse):
+            logging.error('Scan ranges of the adaptive scan need at least two values.')
+            return
+        self.config['runner']['template'] = genSLHA(self.config['blocks'])
+        self.config['runner']['template_parameters'] = list(self.axes) + [ p for v in values for p in v[0] ]
+        self.fixed = [ dict(ChainMap(*s)) for s in product(*values) ]
+        self.cells = [ (k, lower, tuple(v[v.index(x)+1] for v,x in zip(coarse, lower)))
+                for k in range(len(self.fixed)) for lower in product(*[ v[:-1] for v in coarse ]) ]
+        self.numparas = prod([len(v) for v in coarse]) * len(self.fixed)
+        logging.info('Build %d coarse grid points.' % self.numparas)
+        if self.numparas > self.maxpoints:
+            logging.warning('The coarse grid exceeds the point budget of %d points.' % self.maxpoints)
+        return self.numparas
+
+    @staticmethod
+    def corners(cell):
+        """ Returns the grid points at the corners of `cell`. """
+        k, lower, upper = cell
+        return [ (k, x) for x in product(*zip(lower, upper)) ]
+
+    def midpoint(self, a, b, log):
+        """ Returns the (geometric if `log`) center of the interval [`a`, `b`]. """
+        if log and a*b > 0:
+            return copysign(sqrt(a*b), a)
+        return (a + b)/2
+
+    def subdivide(self, cell):
+        """ Bisect `cell` in each scanned parameter. Returns the list of sub-cells. """
+        k, lower, upper = cell
+        centers = [ self.midpoint(a, b, log) for a,b,log in zip(lower, upper, self.axes.values()) ]
+        halves = [ ((a,m),(m,b)) for a,m,b in zip(lower, centers, upper) ]
+        return [ (k, tuple(h[0] for h in sub), tuple(h[1] for h in sub)) for sub in product(*halves) ]
+
+    def passed(self, result):
+        """ Whether the runner returned a valid result (i.e. not only logs/input parameters) for the DataFrame `result`. """
+        return any(not c.startswith('input_parameters.') and c not in self.BASECOLUMNS and result[c].notnull().any() for c in result.columns)
+
+    def variation(self, cell):
+        """ Returns how much the corners of `cell` differ: `inf` if the constraint outcome differs, else the spread of the observable (or 0). """
+        results = [ self.points[p][1] for p in self.corners(cell) ]
+        if len(set(map(self.passed, results))) > 1:
+            return inf
+        if not self.observable:
+            return 0
+        values = [ float(r[self.observable].iloc[0]) for r in results if self.observable in r.columns ]
+        values = [ v for v in values if v == v ]
+        return max(values) - min(values) if len(values) > 1 else 0
+
+    def params(self, point):
+        """ Returns the parameter dict of the grid `point`. """
+        k, x = point
+        return substitute(dict(self.fixed[k], **dict(zip(self.axes, x))))
+
+    def scan(self, dataset, bar=None):
+        """ Register a runner using the config and apply it on `dataset`. Returns the list of results for each point. """
+        runner = self.runner(self.config['runner'])
+        return [ r.iloc[[i]].reset_index(drop=True) for r in runpoints(runner, dataset, bar) for i in range(len(r)) ]
+
+    def evaluate(self, points, level, executor=None, num_workers=1):
+        """ Run all `points` of the refinement `level` (in parallel if an `executor` is given) and store the results in `self.points`. """
+        dataset = [ self.params(p) for p in points ]
+        if executor is None:
+            with tqdm(total=len(dataset), unit='point') as bar:
+                results = self.scan(dataset, bar)
+        else:
+            chunksize = max(1, min(int(len(dataset)/num_workers), 1000))
+            futures = [ executor.submit(self.scan, dataset[i:i+chunksize]) for i in range(0, len(dataset), chunksize) ]
+            [ f for f in tqdm(as_completed(futures), total=len(futures), unit='chunk') ]
+            results = [ r for f in futures for r in f.result() ]
+        for p,r in zip(points, results):
+            r['adaptive_level'] = level
+            self.points[p] = (level, r)
+
+    def refine(self, cells):
+        """
+        Select the cells to be subdivided (within the point budget).
+
+        Returns the new grid points and the sub-cells.
+        """
+        variations = [ (self.variation(c), c) for c in cells ]
+        variations = sorted([ v for v in variations if v[0] > self.tolerance or v[0] == inf ], key=lambda v: -v[0])
+        points = {}
+        subcells = []
+        for i,(_,cell) in enumerate(variations):
+            sub = self.subdivide(cell)
+            new = { p : None for s in sub for p in self.corners(s) if p not in self.points and p not in points }
+            if len(self.points) + len(points) + len(new) > self.maxpoints:
+                logging.info('Point budget exhausted, not refining {} of {} cells.'.format(len(variations) - i, len(variations)))
+                break
+            points.update(new)
+            subcells += sub
+        return list(points), subcells
+
+    def submit(self,num_workers=None):
+        """
+        Start the scan and distribute each refinement level on `num_workers` threads.
+
+        If `num_workers` is omitted, the value of `os.cpu_count()` is used.
+
+        Results are stored in `self.results`.
+        """
+        num_workers = os.cpu_count() if not num_workers else num_workers
+        if not self.cells and not self.build(num_workers):
+            self.results = DataFrame()
+            return
+        logging.info('Running on host {}.'.format(os.getenv('HOSTNAME')))
+        points = list({ p : None for c in self.cells for p in self.corners(c) })
+        cells = self.cells
+        with (Executor(num_workers) if num_workers > 1 else nullcontext()) as executor:
+            for level in range(self.depth + 1):
+                logging.info('Level {}: running {} points.'.format(level, len(points)))
+                self.evaluate(points, level, executor, num_workers)
+                if level == self.depth:
+                    break
+                points, cells = self.refine(cells)
+                if not points:
+                    break
+        self.results = typed([ r for _,r in self.points.values() ], self.config)
 
 class FileScan(Scan):
     """
-    Performs a scan based on input file(s) from a previous scan.
+    Performs a scan based on the SLHA output of a previous scan, e.g. to rerun only HiggsBounds/HiggsSignals after an update
+    without rerunning the spectrum generator.
 
     Needs a Config object (see `ScanLHA.config.Config`) for initialization.
 
-    TODO: not yet functional
+    The binaries in `runner['binaries']` (i.e. the remaining part of the chain) are run on the spectra given in `runner['file']`:
+
+        runner:
+          scantype: file
+          binaries:
+            - ['./HiggsBounds', 'LandH', 'SLHA', '3', '0', '{output_file}']
+          file:
+            results: 'scan.h5' # results of the previous scan
+            path: 'results' # default
+            # alternatively: SLHA files given by a pattern compatible with python.glob
+            # files: 'spectra/*.slha'
+
+    For stored results, the archived output of each point (`runner['archive']`, see `ScanLHA.archive`) or its `output_file` is used
+    if it exists (i.e. the previous scan used `keep_log: true` and `remove_slha: false`), otherwise the spectrum is reconstructed from
+    the stored blocks (see `ScanLHA.slha.dumpSLHA`).
+    Blocks which have not been stored (`getblocks`) are thus missing.
+
+    The spectrum is written to `{input_file}` and `{output_file}` (`runner['copy_input']`, see `ScanLHA.runner.SLHARunner.prepare`).
+    The points are run using `ScanLHA.scan.Scan.submit` and the results are joined onto the original rows, i.e. values which are
+    written by the binaries replace the previous ones. Points which fail (or do not fulfill the constraints) keep their original values.
+    For SLHA files, the file name is stored in the column `source_file`.
     """
     def __init__(self, c):
         self.config = c
+        self.config['runner']['template'] = '{%SLHA%}'
+        self.config['runner']['template_parameters'] = ['SLHA']
+        self.config['runner'].setdefault('copy_input', True)
         self.getblocks = self.config.get('getblocks', [])
         self.runner = RUNNERS[self.config['runner'].get('type','SLHARunner')]
+        self.scanset = []
+
+    def __getstate__(self):
+        # neither the original rows nor the spectra of the other chunks are needed by the workers
+        return dict(super().__getstate__(), original=None)
+
+    @staticmethod
+    def readfile(filename):
+        """ Returns the contents of the SLHA file `filename`. """
+        with open(filename, 'r') as f:
+            return f.read()
+
+    def build(self,num_workers=4):
+        """ Read/reconstruct the spectra of all points. """
+        source = self.config['runner'].get('file', {})
+        if 'files' in source:
+            files = sorted(glob(source['files']))
+            self.original = DataFrame({'source_file': files})
+            spectra = [ self.readfile(f) for f in files ]
+        elif 'results' in source:
+            self.original = getStorage(source['results'], source.get('path', 'results')).load()
+            layout = layoutSLHA(self.original.columns)
+            spectra = []
+            for row in self.original.to_dict('records'):
+                archived = row.get('output_file', '')
+                if type(row.get('archive_file', None)) == str and row['archive_file']:
+                    spectra.append(readArchived(*[ row[c] for c in ARCHIVECOLUMNS ]))
+                elif archived and type(archived) == str and os.path.isfile(archived):
+                    spectra.append(self.readfile(archived))
+                else:
+                    spectra.append(dumpSLHA(row, layout))
+        else:
+            logging.error("No input given, set runner['file']['results'] or runner['file']['files'].")
+            return
+        self.scanset = [ {'SLHA': s} for s in spectra ]
+        self.numparas = len(self.scanset)
+        logging.info('Read %d spectra.' % self.numparas)
+        if self.scanset:
+            return self.numparas
+        return
+
+    def submit(self,num_workers=None):
+        """
+        Run all spectra (see `ScanLHA.scan.Scan.submit`) and join the results onto the original rows.
+
+        Results are stored in `self.results`.
+        """
+        if not self.scanset and not self.build(num_workers):
+            self.results = DataFrame()
+            return
+        super().submit(num_workers)
+        results = self.results.drop(columns=[ c for c in self.results.columns if c == 'input_parameters.SLHA' ]).reset_index(drop=True)
+        original = self.original.reset_index(drop=True)
+        shared = [ c for c in results.columns if c in original.columns ]
+        for c in shared:
+            # points (or values) without new results, e.g. failed runs, keep their original values
+            results[c] = results[c].where(results[c].notnull(), original[c])
+        self.results = concat([original.drop(columns=shared), results], axis=1)
@@ -0,0 +1,90 @@
+"""
+Typed, schema-stable result tables.
+"""
+import logging
+from numpy import nan
+from pandas import to_numeric
+
+__all__ = ['Schema']
+
+class Schema():
+    """
+    Column schema of scan results.
+
+    The dtype of each column is derived from the first data points in which the column is present:
+
+      * integer columns (e.g. flags) are stored as `int64`,
+      * all other numeric columns (including `'NaN'` strings) use `dtype` (`'float64'` or `'float32'`, set by `runner['dtype']`),
+      * columns that contain non-numeric strings (e.g. block infos and logs) stay strings.
+
+    Columns that appear later on are added to the schema (schema evolution).
+    Integer columns are promoted to `dtype` as soon as they contain missing values.
+    Columns of the blocks listed in `getblocks` are ordered accordingly.
+
+    Example:
+
+        In [1]: from ScanLHA.schema import Schema
+        In [2]: schema = Schema(['MASS', 'MINPAR'], 'float32')
+        In [3]: results = schema.conform(results)
+    """
+    def __init__(self, getblocks=[], dtype='float64'):
+        self.getblocks = list(getblocks)
+        self.dtype = dtype
+        self.columns = {}
+
+    def infer(self, series):
+        """ Returns the dtype for the (non-empty) column `series`. """
+        numeric = to_numeric(series.replace('NaN', nan), errors='coerce')
+        if (numeric.isnull() & series.notnull() & (series != 'NaN')).any():
+            return 'object'
+        if numeric.dtype.kind in 'iub':
+            return 'int64'
+        return self.dtype
+
+    def update(self, df):
+        """ Add new columns of the DataFrame `df` to the schema and promote the dtypes of known columns if necessary. """
+        for col in df.columns:
+            series = df[col]
+            if col not in self.columns:
+                if series.notnull().any():
+                    self.columns[col] = self.infer(series)
+                continue
+            dtype = self.columns[col]
+            if dtype == 'object' or series.isnull().all():
+                continue
+            new = self.infer(series.dropna())
+            if new == 'object':
+                logging.warning('Column {} contains non-numeric values, storing strings.'.format(col))
+                self.columns[col] = new
+            elif dtype == 'int64' and (new != 'int64' or series.isnull().any()):
+                self.columns[col] = self.dtype
+        # columns which are empty so far
+        for col in df.columns:
+            if col not in self.columns:
+                self.columns[col] = self.dtype
+        self.columns = dict(sorted(self.columns.items(), key=self.order))
+
+    def order(self, item):
+        """ Sort key for the columns: blocks in `getblocks` first. """
+        block = item[0].split('.')[0]
+        return self.getblocks.index(block) if block in self.getblocks else len(self.getblocks)
+
+    def conform(self, df, update=True):
+        """
+        Returns a copy of the DataFrame `df` with all columns of the schema in their respective dtype.
+
+        Missing values are filled with NaN (`''` for string columns).
+        If `update` is False, the schema is kept fixed and columns of `df` which are not part of it are dropped.
+        """
+        if update:
+            self.update(df)
+        out = df.reindex(columns=list(self.columns))
+        for col,dtype in self.columns.items():
+            if dtype == 'object':
+                out[col] = out[col].fillna('').astype(str)
+                continue
+            values = to_numeric(out[col].replace('NaN', nan), errors='coerce')
+            if dtype == 'int64' and values.isnull().any():
+                dtype = self.columns[col] = self.dtype
+            out[col] = values.astype(dtype)
+        return out
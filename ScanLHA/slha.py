@@ -2,7 +2,9 @@
 Parsing and writing of (S)LHA files.
 """
 from collections import defaultdict
+from numbers import Integral, Real
 import logging
+import re
 import pylha
 
 def genSLHA(blocks):
@@ -22,6 +24,99 @@ def genSLHA(blocks):
             out += '{id} {value} #{parameter} {comment}\n'.format_map(data)
     return out
 
+def fmtvalue(value):
+    """
+    Default numeric formatting policy for SLHA input values.
+
+    Integers (e.g. flags) are written as such, all other real numbers in scientific notation with full double precision.
+    Anything else (including booleans, i.e. `True`/`False`) is converted using `str`.
+    """
+    if isinstance(value, bool):
+        return str(value)
+    if isinstance(value, Integral):
+        return '%d' % value
+    if isinstance(value, Real):
+        return '%.16E' % value
+    return str(value)
+
+class SLHATemplate():
+    """
+    Precompiled (S)LHA input template.
+
+    The template string `tpl` (e.g. the output of `ScanLHA.slha.genSLHA`) is split once into static segments and
+    parameter slots `{%parameter%}`. Rendering a data point then reduces to formatting the slot values with `fmt`
+    (default: `ScanLHA.slha.fmtvalue`) and joining the segments.
+
+    If the list of available `parameters` is given, slots without a matching parameter raise a `KeyError` already
+    during compilation.
+
+    Example:
+
+        In [1]: from ScanLHA.slha import SLHATemplate, genSLHA
+        In [2]: tpl = SLHATemplate(genSLHA(c['blocks']), parameters=['MSUSY', 'TanBeta'])
+        In [3]: tpl.render({'MSUSY': 1000., 'TanBeta': 10})
+        In [4]: tpl.render_batch([{'MSUSY': 1000., 'TanBeta': 10}, {'MSUSY': 2000., 'TanBeta': 20}])
+    """
+    slot = re.compile(r'\{%(.+?)%\}')
+
+    def __init__(self, tpl, parameters=None, fmt=fmtvalue):
+        self.fmt = fmt
+        self.segments = []
+        self.slots = []
+        for i,part in enumerate(self.slot.split(tpl)):
+            if i % 2:
+                self.slots.append((len(self.segments), part))
+                self.segments.append('')
+            else:
+                # resolve escaped braces just like str.format_map
+                self.segments.append(part.replace('{{', '{').replace('}}', '}'))
+        self.parameters = list(dict.fromkeys(p for _,p in self.slots))
+        if parameters is not None:
+            missing = [ p for p in self.parameters if p not in parameters ]
+            if missing:
+                raise KeyError('No values for template parameter(s) {}.'.format(', '.join(missing)))
+
+    def render(self, params):
+        """ Returns the template string with all slots substituted by the values of the parameter dict `params`. """
+        out = self.segments[:]
+        for pos,para in self.slots:
+            out[pos] = self.fmt(params[para])
+        return ''.join(out)
+
+    def render_batch(self, points):
+        """
+        Render a list of parameter dicts `points` at once.
+
+        Each parameter column is formatted in one go before the segments of each point are joined.
+
+        Returns a list of strings.
+        """
+        columns = { p : [ self.fmt(point[p]) for point in points ] for p in self.parameters }
+        out = []
+        for i in range(len(points)):
+            segments = self.segments[:]
+            for pos,para in self.slots:
+                segments[pos] = columns[para][i]
+            out.append(''.join(segments))
+        return out
+
+REVERSED_BLOCKS = [
+        'HiggsBoundsInputHiggsCouplingsBosons',
+        'HiggsBoundsInputHiggsCouplingsFermions',
+        'HiggsCouplingsFermions',
+        'HiggsCouplingsBosons'
+        ]
+""" Non-standard blocks whose lines are stored in reversed order. """
+
+LIST_BLOCKS = {
+        'HiggsCouplingsFermions': 2,
+        'HiggsBoundsInputHiggsCouplingsFermions': 2,
+        'WMASS': 2, # NMSSMCALC specific
+        'DeltaRhoOS': 2,
+        'DeltaRhoDR': 2
+        }
+""" Blocks which have more than one numerical value, the values are joined into a "|"-separated string. """
+
 def list2dict(l):
     """ recursively convert [1,2,3,4] to {'1':{'2':{'3':4}} """
     if len(l) == 1:
@@ -55,42 +150,39 @@ def parseSLHA(slhafile, blocks=[],separator=None):
 
     Converts (i.e. reverses) non-standard SLHA entrys (such as HiggsBounds).
     """
-    reversed_blocks = [
-            'HiggsBoundsInputHiggsCouplingsBosons',
-            'HiggsBoundsInputHiggsCouplingsFermions',
-            'HiggsCouplingsFermions',
-            'HiggsCouplingsBosons'
-            ]
-
-    # blocks which have more than one numerical value are joined into a "|"-separated string
-    list_blocks = {
-            'HiggsCouplingsFermions': 2,
-            'HiggsBoundsInputHiggsCouplingsFermions': 2,
-            'WMASS': 2, # NMSSMCALC specific
-            'DeltaRhoOS': 2,
-            'DeltaRhoDR': 2
-            }
-
-    reversed_blocks = [b.upper() for b in reversed_blocks]
-    list_blocks = {b.upper() : i for b,i in list_blocks.items()}
-
     try:
         with open(slhafile,'r') as f:
-            if separator:
-                contents = f.read().split(separator)
-                slha = [pylha.load(c.replace('DECAY1L', 'NLODECAY')) for c in contents if c.strip()]
-            else:
-                slha = [pylha.load(f)]
+            contents = f.read()
     except FileNotFoundError:
         logging.error('File %s not found.' % slhafile)
         return {}
     except:
         logging.error('Could not parse %s !' % slhafile)
         return {}
+    return loadSLHA(contents, blocks, separator, source=slhafile)
+
+def loadSLHA(contents, blocks=[], separator=None, source='SLHA input'):
+    """
+    Same as `ScanLHA.slha.parseSLHA` but for the string `contents` (e.g. read from a pipe) instead of a file.
+
+    `source` is only used for error messages.
+    """
+    reversed_blocks = [b.upper() for b in REVERSED_BLOCKS]
+    list_blocks = {b.upper() : i for b,i in LIST_BLOCKS.items()}
+
+    try:
+        if separator:
+            contents = contents.split(separator)
+            slha = [pylha.load(c.replace('DECAY1L', 'NLODECAY')) for c in contents if c.strip()]
+        else:
+            slha = [pylha.load(contents)]
+    except:
+        logging.error('Could not parse %s !' % source)
+        return {}
 
     slha_blocks = [s.get('BLOCK',{}) for s in slha]
     if blocks:
-        slha_blocks = [{ b : v for b,v in s.items() if b in blocks } for s in slha]
+        slha_blocks = [{ b : v for b,v in s.items() if b in blocks } for s in slha_blocks]
     for s in slha_blocks:
         for b,v in s.items():
             try:
@@ -133,3 +225,64 @@ def parseSLHA(slhafile, blocks=[],separator=None):
         slha_blocks = slha_blocks[0]
 
     return slha_blocks
+
+def layoutSLHA(columns):
+    """
+    Group the (flattened) result `columns` by their SLHA block, i.e. the inverse of the column naming of `ScanLHA.slha.parseSLHA`.
+
+    Returns a dict `{(kind, name): (infocolumn, [(column, ids), ...])}` with `kind` `'BLOCK'` or `'DECAY'`,
+    which is used by `ScanLHA.slha.dumpSLHA`.
+    """
+    layout = {}
+    for col in columns:
+        if '.values.' in col:
+            block, ids = col.split('.values.', 1)
+            ids = ids.split('.')
+            info = block + '.info'
+        elif col.endswith('.info'):
+            block = col[:-len('.info')]
+            ids = None
+        else:
+            continue
+        parts = block.split('.')
+        if parts[0] in ['DECAY', 'DECAYS', 'NLODECAY', 'NLODECAYS'] and len(parts) == 2:
+            key = ('DECAY1L' if parts[0].startswith('NLO') else 'DECAY', parts[1])
+        elif len(parts) == 1:
+            key = ('BLOCK', block)
+        else:
+            continue
+        entry = layout.setdefault(key, [None, []])
+        if ids is None:
+            entry[0] = col
+        else:
+            entry[1].append((col, ids))
+    return { k : tuple(v) for k,v in layout.items() }
+
+def dumpSLHA(row, layout, fmt=fmtvalue):
+    """
+    Reconstruct an SLHA file (string) from the stored data point `row` (dict-like, e.g. a row of the results of a scan)
+    using the `layout` of `ScanLHA.slha.layoutSLHA`.
+
+    Reversed blocks, "|"-joined values (see `ScanLHA.slha.LIST_BLOCKS`) and decays are restored in their original order.
+    Missing values (NaN, `''`) are skipped, blocks are only written if they contain at least one value.
+    """
+    reversed_blocks = [b.upper() for b in REVERSED_BLOCKS]
+    out = []
+    for (kind,name),(infocol,lines) in layout.items():
+        body = []
+        for col,ids in lines:
+            value = row[col]
+            if value is None or value != value or value == '' or value == 'NaN':
+                continue
+            line = ids + [value]
+            if kind != 'BLOCK' or name.upper() in reversed_blocks:
+                line.reverse()
+            body.append(' '.join( v if type(v) == str else fmt(v) for v in line ).replace('|', ' '))
+        if not body:
+            continue
+        info = row[infocol] if infocol else ''
+        info = '' if info is None or info != info else info
+        info = fmt(info) if kind != 'BLOCK' and info != '' else str(info).replace('=', '= ')
+        out.append('{} {} {}'.format(kind, name, info).strip())
+        out += [ ' ' + l for l in body ]
+    return '\n'.join(out) + '\n'
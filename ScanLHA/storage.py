@@ -0,0 +1,629 @@
+"""
+Storage backends for scan results.
+
+The backend is selected by the file extension (see `ScanLHA.storage.getStorage`):
+
+  * `.h5`, `.hdf`, `.hdf5`: `ScanLHA.storage.HDFStorage` (`pandas.HDFStore`, default)
+  * `.parquet`, `.pq` or a directory: `ScanLHA.storage.ParquetStorage` (Parquet file or multi-file Arrow dataset)
+
+Both backends store the scan `ScanLHA.config.Config` (and further attributes such as `parallel`) next to the results.
+`ScanLHA.storage.Dataset` is a lazy view on the results of several files.
+
+Example:
+
+    In [1]: from ScanLHA.storage import getStorage
+    In [2]: store = getStorage('results.parquet')
+    In [3]: DATA = store.load(columns=['MINPAR.values.1', 'MASS.values.25'])
+    In [4]: conf = store.attr('config')
+"""
+import logging
+import os
+import pickle
+from glob import glob
+from sys import exit
+from uuid import uuid4
+from numpy import flatnonzero, ones
+from numpy.random import default_rng
+from warnings import catch_warnings, filterwarnings
+from pandas import HDFStore, DataFrame, Series, concat
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    import pyarrow.dataset as ds
+except ImportError:
+    pa = None
+
+__all__ = ['getStorage', 'HDFStorage', 'ParquetStorage', 'STORAGES', 'Dataset', 'OPERATORS']
+
+class HDFStorage():
+    """
+    Results stored in an HDF file under the tree `path` using `pandas.HDFStore`.
+
+    Attributes are stored in the attributes of the storer.
+
+    The optional `compression` is passed as `complib` to `pandas.HDFStore` (e.g. `'zlib'`, `'blosc'`),
+    where `'zstd'` and `'lz4'` are mapped onto their blosc variants.
+
+    Results are written in the HDF table format. The `data_columns` (e.g. the scanned parameters) are stored
+    as separate columns such that `filters` on them only read the matching rows (see `ScanLHA.storage.HDFStorage.load`).
+    The column names of a table are stored in HDF5 attributes of limited size, i.e. results with many columns are split
+    over several tables `path`, `path_1`, ... (see `ScanLHA.storage.HDFStorage.layout`).
+    """
+    itemsize = 255
+    """ Minimal width of string columns in `ScanLHA.storage.HDFStorage.append`. """
+    namebytes = 32768
+    """ Maximal total length of the column names of a single table. """
+
+    def __init__(self, filename, path='results', compression=None, data_columns=None):
+        self.filename = filename
+        self.path = path
+        self.compression = 'blosc:' + compression if compression in ['zstd', 'lz4'] else compression
+        self.data_columns = data_columns if data_columns else []
+        self.limits = None
+        self.tables = None
+        self.empty = None
+        self.attrs = {}
+
+    def open(self, mode='a'):
+        """ Returns the `pandas.HDFStore` of the file. """
+        if mode == 'r':
+            return HDFStore(self.filename, 'r')
+        return HDFStore(self.filename, mode, complib=self.compression, complevel=9 if self.compression else None)
+
+    def layout(self, columns):
+        """
+        Splits the list of `columns` into tables of at most `self.namebytes` bytes of column names.
+
+        Returns the list of `(key, columns)` of the tables, the first one is stored under `self.path`.
+        """
+        tables = [(self.path, [])]
+        size = 0
+        for c in columns:
+            length = len(str(c).encode()) + 16
+            if tables[-1][1] and size + length > self.namebytes:
+                tables.append(('{}_{}'.format(self.path, len(tables)), []))
+                size = 0
+            tables[-1][1].append(c)
+            size += length
+        return tables
+
+    def keys(self, store):
+        """ Returns the keys of all tables of the stored results (see `ScanLHA.storage.HDFStorage.layout`). """
+        return getattr(store.get_storer(self.path).attrs, 'tables', None) or [self.path]
+
+    def select(self, store, columns=None, **kwargs):
+        """ Same as `pandas.HDFStore.select` for results which are split over several tables. """
+        keys = self.keys(store)
+        if len(keys) == 1:
+            return store.select(self.path, columns=columns, **kwargs)
+        frames = []
+        for key in keys:
+            stored = list(store.get_storer(key).non_index_axes[0][1])
+            names = stored if columns is None else [ c for c in stored if c in columns ]
+            if names:
+                frames.append(store.select(key, columns=names, **kwargs))
+        if not frames:
+            return store.select(self.path, **kwargs)[[]]
+        df = concat(frames, axis=1)
+        return df if columns is None else df[list(columns)]
+
+    def load(self, columns=None, filters=None, stop=None, start=None):
+        """
+        Returns the stored DataFrame, optionally only the list of `columns` and the first `stop` rows
+        (the rows `start` to `stop` if `start` is given, see `ScanLHA.storage.HDFStorage.chunks`).
+
+        Only rows which fulfill the `filters` (list of `(column, operator, value)`, see `ScanLHA.storage.OPERATORS`) are returned.
+        Filters on data columns are evaluated on these columns alone and only the matching rows are read.
+        """
+        filters = filters if filters else []
+        with self.open('r') as store:
+            storer = store.get_storer(self.path)
+            if start is not None:
+                if storer.is_table:
+                    df = self.select(store, columns=columns, start=start, stop=stop)
+                else:
+                    df = store[self.path].iloc[start:stop]
+                return applyfilters(df if columns is None else df[columns], filters)
+            needed = None if columns is None else list(dict.fromkeys(list(columns) + [ f[0] for f in filters ]))
+            if not storer.is_table:
+                df = store[self.path]
+                df = applyfilters(df if needed is None else df[needed], filters)
+            else:
+                indexed = { c : key for key in self.keys(store) for c in store.get_storer(key).data_columns }
+                pushed = [ f for f in filters if f[0] in indexed ]
+                filters = [ f for f in filters if f not in pushed ]
+                if pushed:
+                    mask = ones(storer.nrows, dtype=bool)
+                    for col,op,value in pushed:
+                        mask &= OPERATORS[op](store.select_column(indexed[col], col), value).values
+                    rows = flatnonzero(mask)[:None if filters else stop]
+                    df = self.select(store, where=rows, columns=needed) if len(rows) else self.select(store, columns=needed, stop=0)
+                else:
+                    df = self.select(store, columns=needed, stop=None if filters else stop)
+                df = applyfilters(df, filters)
+            return (df if columns is None else df[columns]).iloc[:stop]
+
+    def take(self, rows, columns=None):
+        """ Returns the (sorted) row numbers `rows` of the stored DataFrame, optionally only the list of `columns`. """
+        with self.open('r') as store:
+            if store.get_storer(self.path).is_table:
+                return self.select(store, where=list(rows), columns=columns)
+            df = store[self.path]
+            return (df if columns is None else df[columns]).iloc[list(rows)]
+
+    def nrows(self):
+        """ Returns the number of stored rows. """
+        with self.open('r') as store:
+            storer = store.get_storer(self.path)
+            return storer.nrows if storer.is_table else storer.group.axis1.shape[0]
+
+    def chunks(self, size=100000):
+        """
+        Returns the list of `(start, stop)` row ranges of at most `size` rows, which are read one by one with `load(start=start, stop=stop)`.
+
+        Results in the fixed format can only be read at once, i.e. they form a single chunk.
+        """
+        with self.open('r') as store:
+            if not store.get_storer(self.path).is_table:
+                size = None
+        nrows = self.nrows()
+        size = size if size else max(nrows, 1)
+        return [ (start, min(start + size, nrows)) for start in range(0, nrows, size) ]
+
+    def columns(self):
+        """ Returns the list of stored columns. """
+        with self.open('r') as store:
+            storer = store.get_storer(self.path)
+            if storer.is_table:
+                return [ c for key in self.keys(store) for c in store.get_storer(key).non_index_axes[0][1] ]
+            return [ c.decode() if isinstance(c, bytes) else str(c) for c in storer.group.axis0.read() ]
+
+    def dtypes(self):
+        """ Returns a dict with the dtypes of all stored columns (without loading any row). """
+        with self.open('r') as store:
+            if store.get_storer(self.path).is_table:
+                return self.select(store, start=0, stop=0).dtypes.to_dict()
+            return store.select(self.path, start=0, stop=0).dtypes.to_dict()
+
+    def attr(self, name, default=None):
+        """ Returns the stored attribute `name` (e.g. `'config'`). """
+        with self.open('r') as store:
+            return getattr(store.get_storer(self.path).attrs, name, default)
+
+    def setattrs(self, store, attrs):
+        """ Stores the attributes `attrs` and the keys of the tables (see `ScanLHA.storage.HDFStorage.layout`). """
+        storer = store.get_storer(self.path)
+        for name,value in attrs.items():
+            setattr(storer.attrs, name, value)
+        if self.tables and len(self.tables) > 1:
+            storer.attrs.tables = [ key for key,_ in self.tables ]
+
+    def save(self, df, **attrs):
+        """
+        Saves the DataFrame `df` together with the attributes `attrs` (e.g. `config=Config(...)`).
+
+        Empty DataFrames and DataFrames which cannot be stored as a table are stored in the fixed format.
+        """
+        self.remove()
+        with self.open() as store:
+            self.tables = self.layout(list(df.columns))
+            try:
+                if df.empty:
+                    raise ValueError('empty DataFrame')
+                with catch_warnings():
+                    # PyTables' NaturalNameWarning for data columns such as 'MASS.values.25'
+                    filterwarnings('ignore', message='object name is not a valid Python identifier')
+                    for key,columns in self.tables:
+                        store.put(key, df[columns], format='table', data_columns=[ c for c in self.data_columns if c in columns ])
+            except Exception as e:
+                if not df.empty:
+                    logging.warning('Could not store {} in table format ({}), using the fixed format.'.format(self.filename, str(e).strip().split('\n')[0]))
+                for key,_ in self.tables:
+                    if key in store:
+                        store.remove(key)
+                self.tables = None
+                store.put(self.path, df)
+            self.setattrs(store, attrs)
+        self.tables = None
+
+    def append(self, df, **attrs):
+        """
+        Appends the DataFrame `df` to the stored results using the HDF table format.
+
+        All appended DataFrames must have the same columns and dtypes.
+        The width of string columns is fixed by the first append (at least `self.itemsize` characters).
+        If a later DataFrame contains longer strings, the stored tables are rewritten with wider string columns
+        (see `ScanLHA.storage.HDFStorage.widen`). The series of appends is finished by `ScanLHA.storage.HDFStorage.close`.
+        """
+        self.attrs.update(attrs)
+        if df.empty:
+            self.empty = df if self.empty is None else self.empty
+            return
+        strings = [ c for c in df.columns if df[c].dtype.kind not in 'biufc' ]
+        lengths = [ int(df[c].str.len().max()) for c in strings ]
+        length = max([ n for n in lengths if n == n ] + [0])
+        try:
+            with self.open() as store:
+                if self.tables is None:
+                    self.tables = self.layout(list(df.columns))
+                    self.limits = { 'values' : max(self.itemsize, length) }
+                elif length > self.limits['values']:
+                    self.widen(store, max(length, 2*self.limits['values']))
+                with catch_warnings():
+                    filterwarnings('ignore', message='object name is not a valid Python identifier')
+                    for key,columns in self.tables:
+                        store.append(key, df[columns], format='table', index=False,
+                                min_itemsize=self.limits if any(c in strings for c in columns) else None,
+                                data_columns=[ c for c in self.data_columns if c in columns ])
+                self.setattrs(store, self.attrs)
+        except Exception as e:
+            logging.error('Could not append to {} ({}).'.format(self.filename, str(e).strip().split('\n')[0]))
+            exit(1)
+
+    def widen(self, store, length):
+        """ Rewrites the stored tables with string columns chunk by chunk such that the string columns hold `length` characters. """
+        logging.info('Rewriting {} with string columns of {} characters.'.format(self.filename, length))
+        self.limits = { 'values' : length }
+        for key,columns in self.tables:
+            storer = store.get_storer(key)
+            if all(dtype.kind in 'biufc' for dtype in store.select(key, start=0, stop=0).dtypes):
+                continue
+            tmp = key + '_widened'
+            for start in range(0, storer.nrows, 100000):
+                store.append(tmp, store.select(key, start=start, stop=start + 100000), format='table', index=False,
+                        min_itemsize=self.limits, data_columns=[ c for c in self.data_columns if c in columns ])
+            store.remove(key)
+            store.get_node(tmp)._f_rename(key.rstrip('/').split('/')[-1])
+
+    def close(self):
+        """ Finish a series of `ScanLHA.storage.HDFStorage.append`s and index the data columns. """
+        if self.tables is not None:
+            with self.open() as store, catch_warnings():
+                filterwarnings('ignore', message='object name is not a valid Python identifier')
+                for key,_ in self.tables:
+                    store.create_table_index(key)
+        elif self.empty is not None:
+            self.save(self.empty, **self.attrs)
+        self.limits = None
+        self.tables = None
+        self.empty = None
+        self.attrs = {}
+
+    def remove(self):
+        """ Removes the stored results (but not the file). """
+        if not os.path.exists(self.filename):
+            return
+        with self.open() as store:
+            if self.path in store:
+                for key in self.keys(store):
+                    if key in store:
+                        store.remove(key)
+
+class ParquetStorage():
+    """
+    Results stored in a Parquet file or, if `filename` is a directory, in a multi-file Arrow dataset.
+
+    Saving into a directory adds a new file to the dataset (i.e. appends). Columns that are not present in all files are filled with NaN.
+    Each file is written with row-group statistics and the compression `compression` (default: `'zstd'`, `'none'` disables compression).
+    The statistics are available for all columns, i.e. `data_columns` is ignored.
+
+    Attributes are pickled into the key-value metadata of the Parquet schema.
+    """
+    def __init__(self, filename, path='results', compression=None, data_columns=None):
+        if pa is None:
+            logging.error('The Parquet backend needs pyarrow (pip3 install pyarrow).')
+            exit(1)
+        self.filename = filename
+        self.path = path
+        self.compression = compression if compression else 'zstd'
+        self.writer = None
+
+    def files(self):
+        """ Returns the list of Parquet files of the dataset. """
+        if os.path.isdir(self.filename):
+            return sorted(glob(os.path.join(self.filename, '*.parquet')))
+        return [self.filename]
+
+    def schema(self):
+        """
+        Returns the (unified) Arrow schema of all files.
+
+        Columns whose type differs between the files are promoted (e.g. `int64` and `double` to `double`),
+        the files are cast to this schema when they are read.
+        """
+        return pa.unify_schemas([ pq.read_schema(f) for f in self.files() ], promote_options='permissive')
+
+    def dataset(self):
+        """ Returns the `pyarrow.dataset.Dataset` of all files. """
+        return ds.dataset(self.files(), schema=self.schema(), format='parquet')
+
+    def load(self, columns=None, filters=None, stop=None, start=None):
+        """
+        Returns the stored DataFrame, optionally only the list of `columns` and the first `stop` rows
+        (the rows `start` to `stop` if `start` is given, see `ScanLHA.storage.ParquetStorage.chunks`).
+
+        `filters` are passed to `pyarrow.parquet.read_table` and make use of the row-group statistics,
+        e.g. `[('MASS.values.25', '>', 123)]`.
+        """
+        if start is not None:
+            return applyfilters(self.rows(start, stop, columns), filters if filters else [])
+        filters = filters if filters else None
+        if os.path.isdir(self.filename) or stop is not None:
+            filters = pq.filters_to_expression(filters) if filters else None
+            if stop is not None:
+                return self.dataset().head(stop, columns=columns, filter=filters).to_pandas()
+            return self.dataset().to_table(columns=columns, filter=filters).to_pandas()
+        return pq.read_table(self.filename, columns=columns, filters=filters).to_pandas()
+
+    def take(self, rows, columns=None):
+        """ Returns the (sorted) row numbers `rows` of the stored DataFrame, optionally only the list of `columns`. """
+        return self.dataset().take(list(rows), columns=columns).to_pandas()
+
+    def rows(self, start, stop, columns=None):
+        """ Returns the rows `start` to `stop`, reading only the row groups which contain them. """
+        schema = self.schema()
+        columns = schema.names if columns is None else list(columns)
+        chunks = []
+        offset = 0
+        for f in self.files():
+            if stop is not None and offset >= stop:
+                break
+            pf = pq.ParquetFile(f)
+            for i in range(pf.metadata.num_row_groups):
+                length = pf.metadata.row_group(i).num_rows
+                if offset + length > start and (stop is None or offset < stop):
+                    names = [ c for c in columns if c in pf.schema_arrow.names ]
+                    table = pf.read_row_group(i, columns=names)
+                    df = table.cast(pa.schema([ schema.field(n) for n in table.schema.names ])).to_pandas()
+                    chunks.append(df.iloc[max(start - offset, 0):None if stop is None else stop - offset])
+                offset += length
+        df = concat(chunks, ignore_index=True) if chunks else schema.empty_table().to_pandas()
+        return df.reindex(columns=columns)
+
+    def chunks(self, size=100000):
+        """
+        Returns the list of `(start, stop)` row ranges of about `size` rows, which are read one by one with `load(start=start, stop=stop)`.
+
+        The ranges consist of whole row groups of a single file.
+        """
+        ranges = []
+        start = stop = 0
+        for f in self.files():
+            metadata = pq.ParquetFile(f).metadata
+            for i in range(metadata.num_row_groups):
+                stop += metadata.row_group(i).num_rows
+                if stop - start >= size:
+                    ranges.append((start, stop))
+                    start = stop
+            if stop > start:
+                ranges.append((start, stop))
+                start = stop
+        return ranges
+
+    def nrows(self):
+        """ Returns the number of stored rows. """
+        return sum(pq.ParquetFile(f).metadata.num_rows for f in self.files())
+
+    def columns(self):
+        """ Returns the list of stored columns. """
+        return self.schema().names
+
+    def dtypes(self):
+        """ Returns a dict with the dtypes of all stored columns (without loading any row). """
+        return self.schema().empty_table().to_pandas().dtypes.to_dict()
+
+    def attr(self, name, default=None):
+        """ Returns the stored attribute `name` (e.g. `'config'`) of the first file of the dataset which provides it. """
+        key = '{}.{}'.format(self.path, name).encode()
+        for f in self.files():
+            metadata = pq.read_schema(f).metadata or {}
+            if key in metadata:
+                return pickle.loads(metadata[key])
+        return default
+
+    def save(self, df, **attrs):
+        """ Saves the DataFrame `df` together with the attributes `attrs` (e.g. `config=Config(...)`). """
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        metadata = dict(table.schema.metadata or {})
+        metadata.update({ '{}.{}'.format(self.path, n).encode() : pickle.dumps(v) for n,v in attrs.items() })
+        table = table.replace_schema_metadata(metadata)
+        filename = self.filename
+        if os.path.isdir(filename) or filename.endswith(os.sep):
+            os.makedirs(filename, exist_ok=True)
+            filename = os.path.join(filename, 'part-{}.parquet'.format(uuid4().hex))
+        pq.write_table(table, filename, compression=self.compression, write_statistics=True)
+
+    def append(self, df, **attrs):
+        """
+        Appends the DataFrame `df` to the stored results.
+
+        For datasets, each DataFrame is saved into a new file. For single files, a row group is added to the open file
+        which needs to be finished with `ScanLHA.storage.ParquetStorage.close`.
+        All appended DataFrames must have the same columns and dtypes; `attrs` of the first append are stored.
+        """
+        if os.path.isdir(self.filename) or self.filename.endswith(os.sep):
+            return self.save(df, **attrs)
+        if self.writer is None:
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            metadata = dict(table.schema.metadata or {})
+            metadata.update({ '{}.{}'.format(self.path, n).encode() : pickle.dumps(v) for n,v in attrs.items() })
+            self.writer = pq.ParquetWriter(self.filename, table.schema.with_metadata(metadata), compression=self.compression, write_statistics=True)
+        self.writer.write_table(pa.Table.from_pandas(df, schema=self.writer.schema, preserve_index=False))
+
+    def close(self):
+        """ Finish a series of `ScanLHA.storage.ParquetStorage.append`s. """
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+    def remove(self):
+        """ Removes the stored results. """
+        for f in self.files():
+            if os.path.isfile(f):
+                os.remove(f)
+
+STORAGES = {
+        '.h5': HDFStorage,
+        '.hdf': HDFStorage,
+        '.hdf5': HDFStorage,
+        '.parquet': ParquetStorage,
+        '.pq': ParquetStorage
+        }
+"""
+Maps file extensions onto storage backends.
+"""
+
+def getStorage(filename, path='results', **kwargs):
+    """
+    Returns the storage backend for `filename` (see `ScanLHA.storage.STORAGES`).
+
+    Directories are treated as Parquet datasets, unknown extensions as HDF files.
+    Further `kwargs` (e.g. `compression` or `data_columns`) are passed to the backend.
+    """
+    if os.path.isdir(filename) or filename.endswith(os.sep):
+        return ParquetStorage(filename, path, **kwargs)
+    ext = os.path.splitext(filename)[1].lower()
+    return STORAGES.get(ext, HDFStorage)(filename, path, **kwargs)
+
+OPERATORS = {
+        '==': lambda s,v: s == v,
+        '=': lambda s,v: s == v,
+        '!=': lambda s,v: s != v,
+        '<': lambda s,v: s < v,
+        '<=': lambda s,v: s <= v,
+        '>': lambda s,v: s > v,
+        '>=': lambda s,v: s >= v,
+        'in': lambda s,v: s.isin(v),
+        'not in': lambda s,v: ~s.isin(v)
+        }
+"""
+Operators of the `filters` of `ScanLHA.storage.Dataset`.
+"""
+
+def applyfilters(df, filters):
+    """ Returns the rows of the DataFrame `df` which fulfill all `filters` (list of `(column, operator, value)` tuples). """
+    for col,op,value in filters:
+        df = df[OPERATORS[op](df[col], value)]
+    return df
+
+class Dataset():
+    """
+    Lazy view on the results stored in several `files` (under the tree `path`), e.g. `DATA` in `ScanLHA.EditLHA`.
+
+    No data is read before it is needed, i.e. opening hundreds of files is instant. Selecting columns and filtering rows
+    returns new views:
+
+        In [1]: DATA.columns
+        In [2]: view = DATA[['MINPAR.values.1', 'MASS.values.25']].filter([('MASS.values.25', '>', 120)])
+        In [3]: view.head(10)
+        In [4]: DATA['MASS.values.25'].sample(1000)
+        In [5]: df = DATA['scan1.h5'].load()
+        In [6]: for df in view.chunks(): ...
+
+    `head`, `sample`, `load` and `chunks` read only the selected columns (and the columns needed by the filters)
+    and return `pandas.DataFrame`s with the additional column `file`.
+    `filters` are lists of `(column, operator, value)` tuples (see `ScanLHA.storage.OPERATORS`) which are combined by AND.
+    They are pushed down to the Parquet backend; filters on the column `file` select files without reading them.
+    Single files are selected by their name in `files` or their path relative to the working directory.
+    """
+    def __init__(self, files, path='results', columns=None, filters=None):
+        self.files = list(files)
+        self.path = path
+        self.selection = [columns] if isinstance(columns, str) else columns
+        self.filters = list(filters) if filters else []
+
+    def view(self, files=None, columns=None, filters=[]):
+        """ Returns a new view on the `files` with the selected `columns` and additional `filters`. """
+        return Dataset(self.files if files is None else files, self.path,
+                self.selection if columns is None else columns, self.filters + list(filters))
+
+    def filter(self, filters):
+        """ Returns the view on all rows which fulfill the `filters` (e.g. `[('MASS.values.25', '>', 120)]`). """
+        return self.view(filters=filters)
+
+    def __getitem__(self, key):
+        if isinstance(key, str) and key in self.files:
+            return self.view(files=[key])
+        if isinstance(key, str) and os.path.abspath(key) in self.files:
+            return self.view(files=[os.path.abspath(key)])
+        return self.view(columns=key)
+
+    def stores(self):
+        """ Returns the list of `(filename, storage backend)` of all files passing the filters on the column `file`. """
+        files = applyfilters(Series(self.files, name='file').to_frame(), [ f for f in self.filters if f[0] == 'file' ])['file']
+        return [ (f, getStorage(f, self.path)) for f in files ]
+
+    @property
+    def rowfilters(self):
+        """ Filters on stored columns. """
+        return [ f for f in self.filters if f[0] != 'file' ]
+
+    @property
+    def columns(self):
+        """ The list of selected columns, by default the union of all stored columns and `file`. """
+        if self.selection is not None:
+            return list(self.selection)
+        columns = [ c for _,store in self.stores() for c in store.columns() ]
+        return list(dict.fromkeys(columns)) + ['file']
+
+    def __len__(self):
+        if self.rowfilters:
+            return sum(len(df) for df in self.view(columns=['file']).chunks())
+        return sum(store.nrows() for _,store in self.stores())
+
+    def __repr__(self):
+        return '<Dataset of {} files, columns: {}, filters: {}>'.format(len(self.files),
+                'all' if self.selection is None else ', '.join(self.selection), self.filters)
+
+    def read(self, f, store, stop=None, rows=None):
+        """ Reads the selected columns of the rows passing the filters from `store` (file `f`). """
+        stored = store.columns()
+        selection = self.selection if self.selection is not None else stored + ['file']
+        needed = list(dict.fromkeys([ c for c in selection if c != 'file' ] + [ col for col,_,_ in self.rowfilters ]))
+        columns = [ c for c in needed if c in stored ]
+        filters = [ flt for flt in self.rowfilters if flt[0] in stored ] or None
+        if rows is not None:
+            df = store.take(rows, columns=columns)
+        elif self.rowfilters:
+            df = store.load(columns=columns, filters=filters)
+        else:
+            df = store.load(columns=columns, stop=stop)
+        df = applyfilters(df.reindex(columns=needed), self.rowfilters)
+        df = df.assign(file=f)
+        return df[selection].iloc[:stop]
+
+    def chunks(self):
+        """ Iterates over the selected data file by file. """
+        for f,store in self.stores():
+            yield self.read(f, store)
+
+    def load(self):
+        """ Materializes the selected data of all files into one DataFrame. """
+        chunks = list(self.chunks())
+        return concat(chunks, ignore_index=True) if chunks else DataFrame(columns=self.columns)
+
+    def head(self, n=5):
+        """ Returns the first `n` selected rows. """
+        chunks = []
+        for f,store in self.stores():
+            if n <= 0:
+                break
+            chunks.append(self.read(f, store, stop=n))
+            n -= len(chunks[-1])
+        return concat(chunks, ignore_index=True) if chunks else DataFrame(columns=self.columns)
+
+    def sample(self, n=5, random_state=None):
+        """ Returns `n` randomly chosen rows, reading only these rows if no row filters are set. """
+        if self.rowfilters:
+            return self.load().sample(n, random_state=random_state)
+        stores = self.stores()
+        lengths = [ store.nrows() for _,store in stores ]
+        rows = sorted(default_rng(random_state).choice(sum(lengths), size=min(n, sum(lengths)), replace=False))
+        chunks = []
+        start = 0
+        for (f,store),length in zip(stores, lengths):
+            take = [ r - start for r in rows if start <= r < start + length ]
+            if take:
+                chunks.append(self.read(f, store, rows=take))
+            start += length
+        return concat(chunks, ignore_index=True) if chunks else DataFrame(columns=self.columns)
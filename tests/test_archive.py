@@ -0,0 +1,49 @@
+import lzma
+import os
+import numpy as np
+import pandas as pd
+import pytest
+import ScanLHA.archive as archive
+from ScanLHA.archive import Archive, COLUMNS, readArchived, reparse
+
+FORMATS = ['xz', pytest.param('zstd', marks=pytest.mark.skipif(archive.zstandard is None, reason='needs zstandard'))]
+
+def spectrum(mass):
+    return 'BLOCK MASS\n 25 {}\n 35 {}\nBLOCK HMIX\n 1 {} # µ\n'.format(mass, 2*mass, mass/10)
+
+@pytest.mark.parametrize('fmt', FORMATS)
+def test_roundtrip(tmp_path, fmt):
+    a = Archive(str(tmp_path / 'archive'), fmt)
+    assert a.filename.endswith(archive.FORMATS[fmt])
+    frames = [ a.append(spectrum(m)) for m in (125., 126., 127.) ]
+    # one frame per point appended to the same file
+    assert { f['archive_file'] for f in frames } == {a.filename}
+    assert [ f['archive_offset'] for f in frames ] == [0, frames[0]['archive_size'], frames[0]['archive_size'] + frames[1]['archive_size']]
+    assert os.path.getsize(a.filename) == sum(f['archive_size'] for f in frames)
+    # frames are read independently of each other
+    for f,m in reversed(list(zip(frames, (125., 126., 127.)))):
+        assert readArchived(*[ f[c] for c in COLUMNS ]) == spectrum(m)
+    if fmt == 'xz':
+        # the whole file is a valid multi-stream xz file
+        with open(a.filename, 'rb') as f:
+            assert lzma.decompress(f.read()).decode('utf8') == ''.join(spectrum(m) for m in (125., 126., 127.))
+
+@pytest.mark.parametrize('fmt', FORMATS)
+def test_reparse(tmp_path, fmt):
+    a = Archive(str(tmp_path / 'archive'), fmt)
+    df = pd.DataFrame([a.append(spectrum(125.)), {}, a.append(spectrum(126.))], index=[3, 5, 7])
+    df['archive_offset'] = df['archive_offset'].astype(float) # as stored with missing values
+    result = reparse(df)
+    assert list(result.index) == [3, 5, 7]
+    np.testing.assert_array_equal(result['MASS.values.25'], [125., np.nan, 126.])
+    np.testing.assert_array_equal(result['HMIX.values.1'], [12.5, np.nan, 12.6])
+    assert {c.split('.')[0] for c in reparse(df, blocks=['HMIX']).columns} == {'HMIX'}
+
+def test_missing_zstandard(tmp_path, monkeypatch):
+    monkeypatch.setattr(archive, 'zstandard', None)
+    with pytest.raises(SystemExit):
+        Archive(str(tmp_path), 'zstd')
+    with pytest.raises(SystemExit):
+        readArchived(str(tmp_path / 'slha.zst'), 0, 1)
+    with pytest.raises(SystemExit):
+        Archive(str(tmp_path), 'gzip')
@@ -0,0 +1,30 @@
+import os
+import time
+from ScanLHA import ScanLHA
+from ScanLHA.ScanLHA import prunecache
+
+def test_prunecache(tmp_path):
+    now = time.time()
+    for i in range(6):
+        f = tmp_path / '{}.pickle'.format(i)
+        f.write_bytes(b'')
+        # file i was last used i days ago
+        os.utime(f, (now - i*86400 - 60, now - i*86400 - 60))
+    (tmp_path / 'micromegas').mkdir()
+    prunecache(str(tmp_path), maxage=3.5, maxfiles=3)
+    assert sorted(os.listdir(tmp_path)) == ['0.pickle', '1.pickle', '2.pickle', 'micromegas']
+    prunecache(str(tmp_path), maxage=1.5, maxfiles=3)
+    assert sorted(os.listdir(tmp_path)) == ['0.pickle', '1.pickle', 'micromegas']
+
+def test_loadconfig_version(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(ScanLHA, 'CACHE', str(tmp_path / 'cache'))
+    (tmp_path / 'scan.yml').write_text('runner: {defaults: false}\nblocks: []\n')
+    assert ScanLHA.loadconfig('scan.yml').valid
+    assert len(os.listdir(tmp_path / 'cache')) == 1
+    ScanLHA.loadconfig('scan.yml')
+    assert len(os.listdir(tmp_path / 'cache')) == 1
+    # another version does not reuse the cached config
+    monkeypatch.setattr(ScanLHA, '__version__', '0.0.1')
+    ScanLHA.loadconfig('scan.yml')
+    assert len(os.listdir(tmp_path / 'cache')) == 2
@@ -0,0 +1,31 @@
+import os
+import sys
+import pandas as pd
+from ScanLHA import EditLHA
+from ScanLHA.storage import HDFStorage
+
+def edit(monkeypatch, *files):
+    """ Runs EditLHA on `files` and returns the variables of the interactive session. """
+    session = {}
+    monkeypatch.setattr(sys, 'argv', ['EditLHA'] + list(files))
+    monkeypatch.setattr(EditLHA, 'ipy', True)
+    monkeypatch.setattr(EditLHA, 'embed', lambda header: session.update(sys._getframe(1).f_locals), raising=False)
+    EditLHA.Edit()
+    return session
+
+def test_relative_paths_after_chdir(tmp_path, monkeypatch):
+    os.makedirs(tmp_path / 'results')
+    df = pd.DataFrame({'MINPAR.values.1': [1.0, 2.0], 'MASS.values.25': [125.0, 126.0]})
+    HDFStorage(str(tmp_path / 'results' / 'scan1.h5')).save(df, config={'a': 1})
+    HDFStorage(str(tmp_path / 'results' / 'scan2.h5')).save(df)
+    monkeypatch.chdir(tmp_path)
+
+    session = edit(monkeypatch, 'results/scan1.h5')
+    assert os.getcwd() == str(tmp_path / 'results')
+    pd.testing.assert_frame_equal(session['DATA'].load().drop(columns='file'), df)
+    assert session['conf'] == {'a': 1}
+
+    monkeypatch.chdir(tmp_path)
+    session = edit(monkeypatch, 'results/scan*.h5')
+    assert len(session['DATA'].load()) == 4
+    assert len(session['DATA']['scan2.h5'].load()) == 2
@@ -0,0 +1,77 @@
+import logging
+import math
+import numpy as np
+import pandas as pd
+import pytest
+from ScanLHA.expressions import VECTORIZED, evaluate
+
+DOMAINS = {
+        'acosh': [1.0, 1.5, 7.25],
+        'atanh': [-0.5, 0.1, 0.9],
+        'acos': [-0.5, 0.1, 0.9],
+        'asin': [-0.5, 0.1, 0.9],
+        'log': [0.1, 2.0, 1e5],
+        'log10': [0.1, 2.0, 1e5],
+        'log2': [0.1, 2.0, 1e5],
+        'log1p': [-0.5, 2.0, 1e5],
+        'sqrt': [0.0, 2.0, 1e5]
+        }
+""" Arguments within the domain of the scalar functions (default: `[-2.5, 0.1, 3.7]`). """
+
+BINARY = {
+        'atan2': ([-1.0, 0.0, 2.0], [-1.0, 1.0, -3.0]),
+        'copysign': ([1.0, 2.0, 3.0], [-1.0, 1.0, -0.0]),
+        'fmod': ([-7.5, 7.5, 3.0], [2.0, -2.0, 4.0]),
+        'hypot': ([3.0, -1.0, 0.0], [4.0, 2.0, 0.0]),
+        'pow': ([2.0, 0.5, 9.0], [3.0, -1.0, 0.5]),
+        'nextafter': ([1.0, 0.0, -2.0], [2.0, -1.0, 0.0]),
+        'ldexp': ([1.5, -2.0, 3.0], [2, 0, -3]),
+        'gcd': ([12, 7, 0], [18, 3, 5]),
+        'lcm': ([4, 7, 0], [6, 3, 5])
+        }
+
+def scalar(name):
+    return abs if name == 'abs' else getattr(math, name, None)
+
+@pytest.mark.parametrize('name', sorted( n for n in VECTORIZED if n not in BINARY and scalar(n) ))
+def test_unary_parity(name):
+    data = pd.DataFrame({'x': DOMAINS.get(name, [-2.5, 0.1, 3.7])})
+    vectorized = evaluate("{}(DATA['x'])".format(name), {'DATA': data})
+    expected = data['x'].apply(scalar(name))
+    assert np.allclose(np.asarray(vectorized, dtype=float), expected.astype(float).values)
+    assert np.asarray(vectorized).dtype.kind == np.asarray(expected.tolist()).dtype.kind
+
+@pytest.mark.parametrize('name', sorted(BINARY))
+def test_binary_parity(name):
+    x, y = BINARY[name]
+    data = pd.DataFrame({'x': x, 'y': y})
+    vectorized = evaluate("{}(DATA['x'], DATA['y'])".format(name), {'DATA': data})
+    expected = [ getattr(math, name)(a, b) for a,b in zip(x, y) ]
+    assert np.allclose(np.asarray(vectorized, dtype=float), expected)
+
+def test_arg_and_log_base():
+    data = pd.DataFrame({'re': [-1.0, -0.0, 1.0, 0.0], 'im': [-0.0, 0.0, 1.0, -2.0], 'x': [2.0, 8.0, 1.0, 0.5]})
+    assert np.allclose(evaluate("arg(DATA['re'], DATA['im'])", {'DATA': data}), [math.pi, 0.0, math.pi/4, -math.pi/2])
+    assert np.allclose(evaluate("log(DATA['x'], 2)", {'DATA': data}), [ math.log(v, 2) for v in data['x'] ])
+
+def test_apply(caplog):
+    data = pd.DataFrame({'x': [0.5, -1.0, 2.0]})
+    result = evaluate("DATA['x'].apply(abs).apply(tan)", {'DATA': data})
+    assert np.allclose(result, data['x'].apply(lambda v: math.tan(abs(v))))
+    assert not caplog.records
+
+def test_domain_errors_are_logged(caplog):
+    data = pd.DataFrame({'x': [4.0, -1.0, 0.0]})
+    with caplog.at_level(logging.WARNING):
+        roots = evaluate("sqrt(DATA['x'])", {'DATA': data})
+        logs = evaluate("log(DATA['x'])", {'DATA': data})
+    assert roots[0] == 2 and np.isnan(roots[1])
+    assert logs[2] == -np.inf
+    messages = ' '.join(r.getMessage() for r in caplog.records)
+    assert 'sqrt' in messages and 'invalid value' in messages and 'divide by zero' in messages
+    assert not evaluate("sqrt(DATA['x']) < 3", {'DATA': data})[1]
+
+def test_rounding_with_nan():
+    data = pd.DataFrame({'x': [1.5, np.nan]})
+    result = evaluate("floor(DATA['x'])", {'DATA': data})
+    assert result[0] == 1 and np.isnan(result[1])
@@ -0,0 +1,34 @@
+import subprocess
+import sys
+import pytest
+
+HEAVY = ['numpy', 'pandas', 'matplotlib', 'IPython', 'tqdm', 'pyarrow', 'tables']
+""" Packages which must not be imported by the lazy entry points. """
+
+BUDGETS = {
+        'ScanLHA': 0.05,
+        'ScanLHA.config': 0.25,
+        'ScanLHA.ScanLHA': 0.25,
+        'ScanLHA.PlotLHA': 0.25
+        }
+""" Cumulative import times (in seconds) reported by `python -X importtime`. """
+
+def importtime(module):
+    """ Returns the dict of all imported modules and their cumulative import time (in seconds) for a fresh `import module`. """
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import ' + module], capture_output=True, text=True, check=True)
+    times = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line.split('|')
+        times[name.strip()] = int(cumulative)/1e6
+    return times
+
+@pytest.mark.parametrize('module', BUDGETS)
+def test_importtime(module):
+    # the first run warms the bytecode cache
+    importtime(module)
+    times = importtime(module)
+    heavy = [ m for m in times if m.split('.')[0] in HEAVY ]
+    assert not heavy, '{} imports {}'.format(module, ', '.join(heavy))
+    assert times[module] < BUDGETS[module], '{} takes {:.3f}s to import'.format(module, times[module])
@@ -0,0 +1,11 @@
+import io
+import ctypes.util
+import pytest
+from ScanLHA.library import serve, COUNT, HEADER
+
+@pytest.mark.skipif(not ctypes.util.find_library('m'), reason='libm not found')
+@pytest.mark.parametrize('data', [b'', COUNT.pack(2), COUNT.pack(2) + b'\0'*12])
+def test_serve_eof(data):
+    fout = io.BytesIO()
+    serve(ctypes.util.find_library('m'), 'cos', 1, 0, io.BytesIO(data), fout)
+    assert fout.getvalue() == HEADER.pack(0, 0)
@@ -0,0 +1,73 @@
+import os
+import sys
+import numpy as np
+import pandas as pd
+import pytest
+from ScanLHA import MergeLHA
+from ScanLHA.storage import getStorage
+
+def merge(monkeypatch, *args):
+    monkeypatch.setattr(sys, 'argv', ['MergeLHA', '-p', '2'] + [ str(a) for a in args ])
+    MergeLHA.Merge()
+
+def results(n, offset=0, log='ok'):
+    return pd.DataFrame({
+        'input_parameters.MSUSY': np.arange(offset, offset + n, dtype=float),
+        'MASS.values.25': np.arange(n, dtype=float) + 120,
+        'log': [log]*n
+        })
+
+def test_merge_chunks(tmp_path, monkeypatch):
+    getStorage(str(tmp_path / 'a.h5')).save(results(25), config={'a': 1})
+    getStorage(str(tmp_path / 'b.h5')).save(results(10, 25, log='x'*500), config={'a': 1})
+    merge(monkeypatch, '-c', 7, tmp_path / 'a.h5', tmp_path / 'b.h5', tmp_path / 'merged.h5')
+    merged = getStorage(str(tmp_path / 'merged.h5'))
+    df = merged.load()
+    assert df['input_parameters.MSUSY'].tolist() == list(range(35))
+    assert df['log'].tolist() == ['ok']*25 + ['x'*500]*10
+    assert merged.attr('config') == {'a': 1}
+
+def test_merge_unique_parquet(tmp_path, monkeypatch):
+    os.makedirs(tmp_path / 'in')
+    for i in range(3):
+        getStorage(str(tmp_path / 'in' / 'part{}.parquet'.format(i))).save(results(10, 5*i))
+    merge(monkeypatch, '-u', '-c', 4, tmp_path / 'in' / '*.parquet', str(tmp_path / 'out') + os.sep)
+    df = getStorage(str(tmp_path / 'out') + os.sep).load()
+    assert sorted(df['input_parameters.MSUSY'].tolist()) == list(range(20))
+
+def test_merge_lhapath(tmp_path, monkeypatch):
+    getStorage(str(tmp_path / 'a.h5'), 'scan2').save(results(3), config={'a': 1})
+    monkeypatch.setenv('LHAPATH', 'scan2')
+    merge(monkeypatch, tmp_path / 'a.h5', tmp_path / 'merged.h5')
+    assert len(getStorage(str(tmp_path / 'merged.h5'), 'scan2').load()) == 3
+
+def test_refuse_inplace(tmp_path, monkeypatch):
+    out = str(tmp_path / 'out') + os.sep
+    for i in range(2):
+        getStorage(out).save(results(5, 5*i))
+    parts = sorted(os.listdir(out))
+    with pytest.raises(SystemExit):
+        merge(monkeypatch, tmp_path / 'out' / '*.parquet', out)
+    assert sorted(os.listdir(out)) == parts
+    assert len(getStorage(out).load()) == 10
+
+    getStorage(str(tmp_path / 'a.h5')).save(results(5))
+    with pytest.raises(SystemExit):
+        merge(monkeypatch, tmp_path / '*.h5', tmp_path / 'a.h5')
+    assert len(getStorage(str(tmp_path / 'a.h5')).load()) == 5
+
+def test_merge_wide(tmp_path, monkeypatch):
+    conf = {'runner': {'data_columns': ['MASS.values.25']}}
+    wide = [ pd.DataFrame(np.random.rand(6, 2000), columns=[ 'DECAY.values.{}'.format(i) for i in range(2000) ]) for _ in range(2) ]
+    for i,df in enumerate(wide):
+        getStorage(str(tmp_path / '{}.h5'.format(i))).save(pd.concat([results(6, 6*i), df], axis=1), config=conf)
+    merge(monkeypatch, '-c', 4, tmp_path / '0.h5', tmp_path / '1.h5', tmp_path / 'merged.h5')
+    merged = getStorage(str(tmp_path / 'merged.h5'))
+    df = merged.load()
+    assert df['input_parameters.MSUSY'].tolist() == list(range(12))
+    assert df[wide[0].columns].values.tolist() == pd.concat(wide).values.tolist()
+    with pd.HDFStore(merged.filename, 'r') as store:
+        storer = store.get_storer('results')
+        assert storer.is_table and len(merged.keys(store)) > 1
+        assert 'MASS.values.25' in storer.table.colindexes
+    assert len(merged.load(filters=[('MASS.values.25', '>=', 124)])) == 4
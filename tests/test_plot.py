@@ -0,0 +1,183 @@
+import os
+import sys
+import numpy as np
+import pandas as pd
+import pytest
+import yaml
+import ScanLHA.PlotLHA as P
+from ScanLHA.storage import HDFStorage, getStorage
+
+@pytest.fixture
+def plotlha(tmp_path, monkeypatch):
+    """ Returns a function which writes the `scatterplot` config and runs PlotLHA (or `plot()` again) on a small data file. """
+    for name in ['MASKS', 'FIELDS', 'RENDERED']:
+        monkeypatch.setattr(P, name, {})
+    monkeypatch.setattr(P, 'FILTERS', [])
+    monkeypatch.chdir(tmp_path)
+    rng = np.random.default_rng(1)
+    df = pd.DataFrame({
+        'MINPAR.values.1': np.arange(50.),
+        'MINPAR.values.2': rng.uniform(1, 50, 50),
+        'MASS.values.25': rng.uniform(110, 130, 50),
+        'MASS.values.35': rng.uniform(200, 2000, 50)
+        })
+    for i in range(20):
+        df['UNUSED.values.{}'.format(i)] = rng.uniform(size=50)
+    getStorage(str(tmp_path / 'data.h5')).save(df)
+    def run(scatterplot, *args, directory=tmp_path, again=False, blocks=[]):
+        scatterplot['conf'] = dict({'datafile': str(tmp_path / 'data.h5'), 'rcParams': {'text.usetex': False}}, **scatterplot.get('conf', {}))
+        os.makedirs(directory, exist_ok=True)
+        (directory / 'plot.yml').write_text(yaml.safe_dump({'scatterplot': scatterplot, 'blocks': blocks}))
+        if again:
+            return P.plot(*args)
+        monkeypatch.setattr(sys, 'argv', ['PlotLHA', str(directory / 'plot.yml')] + list(args))
+        P.Plot()
+    return run, tmp_path
+
+def scatter(filename, x='MINPAR.values.1', y='MASS.values.25', **kwargs):
+    return dict({'filename': filename, 'x-axis': {'field': x}, 'y-axis': {'field': y}}, **kwargs)
+
+def entries(filename):
+    with pd.HDFStore(filename, 'r') as store:
+        return { store.get_storer(k).attrs.field : store.get_storer(k).attrs.expr for k in store.keys() }
+
+def test_sidecar(plotlha):
+    run, tmp_path = plotlha
+    sidecar = str(tmp_path / 'data.h5.newfields.h5')
+    newfields = {'ratio': "DATA['MASS.values.25']/DATA['MASS.values.35']", 'TB': "DATA['MINPAR.values.2']"}
+    run({'conf': {'newfields': newfields}, 'plots': [scatter('a.png', y='ratio')]})
+    assert entries(sidecar) == newfields
+    sizes = []
+    for factor in range(2, 8):
+        # editing an expression replaces the cached field
+        newfields['ratio'] = "{}*DATA['MASS.values.25']/DATA['MASS.values.35']".format(factor)
+        run({'conf': {'newfields': newfields}, 'plots': [scatter('a.png', y='ratio')]}, again=True)
+        assert entries(sidecar) == newfields
+        sizes.append(os.path.getsize(sidecar))
+    assert sizes[-1] <= sizes[0]
+    np.testing.assert_allclose(P.DATA['ratio'], 7*P.DATA['MASS.values.25']/P.DATA['MASS.values.35'])
+    # another identity of the data file invalidates all entries
+    os.utime(tmp_path / 'data.h5', ns=(0, 0))
+    P.computefields({'TB': newfields['TB']}, force=True)
+    assert entries(sidecar) == {'TB': newfields['TB']}
+
+def test_projection(plotlha, monkeypatch):
+    run, tmp_path = plotlha
+    loaded = []
+    load = HDFStorage.load
+    def spy(self, columns=None, **kwargs):
+        loaded.append(columns)
+        return load(self, columns=columns, **kwargs)
+    monkeypatch.setattr(HDFStorage, 'load', spy)
+    blocks = [{'block': 'MINPAR', 'lines': [{'parameter': 'MSUSY', 'id': 1, 'scan': [1, 50, 50]}]}]
+    scatterplot = {
+        'conf': {
+            'newfields': {'TB': "2*DATA['MINPAR.values.2']"},
+            'constraints': ["PDATA['MASS.values.35'] > 3*PDATA['MASS.values.25']"]
+            },
+        'plots': [
+            scatter('a.png', x='MSUSY', y='TB', **{'z-axis': {'field': 'MASS.values.25'}}),
+            {'filename': 'b.png', 'x-axis': {'field': 'MSUSY'}, 'plots': [{'y-axis': 'MASS.values.25'}, {'y-axis': 'TB'}]}
+            ]
+        }
+    run(scatterplot, blocks=blocks)
+    # the parameter MSUSY, the fields of the plots, newfields and constraints
+    assert [ sorted(c) for c in loaded ] == [['MASS.values.25', 'MASS.values.35', 'MINPAR.values.1', 'MINPAR.values.2']]
+    assert sorted(P.DATA.columns) == ['MASS.values.25', 'MASS.values.35', 'MINPAR.values.1', 'MINPAR.values.2', 'TB']
+    assert os.path.isfile(tmp_path / 'a.png') and os.path.isfile(tmp_path / 'b.png')
+    # only the fields which are not loaded yet are read
+    scatterplot['plots'].append(scatter('c.png', y='UNUSED.values.3'))
+    run(scatterplot, again=True, blocks=blocks)
+    assert loaded[1:] == [['UNUSED.values.3']]
+
+def test_parallel(plotlha, monkeypatch):
+    run, tmp_path = plotlha
+    import multiprocessing.pool
+    starmap = multiprocessing.pool.Pool.starmap
+    pools = []
+    def spy(self, func, tasks, *args, **kwargs):
+        pools.append(len(tasks))
+        return starmap(self, func, tasks, *args, **kwargs)
+    monkeypatch.setattr(multiprocessing.pool.Pool, 'starmap', spy)
+    scatterplot = {
+        'conf': {'constraints': ["PDATA['MASS.values.25'] < 125"]},
+        'plots': [
+            scatter('scatter.png', **{'z-axis': {'field': 'MASS.values.35', 'colorbar': True, 'tickpad': 2}}),
+            scatter('density.png', type='density', bins=10, label='points'),
+            {'filename': 'lines.png', 'x-axis': {'field': 'MINPAR.values.1'},
+                'plots': [{'y-axis': 'MASS.values.25', 'label': 'a'}, {'y-axis': 'MINPAR.values.2', 'label': 'b', 'constraints': []}]}
+            ]
+        }
+    run(scatterplot, '-j', '1', directory=tmp_path / 'serial')
+    run(scatterplot, '-j', '3', directory=tmp_path / 'parallel')
+    assert pools == [3]
+    for p in scatterplot['plots']:
+        serial = (tmp_path / 'serial' / p['filename']).read_bytes()
+        assert serial == (tmp_path / 'parallel' / p['filename']).read_bytes()
+
+def test_mask_cache(plotlha):
+    run, tmp_path = plotlha
+    heavy = "PDATA['MASS.values.35'] > 3*PDATA['MASS.values.25']"
+    light = "PDATA['ratio'] < 10"
+    cut = "PDATA['MASS.values.25'] < {}"
+    def scatterplot(expr, pushed=130):
+        return {
+            'conf': {'newfields': {'ratio': expr}, 'constraints': [heavy, cut.format(pushed)]},
+            'plots': [
+                scatter('a.png', **{'x-axis': {'field': 'MINPAR.values.1', 'boundaries': [5, 40]}}),
+                # the same constraint written differently shares the mask
+                scatter('b.png', constraints=['( PDATA["MASS.values.35"] > 3 * PDATA["MASS.values.25"] )', light, cut.format(pushed)])
+                ]
+            }
+    def masks(expr):
+        return [ m for k,m in P.MASKS.items() if k[2] == P.normalize(expr) ]
+    run(scatterplot("DATA['MASS.values.35']/DATA['MASS.values.25']"))
+    assert len(masks(heavy)) == len(masks(light)) == 1
+    assert len(P.MASKS) == 4 # heavy, light, the pushed cut and the boundaries
+    assert P.FILTERS == P.pushdown(P.c) != []
+    np.testing.assert_array_equal(masks(heavy)[0], P.DATA['MASS.values.35'] > 3*P.DATA['MASS.values.25'])
+    first = masks(heavy)[0]
+    # a changed newfield only invalidates the masks which use it
+    run(scatterplot("DATA['MASS.values.35']/DATA['MASS.values.25']/10"), again=True)
+    assert masks(heavy)[0] is first
+    current = [ m for k,m in P.MASKS.items() if k[2] == P.normalize(light) and k[1] == P.dependencies(light) ]
+    np.testing.assert_array_equal(current[0], P.DATA['MASS.values.35']/P.DATA['MASS.values.25']/10 < 10)
+    # other filters while loading the data invalidate all masks
+    run(scatterplot("DATA['MASS.values.35']/DATA['MASS.values.25']/10", pushed=120), again=True)
+    assert masks(heavy)[0] is not first
+    assert len(masks(heavy)[0]) == len(P.DATA) == (P.DATA['MASS.values.25'] < 120).sum()
+
+def test_rerender(plotlha, monkeypatch):
+    run, tmp_path = plotlha
+    rendered = []
+    render = P.render
+    def spy(p, *args):
+        rendered.append(p['filename'])
+        return render(p, *args)
+    monkeypatch.setattr(P, 'render', spy)
+    newfields = {'ratio': "DATA['MASS.values.35']/DATA['MASS.values.25']", 'TB': "DATA['MINPAR.values.2']"}
+    def scatterplot(label='c'):
+        return {
+            'conf': {'newfields': dict(newfields)},
+            'plots': [scatter('a.png', y='ratio'), scatter('b.png', y='TB'), scatter('c.png', **{'y-axis': {'field': 'MASS.values.25', 'label': label}})]
+            }
+    def again(config):
+        rendered.clear()
+        run(config, again=True)
+        return sorted(rendered)
+    run(scatterplot())
+    assert sorted(rendered) == ['a.png', 'b.png', 'c.png']
+    # nothing changed
+    assert again(scatterplot()) == []
+    # only the changed plot
+    assert again(scatterplot(label='changed')) == ['c.png']
+    # only the plots using the changed newfield
+    newfields['ratio'] = "DATA['MASS.values.25']/DATA['MASS.values.35']"
+    assert again(scatterplot(label='changed')) == ['a.png']
+    # missing plot files
+    os.remove(tmp_path / 'b.png')
+    assert again(scatterplot(label='changed')) == ['b.png']
+    # changed defaults affect all plots
+    config = scatterplot(label='changed')
+    config['conf']['fontsize'] = 12
+    assert again(config) == ['a.png', 'b.png', 'c.png']
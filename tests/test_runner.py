@@ -0,0 +1,217 @@
+import os
+import stat
+import textwrap
+import pytest
+from ScanLHA.archive import COLUMNS as ARCHIVECOLUMNS, readArchived
+from ScanLHA.runner import BaseRunner, SLHARunner, MicrOmegas
+
+@pytest.fixture
+def staged(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs(tmp_path / 'tmpfs')
+    os.makedirs(tmp_path / 'data')
+    (tmp_path / 'data' / 'table.dat').write_text('1 2 3\n')
+    (tmp_path / 'binary').write_text('#!/bin/sh\n')
+    def runner(**conf):
+        r = BaseRunner(dict({'tmpfs': str(tmp_path / 'tmpfs'), 'staging': 'symlink', 'cleanup': True,
+            'copy': [str(tmp_path / 'data')], 'binaries': [[str(tmp_path / 'binary')]]}, **conf))
+        r.makedirs()
+        return r
+    return runner, tmp_path / 'tmpfs' / 'staged'
+
+def shared(directory):
+    return [ d for d in os.listdir(directory) if os.path.isdir(directory / d) ]
+
+def test_links(staged):
+    runner, directory = staged
+    r = runner()
+    assert os.path.islink(os.path.join(r.rundir, 'data', 'table.dat'))
+    assert os.path.islink(os.path.join(r.rundir, 'binary'))
+    assert r.staged == {'linked': 16, 'copied': 0}
+    r.cleanup()
+
+def test_last_runner_removes_staged(staged):
+    runner, directory = staged
+    first, second = runner(), runner()
+    assert len(shared(directory)) == 1
+    first.cleanup()
+    assert len(shared(directory)) == 1
+    assert os.path.isfile(os.path.join(second.rundir, 'data', 'table.dat'))
+    second.cleanup()
+    assert shared(directory) == []
+    assert not os.path.exists(second.rundir)
+    # staging again works after the removal
+    third = runner()
+    assert os.path.isfile(os.path.join(third.rundir, 'data', 'table.dat'))
+    third.cleanup()
+
+def test_keep_staged(staged):
+    runner, directory = staged
+    runner(keep_staged=True).cleanup()
+    assert len(shared(directory)) == 1
+    runner(cleanup=False).cleanup()
+    assert len(shared(directory)) == 1
+
+class Vectorized(BaseRunner):
+    batch = 100
+
+    def execute_batch(self, params):
+        x = params['x']
+        return {'MASS': {'values': {'25': x**0.5}}, 'flag': 1}
+
+class Scalar(BaseRunner):
+    def execute(self, params):
+        return {'MASS': {'values': {'25': params['x']**0.5}}, 'flag': 1}
+
+class Broken(Vectorized):
+    def execute_batch(self, params):
+        return {'MASS.values.25': params['x'][:-1]}
+
+def test_execute_batch():
+    points = [ {'x': float(x)} for x in range(10) ]
+    vectorized = Vectorized({})
+    assert vectorized.batchsize == 100
+    assert Vectorized({'batch': 7}).batchsize == 7
+    assert Scalar({}).batchsize == 1
+    result = vectorized.runBatch(points)
+    expected = Scalar({}).runBatch(points)
+    assert sorted(result.columns) == sorted(expected.columns) == ['MASS.values.25', 'flag']
+    assert result.equals(expected[result.columns])
+    assert vectorized.run(points[4])['MASS.values.25'][0] == 2
+
+def test_execute_batch_wrong_length(caplog):
+    result = Broken({}).runBatch([ {'x': float(x)} for x in range(3) ])
+    assert len(result) == 3
+    assert list(result.columns) == ['log']
+    assert 'wrong number of results' in caplog.text
+
+FAKEBATCH = """\
+    #!/usr/bin/env python3
+    # concatenated mode: batch.py in out, fails for MSUSY > 900
+    import sys
+    SEP = '\\n#ENDOFSLHA\\n'
+    with open(sys.argv[3], 'a') as calls:
+        calls.write('calls\\n')
+    documents = [ d for d in open(sys.argv[1]).read().split(SEP) if d.strip() ]
+    masses = [ float(d.split()[3]) for d in documents ]
+    if max(masses) > 900:
+        sys.exit(2)
+    open(sys.argv[2], 'w').write(SEP.join('{}\\nBLOCK HB\\n 1 {}\\n'.format(d.strip(), 2*m) for d,m in zip(documents, masses)))
+    """
+
+@pytest.fixture
+def batchrunner(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    binary = tmp_path / 'batch.py'
+    binary.write_text(textwrap.dedent(FAKEBATCH))
+    binary.chmod(binary.stat().st_mode | stat.S_IEXEC)
+    calls = tmp_path / 'calls'
+    runner = SLHARunner({'tmpfs': str(tmp_path / 'tmpfs'), 'template': 'BLOCK MINPAR\n 1 {%MSUSY%}\n', 'batch': 3,
+        'binaries': [[str(binary), '{batch_input}', '{batch_output}', str(calls)]]})
+    return runner, calls
+
+def test_batch_split_merge(batchrunner):
+    runner, calls = batchrunner
+    result = runner.runBatch([ {'MSUSY': 100.*i} for i in range(1, 6) ])
+    assert result['HB.values.1'].tolist() == [ 200.*i for i in range(1, 6) ]
+    assert result['MINPAR.values.1'].tolist() == [ 100.*i for i in range(1, 6) ]
+    # two batches of 3 and 2 points
+    assert len(calls.read_text().split()) == 2
+    assert [ f for f in os.listdir(runner.rundir) if f.endswith(('.in', '.out')) ] == []
+
+def test_batch_failure(batchrunner):
+    runner, calls = batchrunner
+    result = runner.runBatch([{'MSUSY': 100.}, {'MSUSY': 1000.}, {'MSUSY': 300.}])
+    assert result['HB.values.1'].fillna(0).tolist() == [200., 0., 600.]
+    # the failed batch is run point by point
+    assert len(calls.read_text().split()) == 4
+    assert [ f for f in os.listdir(runner.rundir) if '.batch.' in f ] == []
+
+@pytest.fixture
+def micromegas(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    src = tmp_path / 'src'
+    (src / 'include').mkdir(parents=True)
+    (src / 'Model' / 'work').mkdir(parents=True)
+    (src / 'Makefile').write_text('all:\n\techo "#define micrO \\"$(CURDIR)\\"" > include/microPath.h\nclean:\n\trm -f include/microPath.h\n')
+    # the executable writes into the work directory of the model it was linked in
+    (src / 'Model' / 'Makefile').write_text(
+        'all:\n\techo builds >> {}\n'
+        '\tprintf "#!/bin/sh\\necho $(CURDIR) >> $(CURDIR)/work/calls\\necho \\"BLOCK OMEGA\\n 1 0.12\\" > \\$$1\\n" > main\n'
+        '\tchmod +x main\nclean:\n\trm -f main\n'.format(tmp_path / 'builds'))
+    def runner(**omega):
+        return MicrOmegas({'tmpfs': str(tmp_path / 'tmpfs'), 'template': 'BLOCK MINPAR\n 1 {%MSUSY%}\n',
+            'micromegas': dict({'src': str(src), 'modelname': 'Model', 'main': 'main.cpp', 'exec': ['main', '{output_file}'],
+                'cache': str(tmp_path / 'cache'), 'jobs': 1}, **omega)})
+    return runner, tmp_path
+
+def test_micromegas_private_work(micromegas):
+    runner, tmp_path = micromegas
+    first, second = runner(), runner()
+    assert first.initialized and second.initialized
+    for r in [first, second]:
+        assert r.run({'MSUSY': 1.})['OMEGA.values.1'][0] == 0.12
+        assert os.path.isfile(os.path.join(r.modeldir, 'work', 'calls'))
+        assert r.binaries[-1][0].startswith(r.rundir)
+    # built once into the cache, relinked for each runner
+    assert len((tmp_path / 'builds').read_text().split()) == 3
+    cached = [ os.path.join(root, f) for root,_,files in os.walk(tmp_path / 'cache') for f in files if f == 'calls' ]
+    assert cached == []
+
+def test_micromegas_shared_work(micromegas):
+    runner, tmp_path = micromegas
+    r = runner(private_work=False)
+    assert r.run({'MSUSY': 1.})['OMEGA.values.1'][0] == 0.12
+    assert r.worklock[0] == r.binaries[-1][0]
+    assert os.path.isfile(r.worklock[1])
+    assert len((tmp_path / 'builds').read_text().split()) == 1
+
+def test_micromegas_failed_build(micromegas, caplog):
+    runner, tmp_path = micromegas
+    (tmp_path / 'src' / 'Model' / 'Makefile').write_text('all:\n\techo builds >> {}\n\tfalse\nclean:\n\ttrue\n'.format(tmp_path / 'builds'))
+    assert not runner().initialized
+    builds = (tmp_path / 'builds').read_text()
+    assert not runner().initialized
+    # the failure is cached, i.e. the second runner does not build again
+    assert (tmp_path / 'builds').read_text() == builds
+    assert 'failed before' in caplog.text
+
+PIPE = """\
+    #!/usr/bin/env python3
+    # reads SLHA from stdin (or the file argv[1]) and writes it with an additional block to stdout (or argv[2])
+    import sys
+    slha = open(sys.argv[1]).read() if len(sys.argv) > 1 else sys.stdin.read()
+    sys.stderr.write('{}\\n'.format(sys.argv[-1]))
+    msusy = float(slha.split('BLOCK MINPAR')[1].split()[1])
+    block = 'BLOCK HB\\n 1 {}\\n'.format(msusy) if 'BLOCK MASS' in slha else 'BLOCK MASS\\n 25 {}\\n'.format(msusy/10)
+    (open(sys.argv[2], 'w') if len(sys.argv) > 2 else sys.stdout).write(slha + block)
+    """
+
+@pytest.fixture
+def piperunner(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    binary = tmp_path / 'pipe.py'
+    binary.write_text(textwrap.dedent(PIPE))
+    binary.chmod(binary.stat().st_mode | stat.S_IEXEC)
+    def runner(**conf):
+        return SLHARunner(dict({'tmpfs': str(tmp_path / 'tmpfs'), 'template': 'BLOCK MINPAR\n 1 {%MSUSY%}\n', 'pipe': True,
+            'binaries': [[str(binary)], [str(binary), '{input_file}', '{output_file}']]}, **conf))
+    return runner, tmp_path
+
+def test_pipe(piperunner):
+    runner, tmp_path = piperunner
+    r = runner(keep_log=True, archive=str(tmp_path / 'archive'))
+    result = r.run({'MSUSY': 1000.})
+    # the output of the first binary is passed on to the second one
+    assert result['MASS.values.25'][0] == 100.
+    assert result['HB.values.1'][0] == 1000.
+    # the file names of the second binary are replaced by the standard streams
+    assert result['log_stderr'][0].endswith('pipe.py/dev/stdout')
+    assert readArchived(*[ result[c][0] for c in ARCHIVECOLUMNS ]).endswith('BLOCK HB\n 1 1000.0\n')
+    assert [ f for f in os.listdir(r.rundir) if f.endswith(('.in', '.out')) ] == []
+
+def test_pipe_without_binaries(piperunner):
+    runner, tmp_path = piperunner
+    result = runner(binaries=[], keep_log=True, archive=str(tmp_path / 'archive')).run({'MSUSY': 1000.})
+    assert result['input_parameters.MSUSY'][0] == 1000.
+    assert readArchived(*[ result[c][0] for c in ARCHIVECOLUMNS ]).startswith('BLOCK MINPAR')
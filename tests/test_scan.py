@@ -0,0 +1,76 @@
+import os
+import stat
+import textwrap
+import pandas as pd
+from ScanLHA import Config
+from ScanLHA.runner import BaseRunner
+from ScanLHA.scan import AdaptiveScan, FileScan
+from ScanLHA.storage import getStorage
+
+def executable(path, source):
+    path.write_text(textwrap.dedent(source))
+    path.chmod(path.stat().st_mode | stat.S_IEXEC)
+    return str(path)
+
+def config(tmp_path, runner, blocks=[]):
+    c = Config(str(tmp_path / 'scan.yml'))
+    c['runner'].update(dict({'tmpfs': str(tmp_path / 'tmpfs'), 'cleanup': True}, **runner))
+    c['blocks'] = blocks
+    return c
+
+def test_filescan_failed_points(tmp_path):
+    (tmp_path / 'scan.yml').write_text('runner: {}\nblocks: []\n')
+    getStorage(str(tmp_path / 'previous.h5')).save(pd.DataFrame({
+        'MASS.values.25': [124., 126., 125.],
+        'HIGGSBOUNDS.values.1': [1., 1., 1.]
+        }))
+    # reruns HiggsBounds, removing the output of the second point (i.e. it fails)
+    hb = executable(tmp_path / 'hb.py', '''\
+        #!/usr/bin/env python3
+        import os, sys
+        slha = open(sys.argv[1]).read()
+        mass = float(slha.split('BLOCK MASS')[1].split()[1])
+        if mass > 125.5:
+            os.remove(sys.argv[1])
+        else:
+            open(sys.argv[1], 'w').write('BLOCK HIGGSBOUNDS\\n 1 %r\\n 2 %r\\n' % (2*mass, mass))
+        ''')
+    scan = FileScan(config(tmp_path, {'binaries': [[hb, '{output_file}']], 'file': {'results': str(tmp_path / 'previous.h5')}}))
+    scan.submit(1)
+    df = scan.results
+    assert df['MASS.values.25'].tolist() == [124., 126., 125.]
+    assert df['HIGGSBOUNDS.values.1'].tolist() == [248., 1., 250.]
+    assert df['HIGGSBOUNDS.values.2'].fillna(0).tolist() == [124., 0., 125.]
+
+class Parabola(BaseRunner):
+    """ The observable is 10*x**2. """
+    def execute(self, params):
+        return {'MASS': {'values': {'25': 10*params['x']**2}}}
+
+class Threshold(Parabola):
+    """ Fails (i.e. only returns a log) above x = 0.3. """
+    def execute(self, params):
+        return {'log': 'failed'} if params['x'] > 0.3 else super().execute(params)
+
+def adaptive(tmp_path, runner='Threshold', **adaptive):
+    (tmp_path / 'scan.yml').write_text('runner: {}\nblocks: []\n')
+    c = config(tmp_path, {'type': runner, 'scantype': 'adaptive', 'adaptive': adaptive},
+            [{'block': 'MINPAR', 'lines': [{'parameter': 'x', 'id': 1, 'scan': [0, 1, 3]}]}])
+    scan = AdaptiveScan(c)
+    scan.submit(1)
+    return { x : level for (_,(x,)),(level,_) in scan.points.items() }
+
+def test_adaptive_constraints(tmp_path):
+    # only the cell containing the threshold is bisected until the depth is reached
+    points = adaptive(tmp_path, depth=3)
+    assert points == {0.: 0, .5: 0, 1.: 0, .25: 1, .375: 2, .3125: 3}
+    # the point budget stops the refinement
+    assert adaptive(tmp_path, depth=3, maxpoints=4) == {0.: 0, .5: 0, 1.: 0, .25: 1}
+
+def test_adaptive_tolerance(tmp_path):
+    # refined while the observable changes by more than the tolerance within a cell, the depth is not reached
+    points = adaptive(tmp_path, observable='MASS.values.25', tolerance=3, depth=6, runner='Parabola')
+    assert points == {0.: 0, .5: 0, 1.: 0, .75: 1, .625: 2, .875: 2}
+    # within the budget, the cells with the largest variation are refined first
+    points = adaptive(tmp_path, observable='MASS.values.25', depth=6, maxpoints=4, runner='Parabola')
+    assert points == {0.: 0, .5: 0, 1.: 0, .75: 1}
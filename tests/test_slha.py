@@ -0,0 +1,19 @@
+import pytest
+import numpy as np
+from ScanLHA.slha import SLHATemplate, fmtvalue
+
+def test_fmtvalue():
+    assert [ fmtvalue(v) for v in (True, np.bool_(False), 3, np.int64(2), 1.5, 'x') ] == \
+        ['True', 'False', '3', '2', '1.5000000000000000E+00', 'x']
+
+def test_render_batch():
+    tpl = SLHATemplate('Block MINPAR\n 1 {%MSUSY%} # {{x}}\n 3 {%TanBeta%}\n', parameters=['MSUSY', 'TanBeta'])
+    points = [{'MSUSY': 1000., 'TanBeta': 10}, {'MSUSY': np.float64(2e3), 'TanBeta': np.int64(20)}]
+    assert tpl.render_batch(points) == [ tpl.render(p) for p in points ]
+    assert tpl.render(points[1]) == 'Block MINPAR\n 1 2.0000000000000000E+03 # {x}\n 3 20\n'
+
+def test_missing_parameter():
+    with pytest.raises(KeyError):
+        SLHATemplate('{%MSUSY%} {%TanBeta%}', parameters=['MSUSY'])
+    with pytest.raises(KeyError):
+        SLHATemplate('{%MSUSY%}').render_batch([{'MSUSY': 1.}, {}])
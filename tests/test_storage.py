@@ -0,0 +1,92 @@
+import os
+import warnings
+import numpy as np
+import pandas as pd
+import pytest
+from ScanLHA.storage import HDFStorage, getStorage
+
+def wide(rows=5, columns=3000):
+    return pd.DataFrame(np.random.rand(rows, columns), columns=[ 'MASS.values.{}'.format(i) for i in range(columns) ])
+
+def test_save_table(tmp_path):
+    df = wide(columns=10)
+    store = HDFStorage(str(tmp_path / 'table.h5'), data_columns=['MASS.values.1'])
+    store.save(df, config={'a': 1})
+    pd.testing.assert_frame_equal(store.load(), df)
+    assert store.attr('config') == {'a': 1}
+    assert len(store.load(filters=[('MASS.values.1', '>', 2)])) == 0
+
+def test_save_wide(tmp_path):
+    df = wide()
+    store = HDFStorage(str(tmp_path / 'wide.h5'))
+    with warnings.catch_warnings():
+        warnings.simplefilter('error', ResourceWarning)
+        store.save(df, config={'a': 1})
+    pd.testing.assert_frame_equal(store.load(), df)
+    assert store.attr('config') == {'a': 1}
+    assert store.nrows() == 5
+
+def test_save_empty(tmp_path):
+    store = HDFStorage(str(tmp_path / 'empty.h5'))
+    store.save(pd.DataFrame(), config={'a': 1})
+    assert store.load().empty
+    assert store.attr('config') == {'a': 1}
+
+def test_append_wide(tmp_path):
+    df = wide()
+    store = HDFStorage(str(tmp_path / 'wide.h5'), data_columns=['MASS.values.1', 'MASS.values.2999'])
+    store.append(df, config={'a': 1})
+    store.append(df, config={'a': 1})
+    store.close()
+    # streamed into several tables instead of being kept in memory
+    with pd.HDFStore(store.filename, 'r') as h5:
+        assert len(store.keys(h5)) > 1
+        for column in store.data_columns:
+            key = [ k for k in store.keys(h5) if column in h5.get_storer(k).data_columns ][0]
+            assert h5.get_storer(key).table.colindexes[column]
+    both = pd.concat([df, df], ignore_index=True)
+    pd.testing.assert_frame_equal(store.load().reset_index(drop=True), both)
+    assert store.columns() == list(df.columns)
+    assert store.attr('config') == {'a': 1}
+    selected = store.load(columns=['MASS.values.2999', 'MASS.values.0'], filters=[('MASS.values.2999', '>', 0.5)])
+    expected = both.loc[both['MASS.values.2999'] > 0.5, ['MASS.values.2999', 'MASS.values.0']]
+    assert selected.values.tolist() == expected.values.tolist()
+    assert store.take([1, 7], columns=['MASS.values.5']).values.tolist() == both.loc[[1, 7], ['MASS.values.5']].values.tolist()
+    store.remove()
+    with pd.HDFStore(store.filename, 'r') as h5:
+        assert h5.keys() == []
+
+def test_append_long_strings(tmp_path):
+    store = HDFStorage(str(tmp_path / 'log.h5'))
+    first = pd.DataFrame({'x': [1.0, 2.0], 'log': ['short', 'log']})
+    second = pd.DataFrame({'x': [3.0], 'log': ['x'*1000]})
+    store.append(first)
+    store.append(second)
+    store.close()
+    with pd.HDFStore(store.filename, 'r') as h5:
+        assert h5.get_storer('results').is_table
+    df = store.load()
+    assert df['log'].tolist() == ['short', 'log', 'x'*1000]
+    assert df['x'].tolist() == [1.0, 2.0, 3.0]
+
+def test_parquet_mixed_types(tmp_path):
+    pytest.importorskip('pyarrow')
+    store = getStorage(str(tmp_path / 'dataset') + os.sep)
+    # an integer valued part and a real valued part of the same column
+    store.save(pd.DataFrame({'SPINFO.values.4': [1, 2], 'log': ['a', 'b']}))
+    store.save(pd.DataFrame({'SPINFO.values.4': [1.5, 2.5], 'MASS.values.25': [125., 126.]}))
+    assert store.dtypes()['SPINFO.values.4'] == np.float64
+    df = store.load()
+    assert sorted(df['SPINFO.values.4'].tolist()) == [1.0, 1.5, 2.0, 2.5]
+    assert len(store.load(stop=3)) == 3
+    assert store.take([0, 3], columns=['SPINFO.values.4']).shape == (2, 1)
+    chunks = pd.concat([ store.load(start=start, stop=stop) for start,stop in store.chunks(1) ], ignore_index=True)
+    assert sorted(chunks['SPINFO.values.4'].tolist()) == [1.0, 1.5, 2.0, 2.5]
+    assert chunks.columns.tolist() == store.columns()
+
+def test_append_empty(tmp_path):
+    store = HDFStorage(str(tmp_path / 'empty.h5'))
+    store.append(pd.DataFrame({'x': []}), config={'a': 1})
+    store.close()
+    assert store.load().columns.tolist() == ['x']
+    assert store.attr('config') == {'a': 1}